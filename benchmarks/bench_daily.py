@@ -0,0 +1,251 @@
+# benchmarks/bench_daily.py: 離線量測解析與儲存效能（不連線 TWSE / TPEX）
+#
+# 以 fixtures/ 中的 STOCK_DAY、tradingStock 回應格式合成大量回應，
+# 透過假的 Response 物件直接呼叫 DailySpider 的 callback 與 DailyCsvPipeline，
+# 回報每秒處理筆數、最高記憶體用量與寫入檔案數。
+#
+# 用法（於專案根目錄）：
+#   python benchmarks/bench_daily.py                       # 1,800 支 × 1 個月
+#   python benchmarks/bench_daily.py --scenario history    # 1,800 支 × 120 個月
+#   python benchmarks/bench_daily.py --save-baseline benchmarks/baseline.json
+#   python benchmarks/bench_daily.py --compare benchmarks/baseline.json
+#   python benchmarks/bench_daily.py --keep                # 保留暫存工作目錄
+import argparse
+import copy
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from scrapy.http import TextResponse  # noqa: E402
+
+from twstock.logger import flush_logs  # noqa: E402
+from twstock.pipelines import DailyCsvPipeline  # noqa: E402
+from twstock.spiders.daily import DailySpider  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+SCENARIOS = {
+    'month': {'stocks': 1800, 'months': 1},
+    'history': {'stocks': 1800, 'months': 120},
+}
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_universe(count):
+    """取前 count 支股票；清單不足時以流水號補足，上市 / 上櫃比例沿用清單"""
+    spider = DailySpider()
+    stocks = spider.load_stocks()
+    while len(stocks) < count:
+        base = stocks[len(stocks) % len(stocks)]
+        stocks.append(dict(base, 代碼=f"9{len(stocks):04d}", 名稱=f"合成{len(stocks)}"))
+    return stocks[:count]
+
+
+def iter_months(count, end=date(2024, 6, 1)):
+    """由 end 往前 count 個月，回傳 (year, month)，由舊到新"""
+    months = []
+    year, month = end.year, end.month
+    for _ in range(count):
+        months.append((year, month))
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return list(reversed(months))
+
+
+def trading_days(year, month):
+    day = date(year, month, 1)
+    while day.month == month:
+        if day.weekday() < 5:
+            yield day
+        day += timedelta(days=1)
+
+
+def synth_rows(rng, year, month, otc):
+    """以隨機漫步合成一個月的日成交資料列（與交易所回傳格式相同，含千分位）"""
+    price = rng.uniform(10, 900)
+    rows = []
+    for day in trading_days(year, month):
+        open_ = price * rng.uniform(0.98, 1.02)
+        close = open_ * rng.uniform(0.95, 1.05)
+        high = max(open_, close) * rng.uniform(1.0, 1.02)
+        low = min(open_, close) * rng.uniform(0.98, 1.0)
+        change = close - price
+        shares = rng.randint(1_000, 50_000_000)
+        if otc:
+            shares //= 1000
+        amount = int(shares * (high + low) / 2)
+        sign = '+' if change > 0 else ('-' if change < 0 else ' ')
+        change_text = f"{abs(change):.2f}" if otc and change > 0 else f"{sign}{abs(change):.2f}"
+        rows.append([
+            f"{day.year - 1911}/{day.month:02d}/{day.day:02d}",
+            f"{shares:,}", f"{amount:,}",
+            f"{open_:,.2f}", f"{high:,.2f}", f"{low:,.2f}", f"{close:,.2f}",
+            change_text, f"{rng.randint(1, 60_000):,}",
+        ])
+        price = close
+    return rows
+
+
+def make_response(spider, stock, year, month, rows, templates):
+    """以 spider 的請求建構函式產生 Request，再包成 TextResponse"""
+    query_date = f"{year}{month:02d}01"
+    if stock['市場'] == '上市':
+        request = spider.listed_request(stock, query_date)
+        payload = copy.copy(templates['listed'])
+        payload['data'] = rows
+    else:
+        request = spider.otc_request(stock, query_date)
+        payload = copy.deepcopy(templates['otc'])
+        payload['tables'][0]['data'] = rows
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    request.meta['download_latency'] = 0.0
+    response = TextResponse(url=request.url, body=body, encoding='utf-8', request=request)
+    return response, len(body)
+
+
+def run(stocks_count, months_count, seed=20240603, keep=False):
+    """keep 為 False 時量測完刪除暫存工作目錄"""
+    rng = random.Random(seed)
+    templates = {
+        'listed': load_fixture('stock_day.json'),
+        'otc': load_fixture('trading_stock.json'),
+    }
+    workdir = tempfile.mkdtemp(prefix='twstock-bench-')
+    old_cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        spider = DailySpider()
+        stocks = load_universe(stocks_count)
+        pipeline = DailyCsvPipeline()
+        pipeline.open_spider(spider)
+
+        responses = items = payload_bytes = 0
+        parse_time = pipeline_time = 0.0
+        for stock in stocks:
+            for year, month in iter_months(months_count):
+                rows = synth_rows(rng, year, month, otc=stock['市場'] == '上櫃')
+                response, size = make_response(spider, stock, year, month, rows, templates)
+                callback = spider.parse_listed if stock['市場'] == '上市' else spider.parse_otc
+
+                start = time.perf_counter()
+                produced = list(callback(response))
+                parse_time += time.perf_counter() - start
+
+                start = time.perf_counter()
+                for item in produced:
+                    pipeline.process_item(item, spider)
+                pipeline_time += time.perf_counter() - start
+
+                responses += 1
+                items += len(produced)
+                payload_bytes += size
+
+        start = time.perf_counter()
+        pipeline.close_spider(spider)
+        pipeline_time += time.perf_counter() - start
+
+        # 民國日期轉換單獨量測
+        dates = [f"{y - 1911}/{m:02d}/{d:02d}" for y in range(2014, 2025) for m in range(1, 13) for d in range(1, 29)]
+        start = time.perf_counter()
+        for _ in range(20):
+            for d in dates:
+                spider.convert_roc_to_western_date(d)
+        roc_time = time.perf_counter() - start
+
+        files = sum(len(names) for _, _, names in os.walk(pipeline.root_folder))
+    finally:
+        # 緩衝中的日誌以相對路徑寫在工作目錄下，須在切回原目錄前寫出
+        flush_logs()
+        os.chdir(old_cwd)
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'stocks': stocks_count,
+        'months': months_count,
+        'responses': responses,
+        'items': items,
+        'payload_mb': round(payload_bytes / 1e6, 2),
+        'parse_items_per_sec': round(items / parse_time, 1) if parse_time else None,
+        'pipeline_items_per_sec': round(items / pipeline_time, 1) if pipeline_time else None,
+        'roc_dates_per_sec': round(len(dates) * 20 / roc_time, 1),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'files_touched': files,
+        'workdir': workdir if keep else None,
+    }
+
+
+# 與基準比較時，數值越大越好的指標
+HIGHER_IS_BETTER = {'parse_items_per_sec', 'pipeline_items_per_sec', 'roc_dates_per_sec'}
+LOWER_IS_BETTER = {'peak_rss_mb', 'files_touched'}
+
+
+def compare(result, baseline):
+    print(f"\n{'指標':<26}{'基準':>16}{'本次':>16}{'變化':>10}")
+    for key in sorted(HIGHER_IS_BETTER | LOWER_IS_BETTER):
+        old, new = baseline.get(key), result.get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        better = change >= 0 if key in HIGHER_IS_BETTER else change <= 0
+        mark = '✅' if better else '⚠️'
+        print(f"{key:<26}{old:>16}{new:>16}{change:>+9.1f}% {mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DailySpider / DailyCsvPipeline 離線效能量測')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='month')
+    parser.add_argument('--stocks', type=int, help='覆寫情境的股票數')
+    parser.add_argument('--months', type=int, help='覆寫情境的月份數')
+    parser.add_argument('--save-baseline', metavar='PATH', help='將結果存為基準')
+    parser.add_argument('--compare', metavar='PATH', help='與既有基準比較')
+    parser.add_argument('--keep', action='store_true', help='保留暫存工作目錄（輸出的月檔與日誌）')
+    args = parser.parse_args()
+
+    scenario = dict(SCENARIOS[args.scenario])
+    if args.stocks:
+        scenario['stocks'] = args.stocks
+    if args.months:
+        scenario['months'] = args.months
+
+    print(f"🚀 {args.scenario}: {scenario['stocks']} 支 × {scenario['months']} 個月")
+    result = run(scenario['stocks'], scenario['months'], keep=args.keep)
+    result['scenario'] = args.scenario
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baselines = json.load(f)
+        baseline = baselines.get(args.scenario)
+        if baseline:
+            compare(result, baseline)
+        else:
+            print(f"⚠️ {args.compare} 中沒有 {args.scenario} 的基準")
+
+    if args.save_baseline:
+        baselines = {}
+        if os.path.exists(args.save_baseline):
+            with open(args.save_baseline, encoding='utf-8') as f:
+                baselines = json.load(f)
+        baselines[args.scenario] = {k: v for k, v in result.items() if k != 'workdir'}
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, ensure_ascii=False, indent=2)
+        print(f"💾 已儲存基準: {args.save_baseline}")
+
+
+if __name__ == '__main__':
+    main()
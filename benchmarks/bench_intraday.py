@@ -0,0 +1,165 @@
+# benchmarks/bench_intraday.py: 以本機模擬的 getStockInfo 伺服器量測 IntradaySpider 的輪詢延遲（不連線 TWSE）
+#
+# 模擬伺服器回放 fixtures/mis_stock_info.json 中錄下的回應：每次輪詢（請求的 _ 參數不同）換下一份，
+# 最後一份持續回放；只回傳請求的 ex_ch 中有的股票，queryTime 每次不同（與實際伺服器相同）。
+# 錄下的第 3 份與第 2 份內容相同，可驗證未變動的回應會被略過。
+#
+# 用法（於專案根目錄）：
+#   python benchmarks/bench_intraday.py                              # 每 2 秒輪詢，共 6 次
+#   python benchmarks/bench_intraday.py --polls 20 --interval 1 --latency 0.2
+#   python benchmarks/bench_intraday.py --serve --port 8765          # 只啟動模擬伺服器
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+STUB_PATH = '/stock/api/getStockInfo.jsp'
+
+
+def load_frames():
+    with open(os.path.join(FIXTURES, 'mis_stock_info.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+class StubServer(ThreadingHTTPServer):
+    """回放錄下的 getStockInfo 回應；latency 為每個回應前的等待秒數"""
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0):
+        super().__init__(('127.0.0.1', port), StubHandler)
+        self.frames = load_frames()
+        self.latency = latency
+        self.polls = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}{STUB_PATH}"
+
+    def frame(self, poll_key):
+        with self.lock:
+            self.requests += 1
+            index = self.polls.setdefault(poll_key, len(self.polls))
+        return self.frames[min(index, len(self.frames) - 1)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path != STUB_PATH:
+            self.send_error(404)
+            return
+        params = parse_qs(parsed.query)
+        channels = (params.get('ex_ch') or [''])[0].split('|')
+        codes = {c.split('_', 1)[-1].rsplit('.', 1)[0] for c in channels if c}
+        frame = self.server.frame((params.get('_') or [''])[0])
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        payload = dict(frame, msgArray=[m for m in frame['msgArray'] if m['c'] in codes])
+        payload['queryTime'] = dict(frame['queryTime'], sysTime=datetime.now().strftime('%H:%M:%S'))
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else None
+
+
+def run(polls, interval, latency, batch_size):
+    server = StubServer(latency=latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    codes = sorted({m['c'] for frame in server.frames for m in frame['msgArray']})
+    workdir = tempfile.mkdtemp(prefix='twstock-intraday-')
+    env = dict(os.environ, SCRAPY_SETTINGS_MODULE='twstock.settings',
+               PYTHONPATH=os.pathsep.join(filter(None, [PROJECT_ROOT, os.environ.get('PYTHONPATH')])))
+    command = [
+        sys.executable, '-m', 'scrapy', 'crawl', 'intraday',
+        '-a', 'ignore_session=1', '-a', f'polls={polls}', '-a', f"codes={','.join(codes)}",
+        '-s', f'INTRADAY_URL={server.url}', '-s', f'INTRADAY_INTERVAL={interval}',
+        '-s', f'INTRADAY_BATCH_SIZE={batch_size}', '-s', 'DOWNLOAD_DELAY=0', '-s', 'LOG_LEVEL=INFO',
+    ]
+    started = time.perf_counter()
+    try:
+        completed = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+    finally:
+        server.shutdown()
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        print(completed.stderr[-3000:])
+        raise SystemExit(completed.returncode)
+
+    root = os.path.join(workdir, '個股日成交資訊')
+    events = []
+    logs = os.path.join(root, 'logs')
+    for name in sorted(os.listdir(logs)):
+        if name.endswith('.events.jsonl'):
+            with open(os.path.join(logs, name), encoding='utf-8') as f:
+                events += [e for e in map(json.loads, f) if e.get('event') == 'poll']
+    tick_rows = 0
+    intraday = os.path.join(root, 'intraday')
+    for name in os.listdir(intraday) if os.path.isdir(intraday) else []:
+        with open(os.path.join(intraday, name), encoding='utf-8-sig') as f:
+            tick_rows += sum(1 for _ in f) - 1
+    e2e = [e['e2e_ms'] for e in events]
+    return {
+        'polls': len(events),
+        'requests': server.requests,
+        'rows_written': tick_rows,
+        'batches_changed': sum(e['changed'] for e in events),
+        'batches_unchanged': sum(e['unchanged'] for e in events),
+        'batches_failed': sum(e['failed'] for e in events),
+        'e2e_p50_ms': percentile(e2e, 0.5),
+        'e2e_p95_ms': percentile(e2e, 0.95),
+        'e2e_max_ms': max(e2e) if e2e else None,
+        'fetch_max_ms': max((e['fetch_ms'] for e in events), default=None),
+        'write_max_ms': max((e['write_ms'] for e in events), default=None),
+        'wall_seconds': round(wall, 2),
+        'workdir': workdir,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='IntradaySpider 本機模擬伺服器與延遲量測')
+    parser.add_argument('--polls', type=int, default=6, help='輪詢次數')
+    parser.add_argument('--interval', type=float, default=2.0, help='輪詢間隔（秒）')
+    parser.add_argument('--latency', type=float, default=0.0, help='模擬伺服器每個回應的延遲（秒）')
+    parser.add_argument('--batch-size', type=int, default=2, help='每個請求的股票數')
+    parser.add_argument('--serve', action='store_true', help='只啟動模擬伺服器')
+    parser.add_argument('--port', type=int, default=8765, help='--serve 時的埠號')
+    args = parser.parse_args()
+
+    if args.serve:
+        server = StubServer(port=args.port, latency=args.latency)
+        print(f"🧪 模擬伺服器: {server.url}")
+        print(f"   scrapy crawl intraday -a ignore_session=1 -s INTRADAY_URL={server.url} -s DOWNLOAD_DELAY=0")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    print(f"🚀 {args.polls} 次輪詢，每 {args.interval:g} 秒，每批 {args.batch_size} 支")
+    print(json.dumps(run(args.polls, args.interval, args.latency, args.batch_size), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
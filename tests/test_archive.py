@@ -0,0 +1,51 @@
+import os
+
+from twstock import archive
+from twstock.archive import ArchiveManifest, archive_path, write_archive
+from twstock.storage import ARCHIVE_FOLDER
+
+
+def archived_rows(code, dates):
+    return [[code, '測試', str(d), '1000', '50000', '1', '50.00', '50.00', '50.00', '50.00', '+0.00']
+            for d in dates]
+
+
+def make_manifest(root, stocks):
+    """stocks: {代碼: [日期]}，寫入歸檔並回傳 ArchiveManifest"""
+    os.makedirs(os.path.join(root, ARCHIVE_FOLDER))
+    manifest = ArchiveManifest(root)
+    for code, dates in stocks.items():
+        write_archive(archive_path(root, code), archived_rows(code, dates))
+        months = {}
+        for d in dates:
+            month = months.setdefault(str(d)[:6], [0, '上市', 1])
+            month[0] |= 1 << (d % 100 - 1)
+        manifest.stocks[code] = {'name': '測試', 'market': '上市', 'months': months}
+    return manifest
+
+
+def test_month_rows_groups_by_month(tmp_path):
+    manifest = make_manifest(str(tmp_path), {'2330': [20240130, 20240131, 20240201, 20240202, 20240301]})
+    assert [r[2] for r in manifest.month_rows('2330', '202401')] == ['20240130', '20240131']
+    assert [r[2] for r in manifest.month_rows('2330', '202402')] == ['20240201', '20240202']
+    assert manifest.month_rows('2330', '202404') == []
+
+
+def test_month_rows_decompresses_once_per_stock(tmp_path, monkeypatch):
+    manifest = make_manifest(str(tmp_path), {code: [20240131, 20240201] for code in ('1101', '2330', '2454')})
+    reads = []
+    read_archive = archive.read_archive
+    monkeypatch.setattr(archive, 'read_archive', lambda path: reads.append(path) or read_archive(path))
+    manifest.ROW_CACHE_SIZE = 2
+
+    for code in ('2330', '2330', '1101'):
+        manifest.month_rows(code, '202401')
+        manifest.month_rows(code, '202402')
+    assert len(reads) == 2
+
+    # 超過快取上限時淘汰最久未使用的股票
+    manifest.month_rows('2454', '202401')
+    manifest.month_rows('1101', '202402')
+    assert len(reads) == 3
+    manifest.month_rows('2330', '202401')
+    assert len(reads) == 4
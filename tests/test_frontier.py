@@ -0,0 +1,113 @@
+import pytest
+
+from twstock import frontier
+from twstock.frontier import Frontier, task_id
+
+TASKS = [('上市', '2330', '台積電', '202405'), ('上市', '2330', '台積電', '202406'), ('上櫃', '8069', '元太', '202406')]
+
+
+class Clock:
+    """取代 time.time，測試租約逾時"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(frontier.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'frontier.sqlite3')
+
+
+def open_frontier(path, worker='w1', **kwargs):
+    return Frontier(path, visibility_timeout=60, max_attempts=2, worker=worker, **kwargs)
+
+
+def test_add_is_idempotent(path, clock):
+    queue = open_frontier(path)
+    assert queue.add(TASKS, '20240701') == 3
+    assert queue.add(TASKS, '20240701') == 0
+    assert queue.counts()['pending'] == 3
+
+
+def test_lease_in_insertion_order_and_not_twice(path, clock):
+    queue = open_frontier(path)
+    queue.add(TASKS, '20240701')
+    leased = queue.lease(2)
+    assert [t['task_id'] for t in leased] == [task_id(*t[:2], t[3]) for t in TASKS[:2]]
+    assert leased[0] == {'task_id': '上市:2330:202405', 'market': '上市', 'code': '2330', 'name': '台積電',
+                         'year_month': '202405', 'attempts': 1}
+    other = open_frontier(path, worker='w2')
+    assert [t['code'] for t in other.lease(10)] == ['8069']
+    assert other.lease(10) == []
+
+
+def test_ack_marks_done(path, clock):
+    queue = open_frontier(path)
+    queue.add(TASKS[:1], '20240701')
+    task = queue.lease(1)[0]
+    queue.ack(task['task_id'])
+    counts = queue.counts()
+    assert counts.get('done') == 1 and counts.get('leased') is None
+    clock.now += 3600
+    assert queue.lease(1) == []
+
+
+def test_nack_requeues_then_dead_after_max_attempts(path, clock):
+    queue = open_frontier(path)
+    queue.add(TASKS[:1], '20240701')
+    task = queue.lease(1)[0]
+    queue.nack(task['task_id'], 'timeout')
+    assert queue.counts()['pending'] == 1
+
+    task = queue.lease(1)[0]
+    assert task['attempts'] == 2
+    queue.nack(task['task_id'], 'timeout')
+    assert queue.counts() == {'dead': 1, 'expired': 0}
+    assert queue.lease(1) == []
+
+
+def test_expired_lease_is_taken_by_another_worker(path, clock):
+    first = open_frontier(path, worker='w1')
+    first.add(TASKS[:1], '20240701')
+    task = first.lease(1)[0]
+
+    second = open_frontier(path, worker='w2')
+    assert second.lease(1) == []
+    clock.now += 61
+    assert first.counts()['expired'] == 1
+    retaken = second.lease(1)
+    assert [t['task_id'] for t in retaken] == [task['task_id']]
+
+    # 原本的 worker 已失去租約，確認或失敗都不會覆寫
+    first.ack(task['task_id'])
+    first.nack(task['task_id'], 'late')
+    assert second.counts().get('leased') == 1
+    second.ack(task['task_id'])
+    assert second.counts().get('done') == 1
+
+
+def test_reseed_requeues_finished_tasks_from_earlier_days(path, clock):
+    queue = open_frontier(path)
+    queue.add(TASKS[:2], '20240701')
+    done, dead = queue.lease(2)
+    queue.ack(done['task_id'])
+    queue.nack(dead['task_id'])
+    queue.lease(1)
+    queue.nack(dead['task_id'])
+    assert queue.counts() == {'done': 1, 'dead': 1, 'expired': 0}
+
+    # 同一天重新規劃不會重做
+    assert queue.add(TASKS[:2], '20240701') == 0
+    # 隔天重新排入，嘗試次數歸零
+    assert queue.add(TASKS[:2], '20240702') == 2
+    assert [t['attempts'] for t in queue.lease(2)] == [1, 1]
@@ -0,0 +1,142 @@
+import csv
+import json
+import os
+
+import pytest
+
+from twstock.commands.migrate_csv import CsvMigrator
+from twstock.parsing import roc_to_western
+from twstock.pipelines import csv_record, csv_row
+from twstock.storage import CSV_FIELDS, DateIndex, stock_folder
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'fixtures')
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def legacy_listed_rows():
+    """較早版本的 DailySpider + DailyCsvPipeline 寫入的上市資料列：股數、金額去掉千分位，其餘為交易所原始字串"""
+    data = load_fixture('stock_day.json')
+    return [
+        ['2330', '台積電', str(roc_to_western(r[0])), r[1].replace(',', ''), r[2].replace(',', ''), *r[3:9]]
+        for r in data['data']
+    ]
+
+
+def legacy_otc_rows():
+    """較早版本的上櫃資料列：仟股、仟元換算為股、元，漲跌沒有 '+'"""
+    data = load_fixture('trading_stock.json')
+    return [
+        ['8069', '元太', str(roc_to_western(r[0])),
+         str(int(r[1].replace(',', '')) * 1000), str(int(r[2].replace(',', '')) * 1000), *r[3:9]]
+        for r in data['tables'][0]['data']
+    ]
+
+
+# 無成交、除權息、平盤與無法解析的欄位
+EDGE_ROWS = [
+    ['8069', '元太', '20240606', '0', '0', '----', '----', '----', '----', ' 0.00', '0'],
+    ['8069', '元太', '20240607', '1000', '240000', '240.00', '240.00', '240.00', '240.00', 'X0.00', '1'],
+    ['8069', '元太', '20240610', '1000', '238500', '238.50', '238.50', '238.50', '238.50', 'X-1.50', '1'],
+    ['8069', '元太', '20240611', '1000', '238500', '238.505', '除權息', '', '238.50', '+0.00', '1,234'],
+]
+
+
+def write_month(root, code, name, market, rows):
+    folder = stock_folder(root, code, name, market)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, '202406.csv')
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDS)
+        writer.writerows(rows)
+    return path
+
+
+def read_month(path):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+        return list(reader)
+
+
+@pytest.fixture
+def legacy_root(tmp_path):
+    root = str(tmp_path / '個股日成交資訊')
+    listed = write_month(root, '2330', '台積電', '上市', legacy_listed_rows())
+    otc = write_month(root, '8069', '元太', '上櫃', legacy_otc_rows() + EDGE_ROWS)
+    return root, {listed: legacy_listed_rows(), otc: legacy_otc_rows() + EDGE_ROWS}
+
+
+def test_migration_preserves_values(legacy_root):
+    root, originals = legacy_root
+    stats = CsvMigrator(root, logger=lambda *args: None).run()
+    assert stats['changed_files'] == 2
+    assert stats['kept_rows'] == 0
+    for path, old_rows in originals.items():
+        new_rows = read_month(path)
+        assert len(new_rows) == len(old_rows)
+        for old, new in zip(old_rows, new_rows):
+            assert csv_record(old) == csv_record(new)
+
+
+def test_migration_writes_current_format(legacy_root):
+    root, originals = legacy_root
+    CsvMigrator(root, logger=lambda *args: None).run()
+    for path, old_rows in originals.items():
+        for old, new in zip(old_rows, read_month(path)):
+            if old in EDGE_ROWS:
+                continue
+            # 由交易所字串解析後以目前的格式寫出，與 DailyCsvPipeline 寫入的資料列相同
+            assert new == csv_row(csv_record(old))
+
+
+def test_migration_edge_rows(legacy_root):
+    root, originals = legacy_root
+    CsvMigrator(root, logger=lambda *args: None).run()
+    otc_path = [p for p in originals if '8069' in p][0]
+    rows = {r[2]: r for r in read_month(otc_path)}
+    assert rows['20240606'][5:] == ['--', '--', '--', '--', '0.00', '0']
+    assert rows['20240607'][9] == 'X0.00'
+    assert rows['20240610'][9] == 'X-1.50'
+    # 無法精確表示或無法解析的欄位保留原字串
+    assert rows['20240611'][5:] == ['238.505', '除權息', '', '238.50', '0.00', '1234']
+
+
+def test_migration_is_idempotent(legacy_root):
+    root, originals = legacy_root
+    CsvMigrator(root, logger=lambda *args: None).run()
+    contents = {path: open(path, 'rb').read() for path in originals}
+    stats = CsvMigrator(root, logger=lambda *args: None).run()
+    assert stats['changed_files'] == 0
+    assert stats['changed_rows'] == 0
+    for path, data in contents.items():
+        assert open(path, 'rb').read() == data
+
+
+def test_migration_updates_date_index_size(legacy_root):
+    root, originals = legacy_root
+    for path in originals:
+        index = DateIndex(os.path.dirname(path))
+        index.check_month('202406', path)
+        index.mark_closed('202406')
+        index.save()
+    CsvMigrator(root, logger=lambda *args: None).run()
+    for path in originals:
+        index = DateIndex(os.path.dirname(path))
+        index.load()
+        assert index.months['202406'][1] == os.path.getsize(path)
+        # 日期與完成標記不變，不需從 CSV 重建
+        assert index.is_closed('202406')
+
+
+def test_dry_run_does_not_write(legacy_root):
+    root, originals = legacy_root
+    contents = {path: open(path, 'rb').read() for path in originals}
+    stats = CsvMigrator(root, dry_run=True, logger=lambda *args: None).run()
+    assert stats['changed_files'] == 2
+    for path, data in contents.items():
+        assert open(path, 'rb').read() == data
@@ -0,0 +1,76 @@
+import pytest
+
+from twstock.parsing import PRICE_SCALE, format_change, format_price, parse_change, parse_csv_row, parse_price
+from twstock.storage import CSV_FIELDS
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('1,050.00', 105000),
+    ('1050', 105000),
+    ('0.5', 50),
+    ('-3.50', -350),
+    ('+8.00', 800),
+    (' 0.00', 0),
+    # 超過兩位小數四捨五入（盤中報價為四位小數）
+    ('1050.0000', 105000),
+    ('10.505', 1051),
+    ('10.504', 1050),
+    ('-10.505', -1051),
+    ('0.995', 100),
+    ('0.005', 1),
+])
+def test_parse_price(text, expected):
+    assert parse_price(text) == expected
+
+
+@pytest.mark.parametrize('text', ['--', '----', '', None, 'X', '1.2.3', '除權息', '1,0a'])
+def test_parse_price_invalid(text):
+    assert parse_price(text) is None
+
+
+@pytest.mark.parametrize('value', [0, 1, 99, 100, 105000, -1, -350, 123456789])
+def test_format_price_round_trip(value):
+    assert parse_price(format_price(value)) == value
+
+
+def test_format_price_none():
+    assert format_price(None) == '--'
+    assert PRICE_SCALE == 100
+
+
+@pytest.mark.parametrize('text', ['+1.50', '-1.50', '0.00', 'X1.50', 'X-1.50', 'X0.00', '--'])
+def test_change_round_trip(text):
+    assert format_change(*parse_change(text)) == text
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('2.00', '+2.00'),          # 上櫃漲跌沒有 '+'
+    (' 0.00', '0.00'),
+    ('+0.00', '0.00'),
+    ('X0.00', 'X0.00'),
+])
+def test_change_normalized(text, expected):
+    assert format_change(*parse_change(text)) == expected
+
+
+def test_ex_rights_keeps_sign():
+    assert parse_change('X-1.50') == (-150, True)
+    assert format_change(-150, True) == 'X-1.50'
+    assert format_change(150, True) == 'X1.50'
+
+
+def test_parse_csv_row_legacy_and_current_formats():
+    current = ['8069', '元太', '20240603', '1234000', '296135000', '240.00', '241.50', '238.00', '240.50', '+1.50', '1,234']
+    legacy = ['8069', '元太', '20240603', '1,234,000', '296,135,000', '240.00', '241.50', '238.00', '240.50', '1.50', '1234']
+    assert parse_csv_row(current) == parse_csv_row(legacy) == (
+        20240603, 24000, 24150, 23800, 24050, 150, False, 1234000, 296135000, 1234)
+
+
+def test_parse_csv_row_no_trade_and_ex_rights():
+    row = ['2330', '台積電', '20240613', '0', '0', '--', '----', '--', '--', 'X-1.50', '0']
+    assert parse_csv_row(row) == (20240613, None, None, None, None, -150, True, 0, 0, 0)
+
+
+@pytest.mark.parametrize('row', [CSV_FIELDS, ['2330', '台積電', '20240603'], []])
+def test_parse_csv_row_not_a_data_row(row):
+    assert parse_csv_row(row) is None
@@ -0,0 +1,167 @@
+import csv
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from twstock.storage import CSV_FIELDS, DateIndex, is_month_complete, month_csv_path, parse_shard, shard_of
+
+ROWS = [
+    ['2330', '台積電', '20240603', '1000', '800000', '800.00', '800.00', '800.00', '800.00', '+5.00', '1'],
+    ['2330', '台積電', '20240604', '1000', '805000', '805.00', '805.00', '805.00', '805.00', '+5.00', '1'],
+]
+
+
+def write_month(root, year_month, rows):
+    path = month_csv_path(root, '2330', '台積電', '上市', year_month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDS)
+        writer.writerows(rows)
+    return path
+
+
+def load_index(folder):
+    index = DateIndex(folder)
+    index.load()
+    return index
+
+
+def test_date_index_rebuilds_from_csv(tmp_path):
+    path = write_month(str(tmp_path), '202406', ROWS)
+    index = DateIndex(os.path.dirname(path))
+    index.check_month('202406', path)
+    assert index.contains('20240603') and index.contains('20240604')
+    assert not index.contains('20240605')
+    assert index.months['202406'][1] == os.path.getsize(path)
+    assert not index.is_closed('202406')
+
+
+def test_date_index_marker_survives_save_and_load(tmp_path):
+    path = write_month(str(tmp_path), '202406', ROWS)
+    folder = os.path.dirname(path)
+    index = DateIndex(folder)
+    index.check_month('202406', path)
+    index.mark_closed('202406')
+    index.save()
+
+    index = load_index(folder)
+    index.check_month('202406', path)
+    assert index.is_closed('202406')
+
+
+def test_date_index_marker_cleared_when_month_file_removed(tmp_path):
+    path = write_month(str(tmp_path), '202406', ROWS)
+    folder = os.path.dirname(path)
+    index = DateIndex(folder)
+    index.check_month('202406', path)
+    index.mark_closed('202406')
+    index.save()
+    os.remove(path)
+
+    index = load_index(folder)
+    index.check_month('202406', path)
+    assert not index.is_closed('202406')
+    assert not index.contains('20240603')
+
+
+def test_date_index_loads_legacy_entries_without_marker(tmp_path):
+    path = write_month(str(tmp_path), '202406', ROWS)
+    folder = os.path.dirname(path)
+    with open(os.path.join(folder, DateIndex.FILENAME), 'w', encoding='utf-8') as f:
+        json.dump({'202406': [0b1100, os.path.getsize(path)]}, f)
+
+    index = load_index(folder)
+    assert index.months['202406'] == [0b1100, os.path.getsize(path), 0]
+    index.check_month('202406', path)
+    assert not index.dirty
+    assert not index.is_closed('202406')
+
+
+def test_date_index_corrupt_file_is_rebuilt(tmp_path):
+    path = write_month(str(tmp_path), '202406', ROWS)
+    folder = os.path.dirname(path)
+    with open(os.path.join(folder, DateIndex.FILENAME), 'w', encoding='utf-8') as f:
+        f.write('{"202406": [1')
+
+    index = load_index(folder)
+    assert index.months == {} and index.dirty
+    index.check_month('202406', path)
+    assert index.contains('20240604')
+
+
+def test_date_index_archived_dates(tmp_path):
+    index = DateIndex(str(tmp_path), archived={'202401': 1 << 1})
+    index.load()
+    assert index.contains('20240102')
+    assert not index.contains('20240103')
+
+
+def test_is_month_complete_requires_marker(tmp_path):
+    root = str(tmp_path)
+    path = write_month(root, '202406', ROWS)
+    # 只有最後一個交易日不算完整（停牌、下市的股票本來就沒有）
+    assert not is_month_complete(root, '2330', '台積電', '上市', '202406', this_month='202407')
+
+    index = DateIndex(os.path.dirname(path))
+    index.check_month('202406', path)
+    index.mark_closed('202406')
+    index.save()
+    assert is_month_complete(root, '2330', '台積電', '上市', '202406', this_month='202407')
+
+
+def test_is_month_complete_current_month_and_missing_file(tmp_path):
+    root = str(tmp_path)
+    path = write_month(root, '202406', ROWS)
+    index = DateIndex(os.path.dirname(path))
+    index.check_month('202406', path)
+    index.mark_closed('202406')
+    index.save()
+    # 當月資料仍會增加
+    assert not is_month_complete(root, '2330', '台積電', '上市', '202406', this_month='202406')
+    assert not is_month_complete(root, '2330', '台積電', '上市', '202405', this_month='202407')
+
+
+def test_is_month_complete_reuses_index(tmp_path):
+    root = str(tmp_path)
+    path = write_month(root, '202406', ROWS)
+    index = DateIndex(os.path.dirname(path))
+    index.check_month('202406', path)
+    index.mark_closed('202406')
+    # 未存檔的標記也會被共用的索引看到
+    assert is_month_complete(root, '2330', '台積電', '上市', '202406', this_month='202407', index=index)
+
+
+def test_shard_of_is_stable():
+    # CRC32 結果固定，分片輸出在不同版本之間可以合併
+    assert {code: shard_of(code, 4) for code in ('2330', '0050', '8069', '6488', '1101')} == {
+        '2330': 3, '0050': 3, '8069': 3, '6488': 0, '1101': 2,
+    }
+    assert shard_of('2330', 7) == 2
+    assert shard_of('2330', 1) == 0
+
+
+def test_shard_of_independent_of_hash_seed():
+    script = "from twstock.storage import shard_of; print([shard_of(str(n), 8) for n in range(1000, 1100)])"
+    outputs = {
+        subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                       env={**os.environ, 'PYTHONHASHSEED': seed},
+                       cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+        for seed in ('0', '1', '12345')
+    }
+    assert len(outputs) == 1
+    assert outputs.pop().strip() == str([shard_of(str(n), 8) for n in range(1000, 1100)])
+
+
+@pytest.mark.parametrize('value, expected', [('0/1', (0, 1)), ('2/4', (2, 4))])
+def test_parse_shard(value, expected):
+    assert parse_shard(value) == expected
+
+
+@pytest.mark.parametrize('value', ['4/4', '-1/4', '0/0', '1', 'a/b', None])
+def test_parse_shard_invalid(value):
+    with pytest.raises(ValueError):
+        parse_shard(value)
@@ -0,0 +1,300 @@
+# archive.py: 已結束月份的月檔壓縮歸檔（每支股票一個 gzip CSV）與歸檔清單
+#
+# 用法：
+#   from twstock.archive import Compactor, ArchiveManifest
+#   Compactor(root).run()                             # 歸檔當月以前的月檔，刪除已歸檔的月檔
+#   ArchiveManifest.load(root).complete('2330', '202401')
+import csv
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import zlib
+from collections import OrderedDict, defaultdict
+
+from twstock.checkpoint import fsync_dir
+from twstock.parsing import parse_csv_row
+from twstock.storage import (
+    CSV_FIELDS, ROOT_FOLDER, ARCHIVE_FOLDER, DateIndex, current_month, iter_month_files, repair_torn_tail,
+)
+
+
+def archive_path(root, code):
+    return os.path.join(root, ARCHIVE_FOLDER, f"{code}.csv.gz")
+
+
+def read_archive(path):
+    """讀取歸檔，回傳依日期排序的資料列（CSV_FIELDS 順序的字串 list）"""
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return [r for r in reader if len(r) >= len(CSV_FIELDS)]
+
+
+def write_archive(path, rows):
+    """
+    以暫存檔 + os.replace 原子性寫入歸檔（gzip mtime 固定為 0，內容相同時位元組也相同），
+    回傳 (檔案大小, sha256)
+    """
+    text = io.StringIO(newline='')
+    writer = csv.writer(text)
+    writer.writerow(CSV_FIELDS)
+    writer.writerows(rows)
+    buffer = io.BytesIO()
+    with gzip.GzipFile(filename='', mode='wb', fileobj=buffer, mtime=0) as gz:
+        gz.write(text.getvalue().encode('utf-8'))
+    data = buffer.getvalue()
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(data), hashlib.sha256(data).hexdigest()
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArchiveManifest:
+    """
+    '<root>/archive/manifest.json'：每支股票（代碼）一筆
+
+        {代碼: {'name': 最新名稱, 'market': 最新市場, 'size': 歸檔大小, 'sha256': 歸檔雜湊,
+                'rows': 列數, 'first': 最早日期, 'last': 最晚日期,
+                'months': {YYYYMM: [日期 bitmap, 市場, 完成標記]}}}
+
+    bitmap 與 DateIndex 相同（第 (日-1) 位元代表該日已歸檔），供 pipeline 去重；
+    完成標記由歸檔前的 DateIndex 帶入，規劃時有標記的月份才算完整（complete()）。
+    """
+
+    FILENAME = 'manifest.json'
+    ROW_CACHE_SIZE = 16     # month_rows 保留最近使用的股票數
+
+    def __init__(self, root, stocks=None):
+        self.root = root
+        self.path = os.path.join(root, ARCHIVE_FOLDER, self.FILENAME)
+        self.stocks = stocks if stocks is not None else {}
+        self.row_cache = OrderedDict()  # 代碼 -> {YYYYMM: [資料列]}
+
+    @classmethod
+    def load(cls, root=ROOT_FOLDER):
+        try:
+            with open(os.path.join(root, ARCHIVE_FOLDER, cls.FILENAME), encoding='utf-8') as f:
+                stocks = json.load(f)
+        except (FileNotFoundError, ValueError):
+            stocks = {}
+        return cls(root, stocks)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.stocks, f, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        fsync_dir(os.path.dirname(self.path))
+
+    def months(self, code):
+        """{YYYYMM: bitmap}，沒有歸檔時為空 dict"""
+        entry = self.stocks.get(code)
+        if not entry:
+            return {}
+        return {ym: month[0] for ym, month in entry['months'].items()}
+
+    def covers(self, code, year_month):
+        """該月份有任何已歸檔的日期"""
+        entry = self.stocks.get(code)
+        return bool(entry and entry['months'].get(year_month, [0])[0])
+
+    def complete(self, code, year_month):
+        """歸檔的月份帶有完成標記（該月結束後抓取的回應已提交）；舊版清單沒有標記，不算完整"""
+        entry = self.stocks.get(code)
+        month = entry['months'].get(year_month) if entry else None
+        return bool(month and len(month) > 2 and month[2])
+
+    def iter_rows(self, code):
+        """依日期產生 (市場, 資料列)；市場依該列月份在歸檔時的市場（轉市場前後不同）"""
+        entry = self.stocks[code]
+        months = entry['months']
+        for row in read_archive(archive_path(self.root, code)):
+            yield months.get(row[2][:6], [0, entry['market']])[1], row
+
+    def month_rows(self, code, year_month):
+        """
+        該月份已歸檔的資料列。每支股票的歸檔只解壓一次，依月份分組後快取（最近 ROW_CACHE_SIZE 支），
+        同一支股票接著查詢其他月份時不再重讀；快取不會偵測歸檔在之後被改寫。
+        """
+        by_month = self.row_cache.get(code)
+        if by_month is None:
+            by_month = {}
+            for row in read_archive(archive_path(self.root, code)):
+                by_month.setdefault(row[2][:6], []).append(row)
+            self.row_cache[code] = by_month
+            if len(self.row_cache) > self.ROW_CACHE_SIZE:
+                self.row_cache.popitem(last=False)
+        else:
+            self.row_cache.move_to_end(code)
+        return by_month.get(year_month, [])
+
+
+class Compactor:
+    """
+    把 before（預設為當月）以前的月檔依股票代碼合併為 '<root>/archive/<代碼>.csv.gz'：
+
+    - 同一代碼在不同資料夾（改名前後）的月檔合併為一個歸檔，依日期排序、去除重複日期
+    - 同一日期有多筆時保留先寫入的一筆（已歸檔的資料優先，與 pipeline 去重一致），內容不同時記為 conflicts
+    - 依序寫入歸檔、歸檔清單，最後才刪除月檔並更新資料夾的 .dates.json；
+      中途中斷時月檔仍在，重新執行即可（結果相同）
+    - 歸檔無法解壓（損毀）時不覆寫也不刪除該代碼的月檔，記為 corrupt；verify() 另可比對 sha256
+
+    回傳統計：stocks、files、rows、duplicates、conflicts、corrupt、bytes_before、bytes_after
+    """
+
+    def __init__(self, root=ROOT_FOLDER, before=None, dry_run=False, logger=None):
+        self.root = root
+        self.before = before or current_month()
+        self.dry_run = dry_run
+        self.logger = logger or logging.getLogger(__name__)
+        self.manifest = ArchiveManifest.load(root)
+        self.stats = dict.fromkeys(
+            ('stocks', 'files', 'rows', 'duplicates', 'conflicts', 'corrupt', 'bytes_before', 'bytes_after'), 0)
+
+    def candidates(self):
+        """{代碼: [(年月, 市場, 名稱, 路徑, 大小)]}，同一代碼依年月排序"""
+        groups = defaultdict(list)
+        for rel, size, code, market, name, path in iter_month_files(self.root):
+            year_month = rel[-10:-4]
+            if year_month < self.before:
+                groups[code].append((year_month, market, name, path, size))
+        for files in groups.values():
+            files.sort()
+        return groups
+
+    def run(self):
+        os.makedirs(os.path.join(self.root, ARCHIVE_FOLDER), exist_ok=True)
+        compacted = {}
+        for code, files in sorted(self.candidates().items()):
+            if self.compact(code, files):
+                compacted[code] = files
+        if self.dry_run or not compacted:
+            return self.stats
+        # 清單落地後才刪除月檔
+        self.manifest.save()
+        for files in compacted.values():
+            self.remove_months(files)
+        return self.stats
+
+    def compact(self, code, files):
+        entry = self.manifest.stocks.get(code)
+        path = archive_path(self.root, code)
+        rows, markets, closed = {}, {}, {}
+        if os.path.exists(path):
+            if entry is None or file_sha256(path) != entry['sha256']:
+                # 上次可能在寫入歸檔後、寫入清單前中斷：歸檔可正常解壓時以其內容重新合併
+                self.logger.warning(f"⚠️ 歸檔與清單不一致，重新合併: {path}")
+            try:
+                archived = read_archive(path)
+            except (OSError, EOFError, zlib.error, csv.Error) as e:
+                self.logger.error(f"❌ 歸檔損毀，略過（月檔保留）: {path}: {e}")
+                self.stats['corrupt'] += 1
+                return False
+            for row in archived:
+                rows[row[2]] = row
+            if entry:
+                markets = {ym: month[1] for ym, month in entry['months'].items()}
+                closed = {ym: month[2] for ym, month in entry['months'].items() if len(month) > 2}
+            self.stats['bytes_before'] += os.path.getsize(path)
+
+        indexes = {}
+        for year_month, market, name, month_path, size in files:
+            if not self.dry_run:
+                repair_torn_tail(month_path)
+            markets[year_month] = market
+            # 月檔的完成標記帶入清單（改名前後任一資料夾有標記即可）
+            folder = os.path.dirname(month_path)
+            index = indexes.get(folder)
+            if index is None:
+                index = indexes[folder] = DateIndex(folder)
+                index.load()
+            if index.is_closed(year_month):
+                closed[year_month] = 1
+            self.stats['files'] += 1
+            self.stats['bytes_before'] += size
+            with open(month_path, encoding='utf-8-sig', newline='') as f:
+                reader = csv.reader(f)
+                next(reader, None)
+                for r in reader:
+                    values = parse_csv_row(r)
+                    if values is None:
+                        continue
+                    r = r[:len(CSV_FIELDS)]
+                    existing = rows.get(r[2])
+                    if existing is None:
+                        rows[r[2]] = r
+                        continue
+                    self.stats['duplicates'] += 1
+                    # 比較解析後的數值，舊版原始字串與目前格式的同一筆資料不算不一致
+                    if parse_csv_row(existing)[1:] != values[1:]:
+                        self.stats['conflicts'] += 1
+                        self.logger.warning(f"⚠️ {code} {r[2]} 資料不一致，保留先寫入的一筆: {month_path}")
+
+        ordered = [rows[d] for d in sorted(rows)]
+        latest_month, latest_market, latest_name = files[-1][:3]
+        if entry and entry['last'][:6] > latest_month:
+            latest_market, latest_name = entry['market'], entry['name']
+        months = {}
+        for row in ordered:
+            year_month = row[2][:6]
+            month = months.setdefault(
+                year_month, [0, markets.get(year_month, latest_market), closed.get(year_month, 0)])
+            month[0] |= DateIndex.bit(row[2])
+        self.stats['stocks'] += 1
+        self.stats['rows'] += len(ordered)
+        if self.dry_run:
+            return True
+        size, sha256 = write_archive(path, ordered)
+        self.stats['bytes_after'] += size
+        self.manifest.stocks[code] = {
+            'name': latest_name, 'market': latest_market, 'size': size, 'sha256': sha256,
+            'rows': len(ordered), 'first': ordered[0][2] if ordered else '',
+            'last': ordered[-1][2] if ordered else '', 'months': months,
+        }
+        return True
+
+    def remove_months(self, files):
+        """刪除已歸檔的月檔，並從資料夾的 .dates.json 移除這些月份；資料夾清空後一併刪除"""
+        by_folder = defaultdict(list)
+        for year_month, _, _, path, _ in files:
+            by_folder[os.path.dirname(path)].append((year_month, path))
+        for folder, months in by_folder.items():
+            for _, path in months:
+                os.remove(path)
+            index = DateIndex(folder)
+            index.load()
+            for year_month, _ in months:
+                if index.months.pop(year_month, None) is not None:
+                    index.dirty = True
+            index.save()
+            remaining = [n for n in os.listdir(folder) if n != DateIndex.FILENAME]
+            if not remaining:
+                if os.path.exists(index.path):
+                    os.remove(index.path)
+                os.rmdir(folder)
+
+    def verify(self):
+        """比對每個歸檔與清單的 sha256，回傳不一致或遺失的代碼"""
+        bad = []
+        for code, entry in sorted(self.manifest.stocks.items()):
+            path = archive_path(self.root, code)
+            if not os.path.exists(path) or file_sha256(path) != entry['sha256']:
+                bad.append(code)
+        return bad
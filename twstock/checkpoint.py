@@ -0,0 +1,115 @@
+# checkpoint.py: 爬取進度檢查點，供 -a resume=1 在中斷後接續
+import json
+import os
+import time
+
+
+def task_key(market, code, period):
+    """'上市:2330:202401'（逐檔，period 為月份）或 '上市:BULK:20240603'（全市場，period 為日期）"""
+    return f"{market}:{code}:{period}"
+
+
+def fsync_dir(folder):
+    """確保 os.replace 後的目錄項目也寫入磁碟（不支援時略過）"""
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class Checkpoint:
+    """
+    '<輸出根資料夾>/.checkpoint/' 下的兩個檔案：
+
+    - plan.json:  本次執行的參數與規劃出的全部工作 [市場, 代碼, 名稱, 期間]
+    - done.jsonl: 已完成的工作鍵，每行一筆
+
+    完成標記先暫存於記憶體，commit() 時先呼叫各 pipeline 註冊的 hook 把資料寫入磁碟（fsync），
+    再寫入並 fsync 完成標記；因此 done.jsonl 中的工作，其資料列必定已完整落地。
+    """
+
+    def __init__(self, root, interval=5.0):
+        self.folder = os.path.join(root, '.checkpoint')
+        self.plan_path = os.path.join(self.folder, 'plan.json')
+        self.done_path = os.path.join(self.folder, 'done.jsonl')
+        self.interval = interval
+        self.pending = []
+        self.hooks = []
+        self.last_commit = time.monotonic()
+        self.file = None        # 呼叫 start() 或 load() 後才啟用，否則完成標記只會被丟棄
+
+    def add_hook(self, hook):
+        """pipeline 註冊的持久化函式，commit 前依序呼叫"""
+        self.hooks.append(hook)
+
+    def start(self, params, tasks):
+        """新的執行：寫入規劃並清空完成紀錄"""
+        os.makedirs(self.folder, exist_ok=True)
+        tmp_path = self.plan_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'params': params, 'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+                       'tasks': tasks}, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.plan_path)
+        self.file = open(self.done_path, 'w', encoding='utf-8')
+        fsync_dir(self.folder)
+
+    def load(self):
+        """讀取上次的規劃與完成紀錄，回傳 (params, tasks, done)；沒有檢查點時回傳 None"""
+        try:
+            with open(self.plan_path, encoding='utf-8') as f:
+                plan = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        done = set()
+        if os.path.exists(self.done_path):
+            with open(self.done_path, 'rb') as f:
+                data = f.read()
+            # 最後一行可能只寫了一半（當機），捨棄不完整的尾端
+            end = data.rfind(b'\n') + 1
+            for line in data[:end].decode('utf-8').splitlines():
+                if line:
+                    done.add(line)
+            if end != len(data):
+                with open(self.done_path, 'r+b') as f:
+                    f.truncate(end)
+        self.file = open(self.done_path, 'a', encoding='utf-8')
+        return plan['params'], plan['tasks'], done
+
+    def mark(self, key):
+        self.pending.append(key)
+        if time.monotonic() - self.last_commit >= self.interval:
+            self.commit()
+
+    def commit(self):
+        for hook in self.hooks:
+            hook()
+        if self.pending and self.file is not None:
+            self.file.write(''.join(f"{key}\n" for key in self.pending))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.pending = []
+        self.last_commit = time.monotonic()
+
+    def close(self, finished=False):
+        """
+        於 spider_closed 時呼叫（pipeline 皆已關閉並寫入資料），只寫入剩餘的完成標記。
+        正常完成時移除檢查點；中斷時保留供下次 resume。
+        """
+        self.hooks = []
+        if self.file is None:
+            return
+        self.commit()
+        self.file.close()
+        self.file = None
+        if finished:
+            for path in (self.plan_path, self.done_path):
+                if os.path.exists(path):
+                    os.remove(path)
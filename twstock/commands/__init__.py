@@ -0,0 +1 @@
+# 自訂 scrapy 指令（settings.COMMANDS_MODULE）
@@ -0,0 +1,41 @@
+# build_store.py: 建立 / 更新唯讀查詢用的二進位資料庫（scrapy build_store）
+#
+# 用法：
+#   scrapy build_store             # 增量更新 個股日成交資訊/.store/
+#   scrapy build_store --full      # 捨棄既有資料庫，全部重建
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from twstock.storage import ROOT_FOLDER
+
+
+class Command(ScrapyCommand):
+
+    requires_project = True
+    default_settings = {'LOG_ENABLED': False}
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Build the memory-mapped binary store used by twstock.reader"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument('--root', default=ROOT_FOLDER, help='日成交資料根資料夾')
+        parser.add_argument('--full', action='store_true', help='全部重建')
+
+    def run(self, args, opts):
+        if args:
+            raise UsageError()
+        try:
+            from twstock.reader import build_store
+            result = build_store(opts.root, full=opts.full)
+        except ImportError as e:
+            print(f"❌ {e}")
+            self.exitcode = 1
+            return
+        print(
+            f"🗄️ 重讀 {result['files']} 個月檔，共 {result['rows']} 列，"
+            f"{result['codes']} 支股票 × {result['dates']} 個交易日，耗時 {result['seconds']}s"
+        )
@@ -0,0 +1,62 @@
+# compact.py: 把已結束月份的月檔歸檔為每支股票一個壓縮檔（scrapy compact）
+#
+# 用法：
+#   scrapy compact                   # 歸檔當月以前的月檔，完成後刪除月檔
+#   scrapy compact --before 202401   # 只歸檔 202401 以前的月份
+#   scrapy compact --dry-run         # 只統計，不寫入也不刪除
+#   scrapy compact --verify          # 比對歸檔與清單的 sha256
+import logging
+import re
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from twstock.archive import Compactor
+from twstock.storage import ROOT_FOLDER, current_month
+
+
+class Command(ScrapyCommand):
+
+    requires_project = True
+    default_settings = {'LOG_ENABLED': False}
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Compact closed month CSVs into per-stock gzip archives"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument('--root', default=ROOT_FOLDER, help='日成交資料根資料夾')
+        parser.add_argument('--before', default=None, help='只歸檔此年月（YYYYMM，不含）以前的月份，預設為當月')
+        parser.add_argument('--dry-run', action='store_true', help='只統計，不寫入也不刪除')
+        parser.add_argument('--verify', action='store_true', help='比對歸檔與清單的 sha256')
+
+    def run(self, args, opts):
+        if args:
+            raise UsageError()
+        if opts.before and not re.fullmatch(r'\d{6}', opts.before):
+            raise UsageError(f"--before 格式須為 YYYYMM: {opts.before}")
+        if opts.before and opts.before > current_month():
+            raise UsageError("當月資料仍會增加，不可歸檔")
+        logging.basicConfig(level=logging.WARNING, format='%(message)s')
+        compactor = Compactor(opts.root, before=opts.before, dry_run=opts.dry_run)
+
+        if opts.verify:
+            bad = compactor.verify()
+            for code in bad:
+                print(f"❌ {code}: 歸檔遺失或 sha256 不一致")
+            print(f"🔍 共 {len(compactor.manifest.stocks)} 個歸檔，{len(bad)} 個異常")
+            self.exitcode = 1 if bad else 0
+            return
+
+        stats = compactor.run()
+        saved = stats['bytes_before'] - stats['bytes_after']
+        print(
+            f"🗜️ {stats['stocks']} 支股票、{stats['files']} 個月檔、{stats['rows']} 列"
+            f"（重複 {stats['duplicates']}、不一致 {stats['conflicts']}、損毀 {stats['corrupt']}）"
+            + ('，dry run 未寫入' if opts.dry_run else
+               f"，{stats['bytes_before']:,} → {stats['bytes_after']:,} bytes（節省 {saved:,}）")
+        )
+        self.exitcode = 1 if stats['conflicts'] or stats['corrupt'] else 0
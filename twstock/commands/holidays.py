@@ -0,0 +1,46 @@
+# holidays.py: 由 TWSE 市場開休市日期表更新休市日清單（scrapy holidays，實作見 twstock/holidays.py）
+#
+# 用法：
+#   scrapy holidays                      # 下載今年與去年的 TWSE 休市日
+#   scrapy holidays --years 2023 2024    # 指定年度（其他年度的日期保留）
+from datetime import datetime
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from twstock.holidays import update
+
+
+class Command(ScrapyCommand):
+
+    requires_project = True
+    default_settings = {'LOG_ENABLED': False}
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Download TWSE market holidays into HOLIDAYS_FILE"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        this_year = datetime.now().year
+        parser.add_argument('--output', default=None, help='休市日清單路徑（預設為設定中的 HOLIDAYS_FILE）')
+        parser.add_argument('--years', type=int, nargs='+', default=[this_year - 1, this_year],
+                            help='要下載的年度（預設今年與去年）')
+
+    def run(self, args, opts):
+        if args:
+            raise UsageError()
+        path = opts.output or self.settings.get('HOLIDAYS_FILE')
+        if not path:
+            raise UsageError("HOLIDAYS_FILE 未設定，請以 --output 指定路徑")
+        try:
+            counts = update(path, opts.years)
+        except Exception as e:
+            print(f"❌ 下載休市日期失敗: {type(e).__name__}: {e}")
+            self.exitcode = 1
+            return
+        for year, n in counts.items():
+            print(f"📅 {year} 年休市日 {n} 天")
+        print(f"💾 已寫入 {path}")
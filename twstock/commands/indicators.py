@@ -0,0 +1,44 @@
+# indicators.py: 更新衍生指標陣列（scrapy indicators）
+#
+# 用法：
+#   scrapy indicators              # 增量更新 個股日成交資訊/.indicators/
+#   scrapy indicators --full       # 捨棄既有陣列，全部重建
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from twstock.storage import ROOT_FOLDER
+
+
+class Command(ScrapyCommand):
+
+    requires_project = True
+    default_settings = {'LOG_ENABLED': False}
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Update vectorized indicators over the stored daily history"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument('--root', default=ROOT_FOLDER, help='日成交資料根資料夾')
+        parser.add_argument('--full', action='store_true', help='全部重建')
+
+    def run(self, args, opts):
+        if args:
+            raise UsageError()
+        try:
+            from twstock.indicators import IndicatorEngine
+            windows = [int(n) for n in self.settings.getlist('INDICATORS_WINDOWS', [5, 20, 60])]
+            engine = IndicatorEngine(opts.root, windows=windows)
+        except ImportError as e:
+            print(f"❌ {e}")
+            self.exitcode = 1
+            return
+        result = engine.update(full=opts.full)
+        print(
+            f"📊 重讀 {result['files']} 個月檔（{result['rows']} 列），"
+            f"{result['stocks']} 支股票 × {result['dates']} 個交易日，"
+            f"自 {result['recomputed_from'] or '-'} 起重算，耗時 {result['seconds']}s"
+        )
@@ -0,0 +1,240 @@
+# merge_shards.py: 將各分片（-a shard=i/n）的輸出合併回 '個股日成交資訊' 標準配置
+#
+# 用法：
+#   scrapy merge_shards                 # 合併 個股日成交資訊_shards/* 到 個股日成交資訊
+#   scrapy merge_shards --dry-run       # 只檢查缺漏與重複，不寫入
+import csv
+import os
+import re
+from collections import Counter, defaultdict
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from twstock.archive import ArchiveManifest
+from twstock.planner import TradingCalendar
+from twstock.storage import (
+    CSV_FIELDS, ROOT_FOLDER, SHARDS_FOLDER, DateIndex, current_month, iter_months, shard_of,
+)
+
+SHARD_DIR_RE = re.compile(r'^(\d+)-of-(\d+)$')
+
+
+def find_shards(shards_folder):
+    """列出分片資料夾，回傳 {(i, n): path}"""
+    shards = {}
+    if not os.path.isdir(shards_folder):
+        return shards
+    for name in sorted(os.listdir(shards_folder)):
+        m = SHARD_DIR_RE.match(name)
+        if m and os.path.isdir(os.path.join(shards_folder, name)):
+            shards[(int(m.group(1)), int(m.group(2)))] = os.path.join(shards_folder, name)
+    return shards
+
+
+def iter_stock_folders(root):
+    """分片根資料夾下的股票資料夾（'代碼_名稱_市場'），略過 logs 與隱藏檔"""
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if name.startswith('.') or name == 'logs' or not os.path.isdir(path):
+            continue
+        if name.count('_') < 2:
+            continue
+        yield name, path
+
+
+def read_rows(path):
+    """讀取月檔，回傳 {日期: row}；同一檔案內的重複日期只保留第一筆"""
+    rows = {}
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            date = row.get('日期')
+            if date and date not in rows:
+                rows[date] = row
+    return rows
+
+
+def write_rows(path, rows):
+    """依日期排序後以暫存檔 + os.replace 原子性寫入"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for date in sorted(rows):
+            writer.writerow(rows[date])
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def archived_dates(archived):
+    """歸檔的 {year_month: bitmap} -> 日期（YYYYMMDD）"""
+    for year_month, bitmap in archived.items():
+        for day in range(31):
+            if bitmap >> day & 1:
+                yield f"{year_month}{day + 1:02d}"
+
+
+class ShardMerger:
+    """
+    合併分片輸出，並統計：
+    - duplicates: 同一 (股票, 日期) 出現在多個來源且內容相同
+    - conflicts:  同一 (股票, 日期) 內容不同（保留既有標準配置 / 較前面分片的資料）
+    - gaps:       股票首尾日期之間缺少的交易日
+    - misplaced:  股票代號雜湊後不屬於所在分片
+    - archived:   日期已在標準配置的歸檔中（archive/），不再寫回月檔
+    """
+
+    def __init__(self, shards_folder, output_root, calendar, dry_run=False, logger=print):
+        self.shards_folder = shards_folder
+        self.output_root = output_root
+        self.calendar = calendar
+        self.dry_run = dry_run
+        self.log = logger
+        self.stats = Counter()
+        # 標準配置中已歸檔的日期與 DailyCsvPipeline 相同視為已寫入
+        self.archive = ArchiveManifest.load(output_root)
+        self.gaps = defaultdict(list)       # 股票資料夾 -> [缺漏日期]
+        self.conflicts = []                 # [(股票資料夾, 日期)]
+
+    def check_shards(self, shards):
+        """確認分片總數一致且 0 ~ n-1 都存在"""
+        counts = {n for _, n in shards}
+        if len(counts) > 1:
+            self.log(f"⚠️ 分片總數不一致: {sorted(counts)}（可能混用了不同 n 的輸出）")
+        for n in counts:
+            missing = [i for i in range(n) if (i, n) not in shards]
+            if missing:
+                self.stats['missing_shards'] += len(missing)
+                self.log(f"⚠️ 缺少分片 (n={n}): {missing}")
+
+    def run(self):
+        shards = find_shards(self.shards_folder)
+        if not shards:
+            self.log(f"⚠️ 找不到分片輸出: {self.shards_folder}")
+            return self.stats
+        self.check_shards(shards)
+
+        # 股票資料夾 -> [(分片, 路徑)]；正常情況下每支股票只在一個分片中
+        sources = defaultdict(list)
+        for (index, count), root in sorted(shards.items()):
+            for name, path in iter_stock_folders(root):
+                code = name.split('_', 1)[0]
+                if shard_of(code, count) != index:
+                    self.stats['misplaced'] += 1
+                    self.log(f"⚠️ {name} 不屬於分片 {index}/{count}")
+                sources[name].append(path)
+
+        for name in sorted(sources):
+            self.merge_stock(name, sources[name])
+        return self.stats
+
+    def merge_stock(self, name, paths):
+        months = defaultdict(list)
+        # 分片索引中已有完成標記的月份，合併後帶入標準配置
+        closed = set()
+        for path in paths:
+            source_index = DateIndex(path)
+            source_index.load()
+            closed.update(ym for ym in source_index.months if source_index.is_closed(ym))
+            for filename in os.listdir(path):
+                if filename.endswith('.csv') and filename[:-4].isdigit():
+                    months[filename[:-4]].append(os.path.join(path, filename))
+
+        code = name.split('_', 1)[0]
+        archived = self.archive.months(code)
+        target_folder = os.path.join(self.output_root, name)
+        index = DateIndex(target_folder, archived=archived)
+        all_dates = set(archived_dates(archived))
+        for year_month in sorted(months):
+            target = os.path.join(target_folder, f"{year_month}.csv")
+            rows = read_rows(target) if os.path.exists(target) else {}
+            index.check_month(year_month, target)
+            added = 0
+            for source in months[year_month]:
+                for date, row in read_rows(source).items():
+                    existing = rows.get(date)
+                    if existing is None and index.contains(date):
+                        # 不在月檔中卻已寫入：該日期已歸檔
+                        self.stats['archived'] += 1
+                    elif existing is None:
+                        rows[date] = row
+                        added += 1
+                    elif all(existing.get(k) == row.get(k) for k in CSV_FIELDS):
+                        self.stats['duplicates'] += 1
+                    else:
+                        self.stats['conflicts'] += 1
+                        self.conflicts.append((name, date))
+            all_dates.update(rows)
+            self.stats['rows'] += added
+            if added and not self.dry_run:
+                size = write_rows(target, rows)
+                bitmap = 0
+                for date in rows:
+                    bitmap |= index.bit(date)
+                index.months[year_month] = [bitmap, size, index.months[year_month][2]]
+                index.dirty = True
+                self.stats['files'] += 1
+            if year_month in closed and not self.dry_run and os.path.exists(target):
+                index.mark_closed(year_month)
+        if not self.dry_run:
+            index.save()
+        self.find_gaps(name, all_dates)
+
+    def find_gaps(self, name, dates):
+        """首筆與末筆日期之間，交易日曆上有但資料中沒有的日期"""
+        if not dates:
+            return
+        first, last = min(dates), max(dates)
+        for year_month in iter_months(first[:6], min(last[:6], current_month())):
+            for day in self.calendar.trading_days(year_month, until=last):
+                if day >= first and day not in dates:
+                    self.gaps[name].append(day)
+        self.stats['gaps'] += len(self.gaps[name])
+
+
+class Command(ScrapyCommand):
+
+    requires_project = True
+    default_settings = {'LOG_ENABLED': False}
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Merge sharded DailySpider outputs into the canonical layout"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument('--shards-dir', default=SHARDS_FOLDER, help='分片輸出的根資料夾')
+        parser.add_argument('--output', default=ROOT_FOLDER, help='合併後的標準配置根資料夾')
+        parser.add_argument('--dry-run', action='store_true', help='只檢查缺漏與重複，不寫入')
+        parser.add_argument('--show-gaps', type=int, default=20, help='最多列出幾支有缺漏的股票')
+
+    def run(self, args, opts):
+        if args:
+            raise UsageError()
+        holidays_file = self.settings.get('HOLIDAYS_FILE')
+        try:
+            calendar = TradingCalendar.from_file(holidays_file)
+        except FileNotFoundError:
+            # 缺漏只用於報告，仍可合併；但國定假日會被列為缺漏交易日
+            print(f"⚠️ 找不到休市日清單 {holidays_file}，缺漏交易日只排除週末（執行 scrapy holidays 產生）")
+            calendar = TradingCalendar()
+        merger = ShardMerger(opts.shards_dir, opts.output, calendar, dry_run=opts.dry_run)
+        stats = merger.run()
+
+        print(f"📦 合併列數: {stats['rows']}，寫入檔案: {stats['files']}"
+              f"{'（dry-run，未寫入）' if opts.dry_run else ''}")
+        print(f"🔁 重複（內容相同）: {stats['duplicates']}，⚠️ 衝突（內容不同）: {stats['conflicts']}，"
+              f"🗄️ 已歸檔: {stats['archived']}")
+        for name, date in merger.conflicts[:opts.show_gaps]:
+            print(f"   衝突: {name} {date}")
+        print(f"🕳️ 缺漏交易日: {stats['gaps']}（{len([g for g in merger.gaps.values() if g])} 支股票）")
+        shown = 0
+        for name, days in sorted(merger.gaps.items()):
+            if days and shown < opts.show_gaps:
+                print(f"   {name}: {', '.join(days[:10])}{' ...' if len(days) > 10 else ''}")
+                shown += 1
+        if stats['missing_shards'] or stats['conflicts'] or stats['misplaced']:
+            self.exitcode = 1
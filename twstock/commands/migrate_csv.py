@@ -0,0 +1,142 @@
+# migrate_csv.py: 把舊版月檔與歸檔的資料列改寫為 DailyCsvPipeline 目前的格式（scrapy migrate_csv，只需執行一次）
+#
+# 舊版直接寫入交易所的原始字串：價格與筆數有千分位（'1,050.00'）、上櫃漲跌沒有 '+'、無成交的價格為 '--' 或 '----'；
+# 目前的格式為 '1050.00'、'+5.00'、'--'。兩者混在同一個月檔時，合併分片、歸檔的內容比對會誤判為不一致。
+#
+# 用法：
+#   scrapy migrate_csv              # 改寫 個股日成交資訊 下的月檔與 archive/ 的歸檔
+#   scrapy migrate_csv --dry-run    # 只統計需要改寫的檔案與列數
+import csv
+import os
+from collections import Counter
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from twstock.archive import ArchiveManifest, archive_path, read_archive, write_archive
+from twstock.pipelines import csv_record, normalize_csv_row
+from twstock.storage import CSV_FIELDS, ROOT_FOLDER, DateIndex, iter_month_files, repair_torn_tail
+
+
+class CsvMigrator:
+    """
+    逐一讀取月檔與歸檔，資料列有變動時以暫存檔 + os.replace 原子性改寫：
+    - 月檔改寫後更新所在資料夾 .dates.json 的月檔大小（日期不變）
+    - 歸檔改寫後更新清單的大小與 sha256
+    已是目前格式的檔案不會改寫，重複執行結果相同。
+    改寫後的資料列須與原本解析出相同的數值，否則保留原資料列（kept_rows）。
+    統計：files、rows、changed_files、changed_rows、kept_rows
+    """
+
+    def __init__(self, root=ROOT_FOLDER, dry_run=False, logger=print):
+        self.root = root
+        self.dry_run = dry_run
+        self.log = logger
+        self.stats = Counter()
+
+    def normalize(self, rows):
+        """回傳 (改寫後的資料列, 變動列數)"""
+        normalized, changed = [], 0
+        for old in rows:
+            new = normalize_csv_row(old)
+            if old[:len(CSV_FIELDS)] != new:
+                if csv_record(old) != csv_record(new):
+                    self.log(f"⚠️ 改寫後數值不同，保留原資料列: {old}")
+                    self.stats['kept_rows'] += 1
+                    new = old
+                else:
+                    changed += 1
+            normalized.append(new)
+        self.stats['files'] += 1
+        self.stats['rows'] += len(rows)
+        if changed:
+            self.stats['changed_files'] += 1
+            self.stats['changed_rows'] += changed
+        return normalized, changed
+
+    def migrate_month(self, path):
+        """改寫一個月檔，回傳 (原檔案大小, 新的檔案大小)；不需改寫時為 None"""
+        if not self.dry_run:
+            repair_torn_tail(path)
+        old_size = os.path.getsize(path)
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            rows = list(reader)
+        rows, changed = self.normalize(rows)
+        if not changed or self.dry_run:
+            return None
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_FIELDS)
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return old_size, os.path.getsize(path)
+
+    def migrate_archives(self):
+        manifest = ArchiveManifest.load(self.root)
+        updated = False
+        for code, entry in sorted(manifest.stocks.items()):
+            path = archive_path(self.root, code)
+            if not os.path.exists(path):
+                self.log(f"⚠️ 找不到歸檔: {path}")
+                continue
+            rows, changed = self.normalize(read_archive(path))
+            if not changed or self.dry_run:
+                continue
+            entry['size'], entry['sha256'] = write_archive(path, rows)
+            updated = True
+        if updated:
+            manifest.save()
+
+    def run(self):
+        if not os.path.isdir(self.root):
+            self.log(f"⚠️ 找不到資料夾: {self.root}")
+            return self.stats
+        indexes = {}
+        for rel, _, _, _, _, path in sorted(iter_month_files(self.root)):
+            sizes = self.migrate_month(path)
+            if sizes is None:
+                continue
+            folder = os.path.dirname(path)
+            index = indexes.get(folder)
+            if index is None:
+                index = indexes[folder] = DateIndex(folder)
+                index.load()
+            # 日期不變，只更新月檔大小；索引原本就與月檔不一致時保留，下次載入時從 CSV 重建
+            entry = index.months.get(rel[-10:-4])
+            if entry and entry[1] == sizes[0]:
+                index.set_size(rel[-10:-4], sizes[1])
+        for index in indexes.values():
+            index.save()
+        self.migrate_archives()
+        return self.stats
+
+
+class Command(ScrapyCommand):
+
+    requires_project = True
+    default_settings = {'LOG_ENABLED': False}
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Rewrite legacy month CSVs and archives in the current CSV format"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument('--root', default=ROOT_FOLDER, help='日成交資料根資料夾')
+        parser.add_argument('--dry-run', action='store_true', help='只統計，不寫入')
+
+    def run(self, args, opts):
+        if args:
+            raise UsageError()
+        stats = CsvMigrator(opts.root, dry_run=opts.dry_run).run()
+        print(f"🔧 檢查 {stats['files']} 個檔案、{stats['rows']} 列；"
+              f"{'需改寫' if opts.dry_run else '已改寫'} {stats['changed_files']} 個檔案、{stats['changed_rows']} 列")
+        if stats['kept_rows']:
+            print(f"⚠️ {stats['kept_rows']} 列改寫後數值不同，保留原資料列")
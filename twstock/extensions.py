@@ -0,0 +1,503 @@
+# extensions.py: 長時間爬取的即時進度與狀態端點（Prometheus text format）、各端點量測與 profiling
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict, deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet import task
+
+from twstock.signals import request_failed
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def get_extension(crawler, cls):
+    """
+    取得執行中的 extension 實例，找不到時回傳 None
+    Scrapy 2.12 起有 crawler.get_extension；較舊版本直接查 extension manager（在 middleware 之前建立）
+    """
+    if hasattr(crawler, 'get_extension'):
+        return crawler.get_extension(cls)
+    return next((ext for ext in crawler.extensions.middlewares if isinstance(ext, cls)), None)
+
+
+# 固定分桶上界（最後一桶為 +Inf）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)          # 下載延遲（秒）
+QUEUE_WAIT_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 300)          # 排程到開始下載（秒）
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)  # 回應大小（bytes）
+CPU_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)              # callback CPU 時間（秒）
+
+
+class Histogram:
+    """固定分桶直方圖；分位數以所在分桶的上界近似"""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for idx, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.bounds[idx] if idx < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 4),
+            'mean': round(self.sum / self.count, 4) if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'max': round(self.max, 4),
+            'buckets': dict(zip([*map(str, self.bounds), '+Inf'], self.counts)),
+        }
+
+
+class SamplingProfiler(threading.Thread):
+    """
+    取樣式 profiler：每 interval 秒讀取 reactor 執行緒的呼叫堆疊（sys._current_frames），
+    只在 parse callback 執行期間計數，結果為 collapsed stack 格式（可直接餵給 flamegraph.pl）。
+    """
+
+    def __init__(self, interval, thread_id):
+        super().__init__(name='twstock-profiler', daemon=True)
+        self.interval = interval
+        self.thread_id = thread_id
+        self.active = False
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            if not self.active:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+
+
+class StatusServer:
+    """
+    opt-in 的本機 HTTP 狀態端點（STATUS_ENABLED），GET /metrics 回傳 Prometheus text format：
+
+    - 各市場已完成 / 剩餘的請求與股票數、滾動 ETA
+    - 各站點近 STATUS_RATE_WINDOW 秒的回應速率、目前間隔、封鎖次數與暫停剩餘秒數
+    - 依錯誤類型的失敗數、HTTP 狀態碼分布、各 pipeline 寫入數
+    - 距上一個回應的秒數（偵測停滯）
+
+    數據由 scrapy signals 在 reactor 執行緒更新，每 STATUS_REFRESH 秒產生一次文字快照，
+    HTTP 執行緒只讀取快照，不直接存取爬蟲狀態。
+    """
+
+    def __init__(self, crawler, host, port, refresh, rate_window, eta_window):
+        self.crawler = crawler
+        self.host = host
+        self.port = port
+        self.refresh = refresh
+        self.rate_window = rate_window
+        self.eta_window = eta_window
+        self.spider = None
+        self.started = time.time()
+        self.last_response = None
+        self.completed = Counter()             # 市場 -> 已完成請求數
+        self.stock_done = Counter()            # (市場, 代碼) -> 已完成請求數
+        self.stocks_completed = Counter()      # 市場 -> 全部月份都完成的股票數
+        self.errors = Counter()                # 錯誤類型 -> 次數
+        self.host_times = {}                   # 站點 -> deque[回應時間]
+        self.done_times = deque()              # 完成時間，計算 ETA 用
+        self.snapshot = ''
+        self.server = None
+        self.loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('STATUS_ENABLED'):
+            raise NotConfigured
+        ext = cls(
+            crawler,
+            host=settings.get('STATUS_BIND', '127.0.0.1'),
+            port=settings.getint('STATUS_PORT', 9410),
+            refresh=settings.getfloat('STATUS_REFRESH', 5.0),
+            rate_window=settings.getfloat('STATUS_RATE_WINDOW', 60.0),
+            eta_window=settings.getfloat('STATUS_ETA_WINDOW', 300.0),
+        )
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.request_failed, signal=request_failed)
+        return ext
+
+    # ---- signals ----
+
+    def spider_opened(self, spider):
+        self.spider = spider
+        self.started = time.time()
+        ext = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = ext.snapshot.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='twstock-status', daemon=True).start()
+        self.loop = task.LoopingCall(self.render)
+        self.loop.start(self.refresh, now=True)
+        spider.logger.info(f"📡 狀態端點 http://{self.host}:{self.port}/metrics")
+
+    def spider_closed(self, spider, reason):
+        if self.loop is not None and self.loop.running:
+            self.loop.stop()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def response_received(self, response, request, spider):
+        now = time.time()
+        self.last_response = now
+        host = request.meta.get('download_slot') or urlparse_cached(request).hostname
+        times = self.host_times.setdefault(host, deque())
+        times.append(now)
+        self.complete(request, now)
+
+    def request_failed(self, request, error, message):
+        self.errors[error] += 1
+        # 有收到回應但解析失敗的請求已在 response_received 計入完成
+        self.complete(request, time.time())
+
+    def complete(self, request, now):
+        if request.meta.get('twstock_completed'):
+            return
+        request.meta['twstock_completed'] = True
+        stock = request.meta.get('stock')
+        if not stock:
+            return
+        market = stock.get('市場')
+        self.completed[market] += 1
+        self.done_times.append(now)
+        plan_counts = getattr(self.spider, 'plan_counts', None)
+        if plan_counts:
+            key = (market, stock.get('代碼'))
+            self.stock_done[key] += 1
+            if self.stock_done[key] == plan_counts.get(key):
+                self.stocks_completed[market] += 1
+
+    # ---- 快照 ----
+
+    def planned(self):
+        """各市場預計請求數；佇列模式下以佇列中的工作數計算"""
+        spider = self.spider
+        frontier = getattr(spider, 'frontier', None)
+        if frontier is not None:
+            counts = frontier.counts()
+            pending = counts.get('pending', 0) + counts.get('leased', 0)
+            return None, pending
+        return dict(getattr(spider, 'planned_requests', None) or {}), None
+
+    def render(self):
+        now = time.time()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label = ','.join(f'{k}="{_label(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label}}} {value}" if label else f"{name} {value}")
+
+        planned, frontier_remaining = self.planned()
+        markets = sorted(set(planned or {}) | set(self.completed))
+        metric('twstock_up', 'gauge', '爬蟲執行中', [({}, 1)])
+        metric('twstock_elapsed_seconds', 'gauge', '已執行秒數', [({}, round(now - self.started, 1))])
+        metric('twstock_requests_completed_total', 'counter', '已完成（成功或最終失敗）的請求數',
+               [({'market': m}, self.completed[m]) for m in markets])
+
+        remaining_total = frontier_remaining
+        if planned is not None:
+            remaining = {m: max(0, planned.get(m, 0) - self.completed[m]) for m in markets}
+            remaining_total = sum(remaining.values())
+            metric('twstock_requests_planned', 'gauge', '規劃的請求數',
+                   [({'market': m}, planned.get(m, 0)) for m in markets])
+            metric('twstock_requests_remaining', 'gauge', '剩餘請求數',
+                   [({'market': m}, remaining[m]) for m in markets])
+        else:
+            metric('twstock_frontier_remaining', 'gauge', '共用佇列中未完成的工作數',
+                   [({}, frontier_remaining)])
+
+        plan_counts = getattr(self.spider, 'plan_counts', None)
+        if plan_counts:
+            totals = Counter(market for market, _ in plan_counts)
+            metric('twstock_stocks_completed', 'gauge', '所有月份皆已完成的股票數',
+                   [({'market': m}, self.stocks_completed[m]) for m in sorted(totals)])
+            metric('twstock_stocks_remaining', 'gauge', '仍有月份未完成的股票數',
+                   [({'market': m}, totals[m] - self.stocks_completed[m]) for m in sorted(totals)])
+
+        # 各站點速率：只保留視窗內的回應時間
+        rates = []
+        for host, times in sorted(self.host_times.items()):
+            while times and times[0] < now - self.rate_window:
+                times.popleft()
+            rates.append(({'host': host}, round(len(times) / self.rate_window, 4)))
+        metric('twstock_host_response_rate', 'gauge', f'近 {self.rate_window:.0f} 秒每秒回應數', rates)
+
+        stats = self.crawler.stats.get_stats()
+        delays, bans, paused = [], [], []
+        for key, value in sorted(stats.items()):
+            if not key.startswith('ratelimit/'):
+                continue
+            _, host, name = key.split('/', 2)
+            if name == 'delay':
+                delays.append(({'host': host}, value))
+            elif name == 'bans':
+                bans.append(({'host': host}, value))
+            elif name == 'paused_until':
+                paused.append(({'host': host}, round(max(0.0, value - now), 1)))
+        metric('twstock_host_delay_seconds', 'gauge', '目前請求間隔', delays)
+        metric('twstock_host_bans_total', 'counter', '封鎖（重定向 / 429）次數', bans)
+        metric('twstock_host_paused_seconds', 'gauge', '站點暫停剩餘秒數', paused)
+
+        metric('twstock_errors_total', 'counter', '依錯誤類型的最終失敗數',
+               [({'type': t}, n) for t, n in sorted(self.errors.items())])
+        prefix = 'downloader/response_status_count/'
+        metric('twstock_http_responses_total', 'counter', '依狀態碼的回應數',
+               [({'status': k[len(prefix):]}, v) for k, v in sorted(stats.items()) if k.startswith(prefix)])
+        items = []
+        for key, value in sorted(stats.items()):
+            if key.startswith('pipeline/'):
+                _, pipeline, result = key.split('/', 2)
+                items.append(({'pipeline': pipeline, 'result': result}, value))
+        metric('twstock_pipeline_items_total', 'counter', '各 pipeline 寫入 / 重複略過的資料列數', items)
+
+        # 滾動 ETA：以最近 STATUS_ETA_WINDOW 秒的完成速率推估
+        while self.done_times and self.done_times[0] < now - self.eta_window:
+            self.done_times.popleft()
+        window = max(min(self.eta_window, now - self.started), self.refresh)
+        rate = len(self.done_times) / window
+        eta = round(remaining_total / rate, 1) if rate and remaining_total is not None else -1
+        metric('twstock_completion_rate', 'gauge', f'近 {self.eta_window:.0f} 秒每秒完成請求數',
+               [({}, round(rate, 4))])
+        metric('twstock_eta_seconds', 'gauge', '預估剩餘秒數（-1 表示無法估計）', [({}, eta)])
+        age = round(now - self.last_response, 1) if self.last_response else -1
+        metric('twstock_last_response_age_seconds', 'gauge', '距上一個回應的秒數（停滯偵測）', [({}, age)])
+
+        self.snapshot = '\n'.join(lines) + '\n'
+
+
+class RequestMetrics:
+    """
+    各端點的量測資料，由 TwstockMiddleware（downloader 與 spider 兩個角色）回報：
+
+    - 依 (端點, 市場) 記錄下載延遲、排程等待（排入佇列到開始下載，含限速等待）與回應大小
+    - parse callback 的 CPU 時間；METRICS_PROFILE_INTERVAL > 0 時於 callback 期間取樣呼叫堆疊
+
+    spider_closed 時輸出摘要到日誌、scrapy stats 與 '<logs>/YYYY-MM-DD.metrics.json'。
+    """
+
+    def __init__(self, stats=None, profile_interval=0.0, profile_top=20):
+        self.stats = stats
+        self.metrics = defaultdict(lambda: {
+            'latency': Histogram(LATENCY_BUCKETS),
+            'queue_wait': Histogram(QUEUE_WAIT_BUCKETS),
+            'size': Histogram(SIZE_BUCKETS),
+            'callback_cpu': Histogram(CPU_BUCKETS),
+        })
+        self.profile_interval = profile_interval
+        self.profile_top = profile_top
+        self.profiler = None
+        self.started = time.time()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(
+            stats=crawler.stats,
+            profile_interval=crawler.settings.getfloat('METRICS_PROFILE_INTERVAL', 0.0),
+            profile_top=crawler.settings.getint('METRICS_PROFILE_TOP', 20),
+        )
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.request_scheduled, signal=signals.request_scheduled)
+        return ext
+
+    @staticmethod
+    def metric_key(request):
+        """(端點, 市場)，例如 'STOCK_DAY/上市'"""
+        endpoint = urlparse_cached(request).path.rstrip('/').rsplit('/', 1)[-1] or 'unknown'
+        market = request.meta.get('stock', {}).get('市場', '-')
+        return f"{endpoint}/{market}"
+
+    def observe_response(self, request, response):
+        """記錄延遲、排程等待與大小；快取命中的回應沒有 download_latency，只記錄大小"""
+        metrics = self.metrics[self.metric_key(request)]
+        metrics['size'].observe(len(response.body))
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            metrics['latency'].observe(latency)
+            scheduled_at = request.meta.get('twstock_scheduled_at')
+            if scheduled_at is not None:
+                # 開始下載時間 = 收到回應時間 - 下載延遲
+                metrics['queue_wait'].observe(max(0.0, time.time() - latency - scheduled_at))
+
+    def observe_exception(self, request):
+        if self.stats is not None:
+            self.stats.inc_value(f'twstock/{self.metric_key(request)}/exceptions')
+
+    def callback_histogram(self, response):
+        return self.metrics[self.metric_key(response.request)]['callback_cpu']
+
+    def callback_started(self):
+        if self.profiler is not None:
+            self.profiler.active = True
+
+    def callback_finished(self):
+        if self.profiler is not None:
+            self.profiler.active = False
+
+    # ---- signals ----
+
+    def request_scheduled(self, request, spider):
+        request.meta['twstock_scheduled_at'] = time.time()
+
+    def spider_opened(self, spider):
+        """
+        爬蟲開始時的回調方法
+        當爬蟲開始運行時會被自動呼叫
+
+        Args:
+            spider: 開始運行的爬蟲實例
+        """
+        # 記錄爬蟲開始的信息
+        spider.logger.info(f"Spider {spider.name} 開始爬取。")
+        self.started = time.time()
+        if self.profile_interval > 0:
+            self.profiler = SamplingProfiler(self.profile_interval, threading.get_ident())
+            self.profiler.start()
+            spider.logger.info(f"🔬 取樣 profiler 已啟動（每 {self.profile_interval}s）")
+
+    def spider_closed(self, spider, reason):
+        wall = time.time() - self.started
+        summary = {
+            key: {name: h.summary() for name, h in metrics.items()}
+            for key, metrics in sorted(self.metrics.items())
+        }
+        spider.logger.info(f"📈 執行時間 {wall:.1f}s，各端點量測：")
+        for key, metrics in summary.items():
+            lat, wait, size, cpu = (metrics[n] for n in ('latency', 'queue_wait', 'size', 'callback_cpu'))
+            spider.logger.info(
+                f"   {key}: {lat['count']} 個回應 | 延遲 p50 {lat['p50']}s p90 {lat['p90']}s p99 {lat['p99']}s "
+                f"| 排程等待 p50 {wait['p50']}s p90 {wait['p90']}s | 大小 p50 {size['p50']}B "
+                f"| callback CPU 平均 {cpu['mean'] * 1000:.2f}ms，共 {cpu['sum']:.2f}s"
+            )
+            if self.stats is not None:
+                for name, h in metrics.items():
+                    for stat in ('count', 'p50', 'p90', 'p99', 'max'):
+                        self.stats.set_value(f'twstock/{key}/{name}_{stat}', h[stat])
+
+        # 瓶頸判斷：網路（下載延遲）、限速（排程等待）、解析（callback CPU）的總時間比例
+        totals = {
+            '網路': sum(m['latency']['sum'] for m in summary.values()),
+            '限速/排隊': sum(m['queue_wait']['sum'] for m in summary.values()),
+            '解析': sum(m['callback_cpu']['sum'] for m in summary.values()),
+        }
+        grand = sum(totals.values())
+        if grand:
+            shares = '、'.join(f"{name} {value / grand:.0%}" for name, value in totals.items())
+            spider.logger.info(f"📊 時間分布：{shares}（主要瓶頸：{max(totals, key=totals.get)}）")
+
+        folder = getattr(spider, 'logs_folder', os.path.join('個股日成交資訊', 'logs'))
+        os.makedirs(folder, exist_ok=True)
+        today = datetime.now().strftime('%Y-%m-%d')
+        with open(os.path.join(folder, f"{today}.metrics.json"), 'w', encoding='utf-8') as f:
+            json.dump({'reason': reason, 'wall_seconds': round(wall, 1), 'totals': totals,
+                       'endpoints': summary}, f, ensure_ascii=False, indent=2)
+
+        if self.profiler is not None:
+            self.profiler.stop()
+            stacks = self.profiler.stacks
+            with open(os.path.join(folder, f"{today}.profile.txt"), 'w', encoding='utf-8') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            leaves = Counter()
+            for stack, count in stacks.items():
+                leaves[stack.rsplit(';', 1)[-1]] += count
+            total = sum(leaves.values())
+            spider.logger.info(f"🔬 profiler 共 {total} 個樣本，最常出現的函式：")
+            for frame, count in leaves.most_common(self.profile_top):
+                spider.logger.info(f"   {count / total:6.1%}  {frame}")
+
+
+class IndicatorUpdater:
+    """INDICATORS_UPDATE_ON_CLOSE 開啟時，爬蟲正常結束後增量更新衍生指標（需要 numpy）"""
+
+    def __init__(self, windows):
+        self.windows = windows
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('INDICATORS_UPDATE_ON_CLOSE'):
+            raise NotConfigured
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            raise NotConfigured('IndicatorUpdater 需要安裝 numpy')
+        ext = cls([int(n) for n in crawler.settings.getlist('INDICATORS_WINDOWS', [5, 20, 60])])
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_closed(self, spider, reason):
+        if reason != 'finished':
+            return
+        from twstock.indicators import IndicatorEngine
+        root = getattr(spider, 'output_root', None)
+        if root is None:
+            return
+        result = IndicatorEngine(root, windows=self.windows).update()
+        spider.logger.info(
+            f"📊 指標已更新：重讀 {result['files']} 個月檔，{result['stocks']} 支 × {result['dates']} 日，"
+            f"耗時 {result['seconds']}s"
+        )
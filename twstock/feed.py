@@ -0,0 +1,210 @@
+# feed.py: 新寫入資料列的變更紀錄（append-only，以 byte offset 定址），並可經 Unix socket 即時推送
+#
+# 寫入端由 DailyCsvPipeline 在每次提交（fsync）後呼叫 FeedWriter.append()。
+# 讀取端：
+#   from twstock.feed import read_feed, tail, subscribe
+#   rows, offset = read_feed('個股日成交資訊/.feed/feed.jsonl', offset)     # 讀一批
+#   for rows, offset in tail(path, offset): ...                            # 輪詢檔案持續讀取
+#   for rows, offset in subscribe('個股日成交資訊/.feed/feed.sock', offset): ...  # 即時推送
+#
+#   python -m twstock.feed [--offset N] [--socket]                          # 命令列輸出
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from twstock.storage import ROOT_FOLDER, repair_torn_tail
+
+FEED_FOLDER = '.feed'
+FEED_FILENAME = 'feed.jsonl'
+SOCKET_FILENAME = 'feed.sock'
+
+
+def feed_paths(root=ROOT_FOLDER):
+    folder = os.path.join(root, FEED_FOLDER)
+    return os.path.join(folder, FEED_FILENAME), os.path.join(folder, SOCKET_FILENAME)
+
+
+def parse_lines(data, offset):
+    """把完整的行解析為資料列，回傳 (rows, 下一個 offset)；結尾不完整的行留待下次讀取"""
+    end = data.rfind(b'\n') + 1
+    rows = [json.loads(line) for line in data[:end].splitlines() if line]
+    return rows, offset + end
+
+
+def read_feed(path, offset=0, max_bytes=1 << 20):
+    """從 offset 讀取最多約 max_bytes 的完整資料列，回傳 (rows, 下一個 offset)"""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(max_bytes)
+            # 單行超過 max_bytes 時繼續讀到行尾
+            while data and not data.endswith(b'\n'):
+                more = f.read(max_bytes)
+                if not more:
+                    break
+                data += more
+    except FileNotFoundError:
+        return [], offset
+    return parse_lines(data, offset)
+
+
+def read_all(path, offset=0):
+    """讀到目前檔案結尾為止，逐批產生 (rows, 下一個 offset)"""
+    while True:
+        rows, offset = read_feed(path, offset)
+        if not rows:
+            return
+        yield rows, offset
+
+
+def tail(path, offset=0, poll=1.0):
+    """持續輪詢 feed 檔，每有新資料列就產生 (rows, 下一個 offset)"""
+    while True:
+        rows, offset = read_feed(path, offset)
+        if rows:
+            yield rows, offset
+        else:
+            time.sleep(poll)
+
+
+def subscribe(socket_path, offset=0):
+    """
+    連線到 FeedWriter 的 Unix socket，送出起始 offset 後持續接收：
+    先補送 offset 之後已有的資料列，之後每次提交即推送，產生 (rows, 下一個 offset)
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(f"{offset}\n".encode('ascii'))
+        buffer = b''
+        while True:
+            chunk = sock.recv(1 << 16)
+            if not chunk:
+                return
+            buffer += chunk
+            rows, next_offset = parse_lines(buffer, offset)
+            if rows:
+                buffer = buffer[next_offset - offset:]
+                offset = next_offset
+                yield rows, offset
+
+
+class FeedWriter:
+    """
+    '<root>/.feed/feed.jsonl'：每個新寫入的資料列一行 JSON（DailyRecord 欄位），只會追加。
+    行首的 byte 位置即為該列的 offset，讀取端記住上次讀到的 offset 即可接續。
+
+    append() 在資料已 fsync 落地後才呼叫，並 fsync feed 檔本身；因此 feed 中的資料列必定已寫入月檔。
+    若在月檔提交與 feed 寫入之間當機，該批資料列不會出現在 feed 中（at-most-once）。
+
+    socket_path 不為 None 時另開 Unix socket：每個訂閱者一個執行緒，從訂閱者給的 offset 讀取 feed 檔，
+    之後等待新的提交再送出；推送內容與 feed 檔完全相同，慢的訂閱者只會落後，不影響爬蟲。
+    """
+
+    def __init__(self, path, socket_path=None):
+        self.path = path
+        self.socket_path = socket_path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 上次寫到一半當機留下的不完整行先截掉，新資料列才會從行首開始
+        repair_torn_tail(path)
+        self.file = open(path, 'ab')
+        self.size = self.file.tell()
+        self.changed = threading.Condition()
+        self.closed = False
+        self.server = None
+        if socket_path:
+            self.start_server()
+
+    def append(self, rows):
+        """追加一批資料列（dict），回傳這批資料列的起始 offset"""
+        if not rows:
+            return self.size
+        start = self.size
+        data = b''.join(json.dumps(row, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+                        for row in rows)
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        with self.changed:
+            self.size += len(data)
+            self.changed.notify_all()
+        return start
+
+    def wait(self, offset, timeout=1.0):
+        """等待 feed 大小超過 offset，回傳目前大小"""
+        with self.changed:
+            if self.size <= offset and not self.closed:
+                self.changed.wait(timeout)
+            return self.size
+
+    # ---- Unix socket ----
+
+    def start_server(self):
+        writer = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    offset = int(self.rfile.readline().strip() or 0)
+                except ValueError:
+                    return
+                with open(writer.path, 'rb') as f:
+                    while not writer.closed:
+                        size = writer.wait(offset)
+                        if size <= offset:
+                            continue
+                        f.seek(offset)
+                        data = f.read(size - offset)
+                        try:
+                            self.wfile.write(data)
+                            self.wfile.flush()
+                        except OSError:
+                            return      # 訂閱者已離線
+                        offset += len(data)
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)     # 上次未正常關閉留下的 socket 檔
+        self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='twstock-feed', daemon=True).start()
+
+    def close(self):
+        with self.changed:
+            self.closed = True
+            self.changed.notify_all()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+        self.file.close()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='輸出 DailyCsvPipeline 的新資料列 feed')
+    parser.add_argument('--root', default=ROOT_FOLDER, help='日成交資料根資料夾')
+    parser.add_argument('--offset', type=int, default=0, help='起始 offset（上次輸出的 next_offset）')
+    parser.add_argument('--socket', action='store_true', help='經 Unix socket 即時接收（爬蟲需開啟 FEED_SOCKET）')
+    parser.add_argument('--follow', action='store_true', help='讀完後持續輪詢 feed 檔')
+    args = parser.parse_args(argv)
+    path, socket_path = feed_paths(args.root)
+    if args.socket:
+        batches = subscribe(socket_path, args.offset)
+    elif args.follow:
+        batches = tail(path, args.offset)
+    else:
+        batches = read_all(path, args.offset)
+    try:
+        for rows, offset in batches:
+            for row in rows:
+                print(json.dumps(row, ensure_ascii=False))
+            print(json.dumps({'next_offset': offset}))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# frontier.py: 多個爬蟲程序共用的工作佇列（本機 SQLite 檔案）
+import os
+import socket
+import sqlite3
+import time
+
+
+def task_id(market, code, year_month):
+    return f"{market}:{code}:{year_month}"
+
+
+class Frontier:
+    """
+    (市場, 股票, 月份) 工作佇列，任意數量的 worker 共用同一個 SQLite 檔：
+
+    - add:   寫入規劃出的工作（已存在的工作不重複寫入；前一天以前完成的工作重新排入）
+    - lease: 取得一批工作並設定可見逾時，逾時未確認的工作會再被其他 worker 取得
+    - ack:   確認完成
+    - nack:  失敗，立即放回佇列；超過 max_attempts 次改為 dead 不再發出
+
+    狀態：pending / leased / done / dead
+    """
+
+    SCHEMA = [
+        """
+        CREATE TABLE IF NOT EXISTS tasks (
+            task_id       TEXT PRIMARY KEY,
+            market        TEXT NOT NULL,
+            code          TEXT NOT NULL,
+            name          TEXT NOT NULL,
+            year_month    TEXT NOT NULL,
+            state         TEXT NOT NULL DEFAULT 'pending',
+            worker        TEXT,
+            lease_expires REAL NOT NULL DEFAULT 0,
+            attempts      INTEGER NOT NULL DEFAULT 0,
+            last_error    TEXT,
+            seeded_on     TEXT NOT NULL,
+            updated_at    REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_tasks_state ON tasks (state, lease_expires)",
+    ]
+
+    # 同一工作已存在時：前一天以前完成（或放棄）的工作重新排入，其餘保持原狀
+    SEED = """
+        INSERT INTO tasks (task_id, market, code, name, year_month, seeded_on, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (task_id) DO UPDATE SET
+            state = 'pending', attempts = 0, worker = NULL, lease_expires = 0,
+            seeded_on = excluded.seeded_on, updated_at = excluded.updated_at
+        WHERE tasks.state IN ('done', 'dead') AND tasks.seeded_on < excluded.seeded_on
+    """
+
+    def __init__(self, path, visibility_timeout=600, max_attempts=5, worker=None):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # 多個程序同時寫入時等待鎖定，而不是立即失敗
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in self.SCHEMA:
+            self.conn.execute(statement)
+
+    def add(self, tasks, seeded_on):
+        """tasks 為 (market, code, name, year_month)；seeded_on 為 YYYYMMDD，回傳新排入的工作數"""
+        now = time.time()
+        before = self.conn.total_changes
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.conn.executemany(self.SEED, (
+                (task_id(market, code, ym), market, code, name, ym, seeded_on, now)
+                for market, code, name, ym in tasks
+            ))
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return self.conn.total_changes - before
+
+    def lease(self, limit):
+        """取得最多 limit 個 pending 或租約已逾時的工作，依寫入順序回傳 dict"""
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = self.conn.execute(
+                """
+                SELECT task_id, market, code, name, year_month, attempts FROM tasks
+                WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?)
+                ORDER BY rowid LIMIT ?
+                """,
+                (now, limit),
+            ).fetchall()
+            self.conn.executemany(
+                """
+                UPDATE tasks SET state = 'leased', worker = ?, lease_expires = ?,
+                                 attempts = attempts + 1, updated_at = ?
+                WHERE task_id = ?
+                """,
+                ((self.worker, now + self.visibility_timeout, now, row[0]) for row in rows),
+            )
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return [
+            {'task_id': r[0], 'market': r[1], 'code': r[2], 'name': r[3],
+             'year_month': r[4], 'attempts': r[5] + 1}
+            for r in rows
+        ]
+
+    def ack(self, task_id):
+        """只確認自己仍持有租約的工作，避免覆寫已被其他 worker 重新取得的工作"""
+        self.conn.execute(
+            "UPDATE tasks SET state = 'done', lease_expires = 0, updated_at = ? "
+            "WHERE task_id = ? AND state = 'leased' AND worker = ?",
+            (time.time(), task_id, self.worker),
+        )
+
+    def nack(self, task_id, error=None):
+        self.conn.execute(
+            """
+            UPDATE tasks SET
+                state = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END,
+                lease_expires = 0, last_error = ?, updated_at = ?
+            WHERE task_id = ? AND state = 'leased' AND worker = ?
+            """,
+            (self.max_attempts, error, time.time(), task_id, self.worker),
+        )
+
+    def counts(self):
+        """各狀態的工作數；租約已逾時的 leased 工作計入 expired"""
+        now = time.time()
+        counts = dict(self.conn.execute('SELECT state, COUNT(*) FROM tasks GROUP BY state'))
+        counts['expired'] = self.conn.execute(
+            "SELECT COUNT(*) FROM tasks WHERE state = 'leased' AND lease_expires < ?", (now,)
+        ).fetchone()[0]
+        return counts
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,91 @@
+# holidays.py: 由 TWSE 市場開休市日期表產生休市日清單（休市日期.json，供 TradingCalendar 使用）
+#
+# 用法：
+#   from twstock.holidays import fetch_holidays
+#   fetch_holidays(2024)                        # ['20240101', '20240205', ...]
+#
+#   scrapy holidays [--years 2024 2025]         # 命令列更新（預設今年與去年，見 twstock/commands/holidays.py）
+import json
+import os
+import re
+import time
+import urllib.error
+import urllib.request
+
+PACKAGE_FOLDER = os.path.dirname(os.path.abspath(__file__))
+HOLIDAYS_PATH = os.path.join(PACKAGE_FOLDER, '休市日期.json')
+
+# 市場開休市日期（每年一份，欄位為 名稱、日期、說明）
+SCHEDULE_URL = 'https://www.twse.com.tw/rwd/zh/holidaySchedule/holidaySchedule?date={year}0101&response=json'
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) twstock-holidays'
+
+
+def parse_date(value):
+    """'2024-01-01'、'113/01/01'、'1130101' -> '20240101'；無法解析時為 None"""
+    digits = re.sub(r'\D', '', str(value))
+    if len(digits) == 7:
+        digits = f"{int(digits[:3]) + 1911}{digits[3:]}"
+    return digits if len(digits) == 8 else None
+
+
+def parse_schedule(payload):
+    """
+    開休市日期表 -> 休市日（YYYYMMDD）。
+    表中也列出「開始交易」「最後交易日」等交易日，名稱含「交易」但不含「無交易」的列不算休市；
+    「市場無交易，僅辦理結算交割作業」的日期不交易，算休市。
+    """
+    holidays = set()
+    for row in payload.get('data') or []:
+        if len(row) < 2:
+            continue
+        name = str(row[0])
+        if '交易' in name and '無交易' not in name:
+            continue
+        date = parse_date(row[1])
+        if date:
+            holidays.add(date)
+    return sorted(holidays)
+
+
+def fetch_holidays(year, timeout=15.0, retries=3):
+    """下載某年度的休市日"""
+    request = urllib.request.Request(SCHEDULE_URL.format(year=year), headers={'User-Agent': USER_AGENT})
+    error = None
+    for attempt in range(retries):
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                payload = json.loads(response.read().decode('utf-8-sig'))
+            if payload.get('stat') not in (None, 'ok', 'OK'):
+                raise ValueError(f"stat={payload.get('stat')}")
+            return parse_schedule(payload)
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            error = e
+        if attempt + 1 < retries:
+            time.sleep(2 ** attempt)
+    raise error
+
+
+def load_holidays(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return sorted(str(d) for d in json.load(f))
+    except FileNotFoundError:
+        return []
+
+
+def update(path, years):
+    """下載各年度的休市日，取代檔案中這些年度的日期（其他年度保留），回傳 {年度: 筆數}"""
+    prefixes = {str(year) for year in years}
+    kept = [d for d in load_holidays(path) if d[:4] not in prefixes]
+    counts, fetched = {}, []
+    for year in years:
+        days = fetch_holidays(year)
+        counts[year] = len(days)
+        fetched += days
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(sorted(set(kept + fetched)), f, indent=2)
+    os.replace(tmp_path, path)
+    return counts
+
@@ -0,0 +1,163 @@
+# httpcache.py: 依 (端點, 股票代號, 期間) 快取 TWSE / TPEX 回應
+import gzip
+import json
+import os
+from datetime import datetime
+from urllib.parse import parse_qs, urlparse
+
+from scrapy.downloadermiddlewares.httpcache import HttpCacheMiddleware
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+
+from twstock.parsing import loads
+
+# 每個端點的查詢期間：個股端點回傳整個月份，全市場端點只回傳單日
+MONTHLY_ENDPOINTS = {'STOCK_DAY', 'tradingStock'}
+DAILY_ENDPOINTS = {'MI_INDEX', 'otc'}
+
+# 快取寫入時間，存於還原後回應的 header 中
+CACHED_AT_HEADER = 'X-Twstock-Cached-At'
+
+
+def request_cache_key(request):
+    """
+    由請求取得快取鍵 (endpoint, code, period)：
+    個股端點 period 為 YYYYMM，全市場端點 period 為 YYYYMMDD、code 為 'ALL'。
+    非 TWSE / TPEX 日成交端點回傳 None。
+    """
+    parsed = urlparse(request.url)
+    endpoint = parsed.path.rstrip('/').rsplit('/', 1)[-1]
+    if endpoint not in MONTHLY_ENDPOINTS and endpoint not in DAILY_ENDPOINTS:
+        return None
+    params = parse_qs(parsed.query)
+    if request.method == 'POST' and request.body:
+        params.update(parse_qs(request.body.decode('utf-8', 'replace')))
+    date = (params.get('date') or [''])[0].replace('/', '')
+    if len(date) != 8 or not date.isdigit():
+        return None
+    if endpoint in DAILY_ENDPOINTS:
+        return endpoint, 'ALL', date
+    code = (params.get('stockNo') or params.get('code') or [''])[0]
+    if not code:
+        return None
+    return endpoint, code, date[:6]
+
+
+def has_rows(body):
+    """
+    回應為 stat OK 且至少有一列資料：個股端點的 data、上櫃的 tables[].data，或舊版 MI_INDEX 的 dataN。
+    查無資料、錯誤訊息或被限速時的回應同樣是 HTTP 200，不可快取
+    """
+    try:
+        payload = loads(body)
+    except ValueError:
+        return False
+    if not isinstance(payload, dict) or str(payload.get('stat', '')).upper() != 'OK':
+        return False
+    if any(isinstance(t, dict) and t.get('data') for t in payload.get('tables') or []):
+        return True
+    return any(k.startswith('data') and isinstance(v, list) and v for k, v in payload.items())
+
+
+class ClosedPeriodPolicy:
+    """
+    快取策略：
+    - 只快取 stat OK 且有資料列的 200 回應（has_rows）
+    - 期間（月份或交易日）結束後才抓取的回應永久有效
+    - 期間尚未結束時抓取的回應（例如當月資料）每次都重新下載；
+      下載失敗時沿用快取
+    - HTTPCACHE_REPLAY 開啟時一律使用快取
+    """
+
+    def __init__(self, settings):
+        self.replay = settings.getbool('HTTPCACHE_REPLAY')
+
+    def should_cache_request(self, request):
+        return request_cache_key(request) is not None
+
+    def should_cache_response(self, response, request):
+        return response.status == 200 and has_rows(response.body)
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        if self.replay:
+            return True
+        key = request_cache_key(request)
+        cached_at = cachedresponse.headers.get(CACHED_AT_HEADER)
+        if key is None or not cached_at:
+            return False
+        # 抓取時間晚於期間結束，代表資料已不會再變動
+        cached_period = cached_at.decode()[:len(key[2])]
+        return cached_period > key[2]
+
+    def is_cached_response_valid(self, cachedresponse, response, request):
+        # 重新下載成功則以新回應取代；伺服器錯誤時沿用快取
+        return response.status != 200
+
+
+class PeriodCacheStorage:
+    """
+    快取儲存：<HTTPCACHE_DIR>/<spider>/<endpoint>/<code>/<period>.json.gz
+
+    gzip 檔內第一行為中繼資料（url、狀態碼、headers、寫入時間），其後為原始回應內容。
+    """
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings['HTTPCACHE_DIR'], createdir=True)
+
+    def open_spider(self, spider):
+        spider.logger.debug(f"HTTP 快取目錄: {self.cachedir}")
+
+    def close_spider(self, spider):
+        pass
+
+    def _path(self, spider, request):
+        endpoint, code, period = request_cache_key(request)
+        return os.path.join(self.cachedir, spider.name, endpoint, code, f"{period}.json.gz")
+
+    def retrieve_response(self, spider, request):
+        path = self._path(spider, request)
+        try:
+            with gzip.open(path, 'rb') as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, EOFError):
+            spider.logger.warning(f"⚠️ 快取檔損毀，將重新下載: {path}")
+            return None
+        headers = Headers(meta['headers'])
+        headers[CACHED_AT_HEADER] = meta['cached_at']
+        respcls = responsetypes.from_args(headers=headers, url=meta['url'], body=body)
+        return respcls(url=meta['url'], headers=headers, status=meta['status'], body=body)
+
+    def store_response(self, spider, request, response):
+        path = self._path(spider, request)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        meta = {
+            'url': request.url,
+            'status': response.status,
+            'headers': {
+                k.decode('latin-1'): [v.decode('latin-1') for v in vs]
+                for k, vs in response.headers.items()
+                if k.decode('latin-1') != CACHED_AT_HEADER
+            },
+            'cached_at': datetime.now().strftime('%Y%m%d%H%M%S'),
+        }
+        tmp_path = path + '.tmp'
+        with gzip.open(tmp_path, 'wb') as f:
+            f.write(json.dumps(meta, ensure_ascii=False).encode('utf-8') + b'\n')
+            f.write(response.body)
+        os.replace(tmp_path, path)
+
+
+class TwstockHttpCacheMiddleware(HttpCacheMiddleware):
+    """
+    HTTPCACHE_REPLAY 開啟時，快取中沒有的請求直接忽略，整個爬取不連網；
+    這些請求以 IgnoreRequest 進入 errback，DailySpider 不寫入失敗紀錄（見 handle_error）
+    """
+
+    def __init__(self, settings, stats):
+        super().__init__(settings, stats)
+        if settings.getbool('HTTPCACHE_REPLAY'):
+            self.ignore_missing = True
@@ -0,0 +1,345 @@
+# indicators.py: 以 NumPy 陣列（股票 × 交易日）批次計算衍生指標，增量更新並存於原始資料旁
+#
+# 用法：
+#   from twstock.indicators import IndicatorEngine
+#   engine = IndicatorEngine()          # 預設讀取 個股日成交資訊/
+#   engine.update()                     # 只重讀有變動的月檔，只重算受影響的交易日
+#   engine.series('2330', '上市', 'ma20')
+import csv
+import json
+import os
+import time
+
+from twstock.archive import ArchiveManifest
+from twstock.parsing import parse_csv_row, price_to_float
+from twstock.storage import ARCHIVE_FOLDER, ROOT_FOLDER, iter_month_files
+
+try:
+    import numpy as np
+except ImportError:  # numpy 為選用相依套件
+    np = None
+
+INDICATORS_FOLDER = '.indicators'
+
+# 原始資料欄位：價格類為 float64（缺值 NaN），數量類為 int64（缺值 0）
+PRICE_COLUMNS = ('open', 'high', 'low', 'close', 'change')
+COUNT_COLUMNS = ('volume', 'amount', 'transactions')
+
+# 台股升降單位（價格區間上界, 跳動點）
+TICK_SIZES = ((10, 0.01), (50, 0.05), (100, 0.1), (500, 0.5), (1000, 1.0))
+LIMIT_RATIO = 0.10
+EPS = 1e-6
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError('twstock.indicators 需要安裝 numpy')
+
+
+def tick_size(prices):
+    """各價格對應的升降單位（1000 元以上為 5 元）"""
+    conditions = [prices < bound for bound, _ in TICK_SIZES]
+    return np.select(conditions, [tick for _, tick in TICK_SIZES], default=5.0)
+
+
+def limit_prices(reference):
+    """漲停 / 跌停價：參考價 ±10% 後依升降單位向內取整"""
+    up_raw = reference * (1 + LIMIT_RATIO)
+    down_raw = reference * (1 - LIMIT_RATIO)
+    up_tick, down_tick = tick_size(up_raw), tick_size(down_raw)
+    up = np.floor(up_raw / up_tick + EPS) * up_tick
+    down = np.ceil(down_raw / down_tick - EPS) * down_tick
+    return up, down
+
+
+def rolling_mean(values, window):
+    """沿交易日方向的移動平均；視窗內任一日缺值時為 NaN"""
+    valid = ~np.isnan(values)
+    zeros = np.zeros((values.shape[0], 1))
+    sums = np.concatenate([zeros, np.cumsum(np.where(valid, values, 0.0), axis=1)], axis=1)
+    counts = np.concatenate([zeros, np.cumsum(valid, axis=1)], axis=1)
+    out = np.full(values.shape, np.nan)
+    if values.shape[1] >= window:
+        total = sums[:, window:] - sums[:, :-window]
+        count = counts[:, window:] - counts[:, :-window]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[:, window - 1:] = np.where(count == window, total / window, np.nan)
+    return out
+
+
+def compute(panel, windows, start=0):
+    """
+    計算 panel[:, start:] 的指標（start 之前的資料只作為移動平均的回看）：
+    - ret:        日報酬，收盤 / 參考價（收盤 - 漲跌價差）- 1；除權息（X）日為 NaN
+    - ma<n>:      n 日收盤移動平均
+    - vwap:       成交金額 / 成交股數
+    - limit_up / limit_down: 收盤價觸及漲停 / 跌停價
+    """
+    lookback = max(windows) - 1
+    lo = max(0, start - lookback)
+    close = panel['close'][:, lo:]
+    change = panel['change'][:, lo:]
+    ex_rights = panel['ex_rights'][:, lo:]
+    reference = close - change
+    comparable = ~np.isnan(close) & ~np.isnan(change) & ~ex_rights & (reference > 0)
+    safe_reference = np.where(comparable, reference, 1.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = {'ret': np.where(comparable, close / safe_reference - 1, np.nan)}
+        for n in windows:
+            result[f'ma{n}'] = rolling_mean(close, n)
+        volume = panel['volume'][:, lo:]
+        result['vwap'] = np.where(volume > 0, panel['amount'][:, lo:] / np.maximum(volume, 1), np.nan)
+        up, down = limit_prices(safe_reference)
+    result['limit_up'] = comparable & (close >= up - EPS)
+    result['limit_down'] = comparable & (close <= down + EPS)
+    skip = start - lo
+    return {
+        name: (values[:, skip:] if values.dtype == bool else values[:, skip:].astype(np.float32))
+        for name, values in result.items()
+    }
+
+
+def _save_npz(path, arrays):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+class IndicatorEngine:
+    """
+    讀取 '<root>/<代碼>_<名稱>_<市場>/<YYYYMM>.csv'，維護 (股票 × 交易日) 陣列與指標，
+    存於 '<root>/.indicators/'：
+
+    - panel.npz:      原始資料陣列（codes, markets, names, dates 與各欄位）
+    - indicators.npz: 指標陣列，形狀與 panel 相同
+    - manifest.json:  已讀取的月檔大小與歸檔 sha256；update() 只重讀有變動的月檔與歸檔，
+                      並只重算最早變動日之後（含移動平均回看）的交易日
+    """
+
+    def __init__(self, root=ROOT_FOLDER, windows=(5, 20, 60)):
+        require_numpy()
+        self.root = root
+        self.windows = tuple(sorted(windows))
+        self.folder = os.path.join(root, INDICATORS_FOLDER)
+        self.panel = None
+        self.indicators = None
+        self.manifest = {}
+
+    # ---- 讀寫 ----
+
+    def load(self):
+        """載入已保存的陣列；不存在或指標設定不同時回傳 False"""
+        try:
+            with open(os.path.join(self.folder, 'manifest.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+            if tuple(meta.get('windows', ())) != self.windows:
+                return False
+            with np.load(os.path.join(self.folder, 'panel.npz')) as data:
+                self.panel = {k: data[k] for k in data.files}
+            with np.load(os.path.join(self.folder, 'indicators.npz')) as data:
+                self.indicators = {k: data[k] for k in data.files}
+        except (FileNotFoundError, ValueError, KeyError, OSError):
+            self.panel = self.indicators = None
+            return False
+        self.manifest = meta['files']
+        return True
+
+    def save(self):
+        os.makedirs(self.folder, exist_ok=True)
+        _save_npz(os.path.join(self.folder, 'panel.npz'), self.panel)
+        _save_npz(os.path.join(self.folder, 'indicators.npz'), self.indicators)
+        tmp_path = os.path.join(self.folder, 'manifest.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'windows': list(self.windows), 'files': self.manifest}, f,
+                      ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, os.path.join(self.folder, 'manifest.json'))
+
+    # ---- 掃描月檔 ----
+
+    def scan(self, archive):
+        """
+        找出新增或大小改變的月檔與內容改變的歸檔，回傳 ({相對路徑: 大小或 sha256}, [(代碼, 市場, 名稱, 路徑)])；
+        歸檔的市場、名稱、路徑為 None，排在月檔之前
+        """
+        sizes, changed = {}, []
+        for code, entry in archive.stocks.items():
+            rel = f"{ARCHIVE_FOLDER}/{code}.csv.gz"
+            sizes[rel] = entry['sha256']
+            if self.manifest.get(rel) != entry['sha256']:
+                changed.append((code, None, None, None))
+        for rel, size, code, market, stock_name, path in iter_month_files(self.root):
+            sizes[rel] = size
+            if self.manifest.get(rel) != size:
+                changed.append((code, market, stock_name, path))
+        return sizes, changed
+
+    @staticmethod
+    def parse_row(r):
+        """
+        CSV 資料列 -> (日期, open, high, low, close, change, ex_rights, volume, amount, transactions)；
+        價格類轉為 float（缺值 NaN），數量類缺值為 0，不是資料列時回傳 None
+        """
+        parsed = parse_csv_row(r)
+        if parsed is None:
+            return None
+        date, *prices, ex_rights, volume, amount, transactions = parsed
+        return (
+            date, *(price_to_float(p) for p in prices), ex_rights,
+            volume or 0, amount or 0, transactions or 0,
+        )
+
+    @classmethod
+    def read_rows(cls, path):
+        """讀取月檔，回傳 parse_row 格式的資料列"""
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            rows = (cls.parse_row(r) for r in csv.reader(f))
+            return [row for row in rows if row is not None]
+
+    def read_archive(self, archive, code):
+        """讀取歸檔（twstock.archive），依市場分組回傳 [(代碼, 市場, 名稱, 資料列)]"""
+        groups = {}
+        for market, r in archive.iter_rows(code):
+            group = groups.setdefault(market, [r[1], []])
+            group[0] = r[1]         # 依日期排序，最後一列為最新名稱
+            row = self.parse_row(r)
+            if row is not None:
+                group[1].append(row)
+        return [(code, market, name, rows) for market, (name, rows) in groups.items()]
+
+    # ---- 更新 ----
+
+    def empty_panel(self):
+        panel = {
+            'codes': np.array([], dtype='U8'), 'markets': np.array([], dtype='U2'),
+            'names': np.array([], dtype='U16'), 'dates': np.array([], dtype=np.int64),
+            'ex_rights': np.zeros((0, 0), dtype=bool),
+        }
+        for name in PRICE_COLUMNS:
+            panel[name] = np.zeros((0, 0))
+        for name in COUNT_COLUMNS:
+            panel[name] = np.zeros((0, 0), dtype=np.int64)
+        return panel
+
+    def update(self, full=False):
+        """
+        讀取有變動的月檔並更新陣列與指標，回傳統計：
+        files（重讀的月檔數）、rows、stocks、dates、recomputed_from（重算起始日，None 為未重算）、seconds
+        """
+        started = time.perf_counter()
+        if full or not self.load():
+            self.panel, self.indicators, self.manifest = self.empty_panel(), None, {}
+        archive = ArchiveManifest.load(self.root)
+        sizes, changed = self.scan(archive)
+
+        parsed = []
+        for code, market, name, path in changed:
+            if path is None:
+                parsed.extend(self.read_archive(archive, code))
+            else:
+                parsed.append((code, market, name, self.read_rows(path)))
+        rows_read = sum(len(rows) for *_, rows in parsed)
+        start = self.merge(parsed)
+        if start is not None:
+            self.recompute(start)
+        # 已被移走（例如歸檔）的月檔不影響既有陣列
+        self.manifest = sizes
+        self.save()
+        dates = self.panel['dates']
+        return {
+            'files': len(changed),
+            'rows': rows_read,
+            'stocks': len(self.panel['codes']),
+            'dates': len(dates),
+            'recomputed_from': int(dates[start]) if start is not None and len(dates) else None,
+            'seconds': round(time.perf_counter() - started, 3),
+        }
+
+    def merge(self, parsed):
+        """把新讀取的資料列併入 panel，回傳最早變動的交易日欄位索引（無變動時為 None）"""
+        panel = self.panel
+        if not any(rows for *_, rows in parsed):
+            return None
+        keys = {(c, m): i for i, (c, m) in enumerate(zip(panel['codes'], panel['markets']))}
+        codes, markets, names = list(panel['codes']), list(panel['markets']), list(panel['names'])
+        for code, market, name, _ in parsed:
+            idx = keys.get((code, market))
+            if idx is None:
+                keys[(code, market)] = len(codes)
+                codes.append(code)
+                markets.append(market)
+                names.append(name)
+            else:
+                names[idx] = name
+
+        old_dates = panel['dates']
+        new_dates = np.array(sorted({row[0] for *_, rows in parsed for row in rows}), dtype=np.int64)
+        dates = np.union1d(old_dates, new_dates)
+        n_old, n_rows = len(old_dates), len(codes)
+        first = None
+
+        # 交易日或股票增加時重新配置陣列，舊資料依新的欄位位置搬移
+        if len(dates) != n_old or n_rows != len(panel['codes']):
+            cols = np.searchsorted(dates, old_dates)
+            inserted = np.setdiff1d(np.arange(len(dates)), cols)
+            if len(inserted):
+                first = int(inserted[0])
+            resized = {}
+            for name in PRICE_COLUMNS + COUNT_COLUMNS + ('ex_rights',):
+                old = panel[name]
+                fill = np.nan if old.dtype.kind == 'f' else 0
+                arr = np.full((n_rows, len(dates)), fill, dtype=old.dtype)
+                arr[:old.shape[0], cols] = old
+                resized[name] = arr
+            panel.update(resized)
+            if self.indicators is not None:
+                for name, old in self.indicators.items():
+                    arr = np.full((n_rows, len(dates)), False if old.dtype == bool else np.nan, dtype=old.dtype)
+                    arr[:old.shape[0], cols] = old
+                    self.indicators[name] = arr
+        panel['codes'] = np.array(codes)
+        panel['markets'] = np.array(markets)
+        panel['names'] = np.array(names)
+        panel['dates'] = dates
+
+        # 以向量化方式寫入各資料列
+        row_idx, records = [], []
+        for code, market, _, rows in parsed:
+            r = keys[(code, market)]
+            row_idx.extend([r] * len(rows))
+            records.extend(rows)
+        if not records:
+            return first
+        row_idx = np.array(row_idx)
+        columns = list(zip(*records))
+        col_idx = np.searchsorted(dates, np.array(columns[0], dtype=np.int64))
+        for pos, name in enumerate(('open', 'high', 'low', 'close', 'change'), start=1):
+            panel[name][row_idx, col_idx] = columns[pos]
+        panel['ex_rights'][row_idx, col_idx] = columns[6]
+        for pos, name in enumerate(COUNT_COLUMNS, start=7):
+            panel[name][row_idx, col_idx] = columns[pos]
+        changed_first = int(col_idx.min())
+        return changed_first if first is None else min(first, changed_first)
+
+    def recompute(self, start):
+        """重算 start 欄之後的指標（第一次建立時為全部）"""
+        if self.indicators is None:
+            start = 0
+        values = compute(self.panel, self.windows, start)
+        if self.indicators is None:
+            self.indicators = values
+            return
+        for name, arr in values.items():
+            self.indicators[name][:, start:] = arr
+
+    # ---- 查詢 ----
+
+    def series(self, code, market, name):
+        """單一股票的 (dates, 值)；name 為指標名稱或原始欄位（close、volume 等）"""
+        if self.panel is None and not self.load():
+            raise FileNotFoundError(f"尚未建立指標，請先執行 update(): {self.folder}")
+        match = np.nonzero((self.panel['codes'] == code) & (self.panel['markets'] == market))[0]
+        if not len(match):
+            raise KeyError(f"{market} {code}")
+        source = self.indicators if name in self.indicators else self.panel
+        return self.panel['dates'], source[name][match[0]]
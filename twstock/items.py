@@ -1,6 +1,10 @@
 import scrapy
+from dataclasses import dataclass
+from typing import Optional
+from twstock.parsing import parse_change, parse_int, parse_price
 
 class DailyItem(scrapy.Item):
+    # 字串欄位版本；DailySpider 改為產生 DailyRecord，pipeline 兩者皆可處理
     stock_no        = scrapy.Field()  # 股票代號
     stock_name      = scrapy.Field()  # 股票名稱
     market_tag      = scrapy.Field()  # 市場標籤："上市" 或 "上櫃"
@@ -13,3 +17,89 @@ class DailyItem(scrapy.Item):
     close_price     = scrapy.Field()  # 收盤價
     change          = scrapy.Field()  # 漲跌價差
     transactions    = scrapy.Field()  # 成交筆數
+
+
+@dataclass
+class DailyRecord:
+    """
+    型別化的日成交資料（DailySpider 實際產生的 item）
+
+    以 __slots__ 儲存，數值在解析時即轉換完成：
+    股數、金額、筆數為整數；價格與漲跌為 PRICE_SCALE 定點整數（1050.00 -> 105000），
+    無成交時價格為 None；日期為整數 YYYYMMDD。
+    """
+    __slots__ = (
+        'stock_no', 'stock_name', 'market_tag', 'date',
+        'volume_shares', 'turnover_amount',
+        'open_price', 'high_price', 'low_price', 'close_price',
+        'change', 'ex_rights', 'transactions',
+    )
+    stock_no: str
+    stock_name: str
+    market_tag: str
+    date: int
+    volume_shares: int
+    turnover_amount: int
+    open_price: Optional[int]
+    high_price: Optional[int]
+    low_price: Optional[int]
+    close_price: Optional[int]
+    change: Optional[int]
+    ex_rights: bool
+    transactions: Optional[int]
+
+    @property
+    def year_month(self):
+        """'YYYYMM' 字串，對應月檔名稱"""
+        return str(self.date // 100)
+
+    @classmethod
+    def from_item(cls, item):
+        """由字串欄位的 DailyItem（或 dict）轉換"""
+        change, ex_rights = parse_change(item.get('change', ''))
+        return cls(
+            stock_no=item['stock_no'],
+            stock_name=item.get('stock_name', ''),
+            market_tag=item['market_tag'],
+            date=int(item['date']),
+            volume_shares=parse_int(item.get('volume_shares', '')),
+            turnover_amount=parse_int(item.get('turnover_amount', '')),
+            open_price=parse_price(item.get('open_price', '')),
+            high_price=parse_price(item.get('high_price', '')),
+            low_price=parse_price(item.get('low_price', '')),
+            close_price=parse_price(item.get('close_price', '')),
+            change=change,
+            ex_rights=ex_rights,
+            transactions=parse_int(item.get('transactions', '')),
+        )
+
+
+def as_record(item):
+    """pipeline 共用：DailyRecord 直接回傳，DailyItem 則轉換為 DailyRecord"""
+    if isinstance(item, DailyRecord):
+        return item
+    return DailyRecord.from_item(item)
+
+
+@dataclass
+class TickBatch:
+    """
+    IntradaySpider 一個請求（一批股票）的盤中快照，由 IntradayPipeline 寫入並統計延遲。
+
+    status 為 'changed'（rows 為內容有變動的資料列）、'unchanged'（內容雜湊與上次相同，rows 為空）
+    或 'failed'；時間皆為 epoch 秒，exchange_time 為資料列中最新的交易所時間戳（毫秒，無資料時為 0）。
+    """
+    __slots__ = (
+        'poll', 'requests', 'scheduled', 'session_date', 'batch', 'status', 'rows',
+        'download_latency', 'received_at', 'exchange_time',
+    )
+    poll: int
+    requests: int
+    scheduled: float
+    session_date: str
+    batch: int
+    status: str
+    rows: list
+    download_latency: float
+    received_at: float
+    exchange_time: int
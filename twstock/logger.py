@@ -1,5 +1,98 @@
+import atexit
+import json
+import logging
 import os
+import re
+import threading
+import time
 from datetime import datetime
+
+# 日誌寫入緩衝：由背景執行緒每 FLUSH_INTERVAL 秒統一寫出，避免每筆日誌都開關檔案
+FLUSH_INTERVAL = 1.0
+
+
+class BufferedLogWriter:
+    """單一日誌檔的寫入緩衝，檔案保持開啟，寫出時才取用鎖"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lines = []
+        self.lock = threading.Lock()
+        self.file = None
+
+    def write(self, line):
+        with self.lock:
+            self.lines.append(line)
+
+    def flush(self):
+        with self.lock:
+            lines, self.lines = self.lines, []
+            if not lines:
+                return
+            if self.file is None:
+                self.file = open(self.path, "a", encoding="utf-8")
+            self.file.writelines(lines)
+            self.file.flush()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+_flush_thread = None
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush_logs()
+
+
+def level_number(level):
+    """日誌等級 -> 數值：'info'、'INFO'、'20'、20 皆為 20；未知的等級名稱引發 ValueError"""
+    if isinstance(level, str):
+        level = level.strip().upper()
+        if level.isdigit():
+            level = int(level)
+    return logging._checkLevel(level)
+
+
+def get_writer(path):
+    """取得（必要時建立）日誌檔的緩衝寫入器，並確保背景寫出執行緒已啟動"""
+    global _flush_thread
+    # 以絕對路徑為鍵：同一檔案以不同相對路徑（或切換工作目錄後）取得時共用同一個寫入器
+    path = os.path.abspath(path)
+    writer = _writers.get(path)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(path)
+            if writer is None:
+                writer = _writers[path] = BufferedLogWriter(path)
+            if _flush_thread is None:
+                _flush_thread = threading.Thread(target=_flush_loop, name="twstock-log-flush", daemon=True)
+                _flush_thread.start()
+    return writer
+
+
+def flush_logs(path=None):
+    """立即寫出緩衝中的日誌（未指定 path 時寫出全部）"""
+    writers = [_writers[path]] if path in _writers else ([] if path else list(_writers.values()))
+    for writer in writers:
+        writer.flush()
+
+
+def close_logs():
+    for writer in list(_writers.values()):
+        writer.close()
+
+
+atexit.register(close_logs)
+
 def init_log_file(folder_path):
     today = datetime.now().strftime("%Y-%m-%d")
     log_path = os.path.join(folder_path, f"{today}.txt")
@@ -11,6 +104,7 @@ def init_log_file(folder_path):
     return log_path
 
 def read_logged_errors(log_path):
+    flush_logs(log_path)
     if not os.path.exists(log_path):
         return set()
     with open(log_path, "r", encoding="utf-8") as f:
@@ -18,5 +112,88 @@ def read_logged_errors(log_path):
 
 def append_log(log_path, stock_no, stock_name, error_message=""):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open(log_path, "a", encoding="utf-8") as f:
-        f.write(f"[{timestamp}] Stock: {stock_no}_{stock_name} - Error: {error_message}\n")
+    get_writer(log_path).write(f"[{timestamp}] Stock: {stock_no}_{stock_name} - Error: {error_message}\n")
+
+def init_failure_journal(folder_path, date=None):
+    """失敗紀錄（JSON Lines），與文字日誌放在同一目錄：YYYY-MM-DD.failures.jsonl"""
+    date = date or datetime.now().strftime("%Y-%m-%d")
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path, exist_ok=True)
+    return os.path.join(folder_path, f"{date}.failures.jsonl")
+
+def failure_key(record):
+    """同一請求（種類, 市場, 代碼, 查詢日期）只保留最後一筆失敗紀錄"""
+    return (record.get("kind"), record.get("market"), record.get("code"), record.get("date"))
+
+def append_failure(journal_path, record):
+    record = dict(record, time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    with open(journal_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def read_failures(journal_path):
+    """讀取失敗紀錄，依請求去重後回傳 list（略過無法解析的行）"""
+    if not os.path.exists(journal_path):
+        return []
+    records = {}
+    with open(journal_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            records[failure_key(record)] = record
+    return list(records.values())
+
+def clear_failures(journal_path, keys):
+    """從失敗紀錄中移除已成功的請求（暫存檔 + os.replace 原子性改寫）"""
+    if not keys or not os.path.exists(journal_path):
+        return
+    records = read_failures(journal_path)
+    remaining = [r for r in records if failure_key(r) not in keys]
+    if len(remaining) == len(records):
+        return
+    tmp_path = journal_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in remaining:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, journal_path)
+
+def parse_logged_stock(line):
+    """從文字日誌行取出 (股票代號, 股票名稱)，格式不符回傳 None"""
+    match = re.match(r"\[[^\]]*\] Stock: ([^_\s]+)_(.*?) - Error: ", line)
+    return (match.group(1), match.group(2)) if match else None
+
+
+class EventLog:
+    """
+    結構化事件日誌（JSON Lines）：YYYY-MM-DD.events.jsonl
+
+    每個事件帶有事件類型、等級與欄位（股票代號、市場、端點、狀態碼、延遲、位元組數等），
+    經由緩衝寫入器寫出；levels 可針對各事件類型設定最低等級，低於門檻的事件直接捨棄。
+    """
+
+    def __init__(self, folder_path, levels=None, default_level="INFO"):
+        today = datetime.now().strftime("%Y-%m-%d")
+        os.makedirs(folder_path, exist_ok=True)
+        self.path = os.path.join(folder_path, f"{today}.events.jsonl")
+        self.default_level = level_number(default_level)
+        self.levels = {event: level_number(level) for event, level in (levels or {}).items()}
+        self.writer = get_writer(self.path)
+
+    @classmethod
+    def from_settings(cls, folder_path, settings):
+        return cls(
+            folder_path,
+            levels=settings.getdict("EVENT_LOG_LEVELS"),
+            default_level=settings.get("EVENT_LOG_DEFAULT_LEVEL", "INFO"),
+        )
+
+    def enabled(self, event, level="INFO"):
+        return level_number(level) >= self.levels.get(event, self.default_level)
+
+    def emit(self, event, level="INFO", **fields):
+        if not self.enabled(event, level):
+            return
+        record = {"ts": round(time.time(), 3), "event": event, "level": level}
+        record.update(fields)
+        self.writer.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
@@ -0,0 +1,114 @@
+# parsing.py: TWSE / TPEX 回傳欄位與月檔資料列的共用解析（JSON、數值、漲跌、民國日期）
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:  # 未安裝 orjson 時使用標準函式庫
+    orjson = None
+    import json
+
+# 價格以整數定點數儲存：1050.00 -> 105000
+PRICE_SCALE = 100
+
+# 月檔 / 歸檔資料列（twstock.storage.CSV_FIELDS 順序）的欄位數
+CSV_ROW_WIDTH = 11
+
+
+def loads(body):
+    """解析 JSON 回應（bytes 或 str），有安裝 orjson 時直接解析 bytes"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def parse_int(value):
+    """'1,234' -> 1234；'--'、空字串等無效值回傳 None"""
+    try:
+        return int(value.replace(',', ''))
+    except (ValueError, AttributeError):
+        return None
+
+
+def parse_price(value):
+    """
+    '1,050.00' -> 105000（PRICE_SCALE 定點數）；'--' 等無效值回傳 None。
+    超過兩位的小數四捨五入（盤中報價為 '1050.0000' 這類四位小數）：'10.505' -> 1051、'-10.505' -> -1051
+    """
+    if not value:
+        return None
+    text = value.replace(',', '').strip()
+    whole, _, frac = text.partition('.')
+    sign = -1 if whole.startswith('-') else 1
+    whole = whole.lstrip('+-')
+    if not whole.isdigit() or (frac and not frac.isdigit()):
+        return None
+    digits = (frac + '00')[:2]
+    rounding = 1 if frac[2:3] >= '5' else 0
+    return sign * (int(whole) * PRICE_SCALE + int(digits) + rounding)
+
+
+def parse_change(value):
+    """漲跌價差 '+1.50' / '-0.50' / ' 0.00' / 'X0.00'（除權息、不比價）-> (定點數, 是否為 X)"""
+    text = (value or '').strip()
+    ex_rights = text.startswith('X')
+    if ex_rights:
+        text = text[1:]
+    return parse_price(text), ex_rights
+
+
+def parse_csv_row(row):
+    """
+    月檔 / 歸檔的資料列（CSV_FIELDS 順序的字串）->
+    (日期, 開盤, 最高, 最低, 收盤, 漲跌, 是否為 X, 成交股數, 成交金額, 成交筆數)。
+    價格與漲跌為 PRICE_SCALE 定點數，'--' 與無法解析的欄位為 None；
+    欄位不足或日期不是 YYYYMMDD 的資料列（標題列、截斷的列）回傳 None。
+    舊版寫入的交易所原始字串（千分位、上櫃漲跌沒有 '+'）解析結果相同。
+    """
+    if len(row) < CSV_ROW_WIDTH or not row[2].isdigit():
+        return None
+    change, ex_rights = parse_change(row[9])
+    return (
+        int(row[2]), parse_price(row[5]), parse_price(row[6]), parse_price(row[7]), parse_price(row[8]),
+        change, ex_rights, parse_int(row[3]), parse_int(row[4]), parse_int(row[10]),
+    )
+
+
+@lru_cache(maxsize=8192)
+def roc_to_western(date_str):
+    """'113/06/03' -> 20240603（整數 YYYYMMDD）；格式錯誤回傳 None"""
+    parts = date_str.split('/')
+    if len(parts) != 3:
+        return None
+    try:
+        year, month, day = (int(p) for p in parts)
+    except ValueError:
+        return None
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return None
+    return (year + 1911) * 10000 + month * 100 + day
+
+
+def price_to_float(value):
+    """105000 -> 1050.0；None -> NaN"""
+    return float('nan') if value is None else value / PRICE_SCALE
+
+
+def format_price(value):
+    """105000 -> '1050.00'；None -> '--'"""
+    if value is None:
+        return '--'
+    sign = '-' if value < 0 else ''
+    whole, frac = divmod(abs(value), PRICE_SCALE)
+    return f"{sign}{whole}.{frac:02d}"
+
+
+def format_change(value, ex_rights=False):
+    """(150, False) -> '+1.50'；(-50, False) -> '-0.50'；(0, True) -> 'X0.00'；(-150, True) -> 'X-1.50'"""
+    if value is None:
+        return '--'
+    if ex_rights:
+        # 除權息的漲跌保留正負號，parse_change 才能還原
+        return 'X' + format_price(value)
+    if value > 0:
+        return '+' + format_price(value)
+    return format_price(value)
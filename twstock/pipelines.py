@@ -4,81 +4,795 @@
 # useful for handling different item types with a single interface
 import os
 import csv
-from datetime import datetime
+import json
+import sqlite3
+import time
+from collections import Counter, OrderedDict
+from datetime import date as date_type, datetime
+from decimal import Decimal
+from scrapy.exceptions import DropItem, NotConfigured
+from twisted.internet import defer
+from twstock import validation
+from twstock.items import DailyRecord, TickBatch, as_record
+from twstock.parsing import (
+    PRICE_SCALE, format_change, format_price, parse_change, parse_csv_row, parse_int, parse_price,
+)
+from twstock.archive import ArchiveManifest
+from twstock.feed import FeedWriter, feed_paths
+from twstock.signals import month_fetched
+from twstock.storage import ROOT_FOLDER, CSV_FIELDS, DateIndex, month_csv_path, repair_torn_tail
+from twstock.ticks import INTRADAY_FOLDER, TickWriter
+
+
+def _format_int(value):
+    return '--' if value is None else str(value)
+
+
+# CSV_FIELDS 各欄對應的 DailyItem 欄位
+_CSV_ITEM_KEYS = (
+    'stock_no', 'stock_name', 'date', 'volume_shares', 'turnover_amount',
+    'open_price', 'high_price', 'low_price', 'close_price', 'change', 'transactions',
+)
+
+
+def csv_row(record):
+    """DailyRecord -> CSV_FIELDS 順序的字串欄位（數值無千分位，漲跌帶正負號，無成交的價格寫入 '--'）"""
+    return [
+        record.stock_no, record.stock_name, str(record.date),
+        _format_int(record.volume_shares), _format_int(record.turnover_amount),
+        format_price(record.open_price), format_price(record.high_price),
+        format_price(record.low_price), format_price(record.close_price),
+        format_change(record.change, record.ex_rights), _format_int(record.transactions),
+    ]
+
+
+def csv_record(row, market_tag=''):
+    """
+    CSV_FIELDS 順序的字串欄位 -> DailyRecord（csv_row 的反向，欄位由 parse_csv_row 解析；舊版的原始字串同樣可解析）；
+    不是資料列時回傳 None
+    """
+    parsed = parse_csv_row(row)
+    if parsed is None:
+        return None
+    date, open_price, high_price, low_price, close_price, change, ex_rights, volume, amount, transactions = parsed
+    return DailyRecord(
+        stock_no=row[0], stock_name=row[1], market_tag=market_tag, date=date,
+        volume_shares=volume, turnover_amount=amount,
+        open_price=open_price, high_price=high_price, low_price=low_price, close_price=close_price,
+        change=change, ex_rights=ex_rights, transactions=transactions,
+    )
+
+
+def _normalize_field(key, value):
+    """
+    舊版的單一欄位 -> csv_row 的格式。只由 '-' 組成的無成交標記（'--'、'----'）統一為 '--'；
+    無法解析、或有超過兩位小數而無法精確表示的欄位保留原字串，改寫不會遺失任何資訊
+    """
+    text = value.strip()
+    if text and not text.strip('-'):
+        return '--'
+    if key in ('volume_shares', 'turnover_amount', 'transactions'):
+        number = parse_int(value)
+        return value if number is None else str(number)
+    if key == 'change':
+        number, ex_rights = parse_change(value)
+        formatted = format_change(number, ex_rights)
+        text = text.lstrip('X')
+    else:
+        number = parse_price(value)
+        formatted = format_price(number)
+    if number is None or Decimal(text.replace(',', '')) != _to_decimal(number):
+        return value
+    return formatted
+
+
+def normalize_csv_row(row):
+    """
+    舊版月檔的資料列（交易所原始字串：價格與筆數有千分位、上櫃漲跌沒有 '+'）-> csv_row 的格式；
+    已是新格式的資料列結果不變，日期不是 YYYYMMDD 的資料列原樣回傳
+    """
+    if len(row) < len(CSV_FIELDS) or not row[2].isdigit():
+        return row
+    fields = zip(_CSV_ITEM_KEYS[3:], row[3:len(CSV_FIELDS)])
+    return row[:3] + [_normalize_field(key, value) for key, value in fields]
+
+
+def _to_decimal(value):
+    """定點整數價格 -> Decimal（保留兩位小數）"""
+    return None if value is None else Decimal(value).scaleb(-2)
+
+
+def _to_float(value):
+    return None if value is None else value / PRICE_SCALE
+
+
+def _count(stats, pipeline, result, count=1):
+    """各 pipeline 的寫入統計（scrapy stats 'pipeline/<名稱>/<written|duplicate>'，供狀態端點使用）"""
+    if stats is not None and count:
+        stats.inc_value(f'pipeline/{pipeline}/{result}', count)
+
+
+
+class DailyValidationPipeline:
+    """
+    寫入前的資料品質檢查（需要 numpy）。item 先累積成批次（VALIDATION_BATCH_SIZE 筆，
+    或最早一筆等待超過 VALIDATION_MAX_DELAY 秒），再以向量化方式一次檢查（見 twstock.validation）：
+
+    - 單日檢查：價格缺值、最高 < 最低、開盤 / 收盤超出區間、成交均價與價格不符、千倍單位錯誤等
+    - 跨日檢查：收盤 - 漲跌 是否等於前一交易日收盤（歷史取自磁碟上的月檔與歸檔）、成交量千倍跳動
+
+    process_item 回傳 Deferred，批次檢查後才交給下一個 pipeline；VALIDATION_REJECT 中的原因會剔除該列
+    （DropItem），其他原因只標記。所有有問題的資料列連同原因代碼寫入 '<logs>/YYYY-MM-DD.quarantine.jsonl'，
+    結束時輸出各原因的次數到日誌、scrapy stats 與 '<logs>/YYYY-MM-DD.quality.json'。
+    有檢查點時先送出批次，資料列寫入後才記錄完成。
+    """
+
+    def __init__(self, batch_size=500, max_delay=0.5, reject=None, tolerance=0.01, unit_ratio=validation.UNIT_RATIO,
+                 history=True, stats=None):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.reject = set(validation.REJECT_REASONS if reject is None else reject)
+        self.tolerance = tolerance
+        self.unit_ratio = unit_ratio
+        self.use_history = history
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('VALIDATION_ENABLED', True):
+            raise NotConfigured
+        if validation.np is None:
+            raise NotConfigured('DailyValidationPipeline 需要安裝 numpy')
+        settings = crawler.settings
+        reject = settings.getlist('VALIDATION_REJECT') if settings.get('VALIDATION_REJECT') is not None else None
+        return cls(
+            batch_size=settings.getint('VALIDATION_BATCH_SIZE', 500),
+            max_delay=settings.getfloat('VALIDATION_MAX_DELAY', 0.5),
+            reject=reject,
+            tolerance=settings.getfloat('VALIDATION_AMOUNT_TOLERANCE', 0.01),
+            unit_ratio=settings.getfloat('VALIDATION_UNIT_RATIO', validation.UNIT_RATIO),
+            history=settings.getbool('VALIDATION_HISTORY', True),
+            stats=crawler.stats,
+        )
+
+    def open_spider(self, spider):
+        from twisted.internet import reactor
+        self.reactor = reactor
+        self.batch = []
+        self.timer = None
+        self.history = validation.History(getattr(spider, 'output_root', ROOT_FOLDER)) if self.use_history else None
+        self.counts = Counter()
+        self.reasons = Counter()
+        self.seconds = 0.0
+        self.logger = spider.logger
+        self.logs_folder = getattr(spider, 'logs_folder', os.path.join(ROOT_FOLDER, 'logs'))
+        os.makedirs(self.logs_folder, exist_ok=True)
+        today = datetime.now().strftime('%Y-%m-%d')
+        self.quarantine_path = os.path.join(self.logs_folder, f"{today}.quarantine.jsonl")
+        self.quality_path = os.path.join(self.logs_folder, f"{today}.quality.json")
+        self.quarantine = None
+        checkpoint = getattr(spider, 'checkpoint', None)
+        if checkpoint is not None:
+            checkpoint.add_hook(self.flush)
+
+    def process_item(self, item, spider):
+        d = defer.Deferred()
+        self.batch.append((item, d))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = self.reactor.callLater(self.max_delay, self.flush)
+        return d
+
+    def flush(self):
+        """檢查目前的批次並放行 / 剔除；放行的 item 會同步經過後續 pipeline，因此先取出批次再處理"""
+        if self.timer is not None:
+            if self.timer.active():
+                self.timer.cancel()
+            self.timer = None
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+        started = time.perf_counter()
+        records = [as_record(item) for item, _ in batch]
+        masks = validation.check_rows(records, self.tolerance, self.unit_ratio)
+        if self.history is not None:
+            masks.update(self.history.check(records))
+        flagged = validation.np.zeros(len(records), dtype=bool)
+        for mask in masks.values():
+            flagged |= mask
+        verdicts = []
+        for i, record in enumerate(records):
+            reasons = [name for name, mask in masks.items() if mask[i]] if flagged[i] else []
+            rejected = any(reason in self.reject for reason in reasons)
+            if not rejected and self.history is not None:
+                self.history.add(record)
+            verdicts.append((reasons, rejected))
+        self.seconds += time.perf_counter() - started
+
+        for (item, d), record, (reasons, rejected) in zip(batch, records, verdicts):
+            self.counts['checked'] += 1
+            if reasons:
+                self.reasons.update(reasons)
+                self.write_quarantine(record, reasons, rejected)
+            result = 'rejected' if rejected else 'flagged' if reasons else 'passed'
+            self.counts[result] += 1
+            _count(self.stats, 'validation', result)
+            if rejected:
+                d.errback(DropItem(f"資料檢查未通過 {record.stock_no} {record.date}: {','.join(reasons)}"))
+            else:
+                d.callback(item)
+        if self.quarantine is not None:
+            self.quarantine.flush()
+
+    def write_quarantine(self, record, reasons, rejected):
+        if self.quarantine is None:
+            self.quarantine = open(self.quarantine_path, 'a', encoding='utf-8')
+        row = {name: getattr(record, name) for name in record.__slots__}
+        self.quarantine.write(json.dumps({
+            'ts': round(time.time(), 3), 'action': 'rejected' if rejected else 'flagged',
+            'reasons': reasons, **row,
+        }, ensure_ascii=False) + '\n')
+
+    def close_spider(self, spider):
+        self.flush()
+        if self.quarantine is not None:
+            self.quarantine.close()
+        checked = self.counts['checked']
+        if not checked:
+            return
+        rate = checked / self.seconds if self.seconds else 0
+        spider.logger.info(
+            f"🧪 資料檢查 {checked} 列：通過 {self.counts['passed']}、標記 {self.counts['flagged']}、"
+            f"剔除 {self.counts['rejected']}（每秒 {rate:,.0f} 列）"
+        )
+        for reason, n in self.reasons.most_common():
+            spider.logger.info(f"   {reason}: {n}（{validation.REASONS[reason]}）")
+            if self.stats is not None:
+                self.stats.set_value(f'validation/{reason}', n)
+        with open(self.quality_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'checked': checked, 'passed': self.counts['passed'], 'flagged': self.counts['flagged'],
+                'rejected': self.counts['rejected'], 'reasons': dict(self.reasons.most_common()),
+                'rows_per_second': round(rate), 'quarantine': self.quarantine_path,
+            }, f, ensure_ascii=False, indent=2)
+
 
 class DailyCsvPipeline:
+    def __init__(self, max_open_files=256, buffer_size=64 * 1024, stats=None,
+                 commit_rows=5000, commit_interval=5.0, feed=False, feed_socket=False):
+        # 同時開啟的月檔上限（LRU），避免長時間回補超過 ulimit -n
+        self.max_open_files = max(1, max_open_files)
+        # 每個檔案的寫入緩衝區大小（bytes）
+        self.buffer_size = buffer_size
+        self.stats = stats
+        # 批次提交：累積 commit_rows 列或經過 commit_interval 秒時 flush + fsync 並更新索引
+        self.commit_rows = commit_rows
+        self.commit_interval = commit_interval
+        # 新資料列 feed（'<root>/.feed/feed.jsonl'）與 Unix socket 即時推送
+        self.feed_enabled = feed
+        self.feed_socket = feed_socket
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls(
+            max_open_files=crawler.settings.getint('CSV_MAX_OPEN_FILES', 256),
+            buffer_size=crawler.settings.getint('CSV_BUFFER_SIZE', 64 * 1024),
+            stats=crawler.stats,
+            commit_rows=crawler.settings.getint('CSV_COMMIT_ROWS', 5000),
+            commit_interval=crawler.settings.getfloat('CSV_COMMIT_INTERVAL', 5.0),
+            feed=crawler.settings.getbool('FEED_ENABLED', False),
+            feed_socket=crawler.settings.getbool('FEED_SOCKET', False),
+        )
+        crawler.signals.connect(pipeline.month_fetched, signal=month_fetched)
+        return pipeline
+
     def open_spider(self, spider):
-        # 啟動爬蟲時，建立根資料夾
-        self.root_folder = os.path.join('個股日成交資訊')
+        # 啟動爬蟲時，建立根資料夾（分片執行時使用該分片的根資料夾）
+        self.root_folder = getattr(spider, 'output_root', ROOT_FOLDER)
         os.makedirs(self.root_folder, exist_ok=True)
-        # 管理已開啟的檔案與已寫入日期：key=(stock_no, market_tag, year_month)
-        self.files = {}
-        self.written_dates = {}
+        # 管理已開啟的檔案（依最近使用排序）：key=(stock_no, market_tag, year_month)
+        self.files = OrderedDict()
+        # 已寫入日期索引：key=股票資料夾；open_counts 記錄各資料夾仍開啟的月檔數
+        self.indexes = {}
+        self.open_counts = {}
+        # 已歸檔的日期（scrapy compact）同樣視為已寫入
+        self.archive = ArchiveManifest.load(self.root_folder)
         # CSV 欄位順序
-        self.fields = [
-            '股票代號', '股票名稱', '日期', '成交股數', '成交金額',
-            '開盤價', '最高價', '最低價', '收盤價', '漲跌價差', '成交筆數'
-        ]
+        self.fields = CSV_FIELDS
+        # 上次提交後有寫入的月檔，以及尚未提交的列數
+        self.uncommitted = set()
+        self.uncommitted_rows = 0
+        self.last_commit = time.monotonic()
+        # 已結束月份的回應已處理完畢、等待提交時記錄完成標記的 (代碼, 名稱, 市場, 年月)
+        self.closed_pending = []
+        # 尚未提交的新資料列，提交（fsync）後才寫入 feed
+        self.feed = None
+        self.feed_pending = []
+        if self.feed_enabled:
+            path, socket_path = feed_paths(self.root_folder)
+            self.feed = FeedWriter(path, socket_path if self.feed_socket else None)
+            spider.logger.info(f"📡 新資料列 feed: {path}（offset {self.feed.size}）"
+                               + (f"，socket: {socket_path}" if self.feed_socket else ''))
+        # 有檢查點時由檢查點統一提交：先 fsync 資料，再記錄完成的請求
+        self.checkpoint = getattr(spider, 'checkpoint', None)
+        if self.checkpoint is not None:
+            self.checkpoint.add_hook(self.commit)
 
     def process_item(self, item, spider):
-        # 每支股票一個子資料夾
-        stock_folder = f"{item['stock_no']}_{item['stock_name']}_{item['market_tag']}"
-        folder_path = os.path.join(self.root_folder, stock_folder)
-        os.makedirs(folder_path, exist_ok=True)
-
-        # 以年月作為檔名，例如 '202506.csv'
-        year_month = item['date'][:6]
-        filename = f"{year_month}.csv"
-        filepath = os.path.join(folder_path, filename)
-
-        key = (item['stock_no'], item['market_tag'], year_month)
-        # 若尚未開啟此檔案，就建立、初始化 writer 與已寫入日期集合
+        record = as_record(item)
+        date = str(record.date)
+        # 每支股票一個子資料夾，以年月作為檔名，例如 '202506.csv'
+        year_month = date[:6]
+        filepath = month_csv_path(
+            self.root_folder, record.stock_no, record.stock_name, record.market_tag, year_month
+        )
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+        key = (record.stock_no, record.market_tag, year_month)
+        # 若尚未開啟此檔案，就建立、初始化 writer 並確認日期索引
         if key not in self.files:
+            # 超過上限時先關閉最久未使用的檔案
+            while len(self.files) >= self.max_open_files:
+                self.close_file(*self.files.popitem(last=False))
+            folder = os.path.dirname(filepath)
+            index = self.date_index(folder, record.stock_no)
+            # 上次當機時寫到一半的資料列先截掉，再比對索引與月檔（大小不一致時才重讀 CSV）
+            if year_month not in index.checked and repair_torn_tail(filepath):
+                spider.logger.warning(f"✂️ 截除不完整的資料列: {filepath}")
+            index.check_month(year_month, filepath)
             # 檢查檔案是否已存在
             exists = os.path.exists(filepath)
             # 開啟檔案為 append 模式
-            f = open(filepath, 'a', encoding='utf-8-sig', newline='')
+            f = open(filepath, 'a', encoding='utf-8-sig', newline='', buffering=self.buffer_size)
             writer = csv.writer(f)
 
             # 若為新檔案或檔案大小為 0，先寫入標頭
             if not exists or os.path.getsize(filepath) == 0:
                 writer.writerow(self.fields)
-                written = set()
-            else:
-                # 讀取已存在的日期欄位以避免重複寫入
-                written = set()
-                with open(filepath, encoding='utf-8-sig') as rf:
-                    reader = csv.reader(rf)
-                    headers = next(reader, [])
-                    if '日期' in headers:
-                        idx = headers.index('日期')
-                        for r in reader:
-                            if len(r) > idx:
-                                written.add(r[idx])
-            self.files[key] = (f, writer)
-            self.written_dates[key] = written
+            self.files[key] = (f, writer, index, filepath)
+            self.open_counts[folder] = self.open_counts.get(folder, 0) + 1
         else:
-            f, writer = self.files[key]
-            written = self.written_dates[key]
+            self.files.move_to_end(key)
+            f, writer, index, _ = self.files[key]
 
         # 若該日期已寫入，跳過
-        if item['date'] in written:
+        if index.contains(date):
+            _count(self.stats, 'csv', 'duplicate')
             return item
 
-        # 準備寫入一列資料
-        row = [
-            item.get('stock_no',''), item.get('stock_name',''), item.get('date',''),
-            item.get('volume_shares',''), item.get('turnover_amount',''),
-            item.get('open_price',''), item.get('high_price',''),
-            item.get('low_price',''), item.get('close_price',''),
-            item.get('change',''), item.get('transactions','')
-        ]
-        writer.writerow(row)
+        # 寫入一列資料（無成交的價格欄位寫入 '--'）
+        writer.writerow(csv_row(record))
         # 標記此日期已寫入
-        written.add(item['date'])
+        index.add(date)
+        _count(self.stats, 'csv', 'written')
+        self.uncommitted.add(key)
+        self.uncommitted_rows += 1
+        if self.feed is not None:
+            self.feed_pending.append({name: getattr(record, name) for name in record.__slots__})
+        if (self.uncommitted_rows >= self.commit_rows
+                or time.monotonic() - self.last_commit >= self.commit_interval):
+            if self.checkpoint is not None:
+                self.checkpoint.commit()
+            else:
+                self.commit()
+        return item
+
+    def month_fetched(self, stock, year_month):
+        """已結束月份的回應已交給 pipeline；資料列提交後才記錄完成標記"""
+        self.closed_pending.append((stock['代碼'], stock['名稱'], stock['市場'], year_month))
+
+    def commit(self):
+        """
+        flush + fsync 有寫入的月檔，記錄月檔大小與完成標記後寫回日期索引，最後把這批新資料列寫入 feed
+        """
+        folders = set()
+        for key in self.uncommitted:
+            entry = self.files.get(key)
+            if entry is None:
+                continue
+            f, _, index, _ = entry
+            f.flush()
+            os.fsync(f.fileno())
+            index.set_size(key[2], os.fstat(f.fileno()).st_size)
+            folders.add(index.folder)
+        for stock_no, stock_name, market_tag, year_month in self.closed_pending:
+            path = month_csv_path(self.root_folder, stock_no, stock_name, market_tag, year_month)
+            if not os.path.exists(path):
+                # 資料列全部被剔除，沒有月檔可標記
+                continue
+            folder = os.path.dirname(path)
+            index = self.indexes.get(folder)
+            if index is None:
+                # 資料夾的月檔都已關閉：直接更新並寫回索引
+                index = DateIndex(folder)
+                index.check_month(year_month, path)
+                index.mark_closed(year_month)
+                index.save()
+                continue
+            index.check_month(year_month, path)
+            index.mark_closed(year_month)
+            folders.add(folder)
+        self.closed_pending = []
+        for folder in folders:
+            self.indexes[folder].save()
+        self.uncommitted = set()
+        self.uncommitted_rows = 0
+        self.last_commit = time.monotonic()
+        if self.feed_pending:
+            self.feed.append(self.feed_pending)
+            _count(self.stats, 'feed', 'published', len(self.feed_pending))
+            self.feed_pending = []
+
+    def date_index(self, folder, stock_no):
+        """每個股票資料夾共用一份已寫入日期索引（延遲載入）"""
+        index = self.indexes.get(folder)
+        if index is None:
+            index = self.indexes[folder] = DateIndex(folder, archived=self.archive.months(stock_no))
+        return index
+
+    def close_file(self, key, entry):
+        """關閉月檔並記錄大小；資料夾已無開啟中的月檔時寫回索引並釋放"""
+        f, _, index, filepath = entry
+        if key in self.uncommitted:
+            # 被 LRU 關閉的月檔也要先落地，提交時才不會遺漏
+            f.flush()
+            os.fsync(f.fileno())
+            self.uncommitted.discard(key)
+        f.close()
+        index.set_size(key[2], os.path.getsize(filepath))
+        folder = index.folder
+        self.open_counts[folder] -= 1
+        if self.open_counts[folder] == 0:
+            del self.open_counts[folder]
+            index.save()
+            del self.indexes[folder]
+
+    def close_spider(self, spider):
+        # 爬蟲結束時先提交，再關閉所有檔案，並記錄月檔大小後寫回索引
+        if self.checkpoint is not None:
+            self.checkpoint.commit()
+        else:
+            self.commit()
+        while self.files:
+            self.close_file(*self.files.popitem(last=False))
+        for index in self.indexes.values():
+            index.save()
+        if self.feed is not None:
+            self.feed.close()
+
+
+class DailyParquetPipeline:
+    """
+    將 DailyItem 以欄式格式寫入 Parquet，依市場與年月分區：
+    <root>/market=上市/year_month=202506/part-*.parquet
+
+    數值欄位轉為型別化欄位（股數、金額、筆數為 int64，價格為 decimal(12,2)），
+    去重規則與 DailyCsvPipeline 相同：同一 (股票, 市場, 日期) 只寫入第一次。
+    """
+
+    def __init__(self, root_folder, batch_size=50000, stats=None):
+        self.root_folder = root_folder
+        # 緩衝列數達到 batch_size 時一次寫出
+        self.batch_size = batch_size
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise NotConfigured('DailyParquetPipeline 需要安裝 pyarrow')
+        return cls(
+            root_folder=crawler.settings.get('PARQUET_ROOT', os.path.join(ROOT_FOLDER, 'parquet')),
+            batch_size=crawler.settings.getint('PARQUET_BATCH_SIZE', 50000),
+            stats=crawler.stats,
+        )
+
+    def open_spider(self, spider):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa, self.pq = pa, pq
+        self.schema = pa.schema([
+            ('stock_no', pa.string()),
+            ('stock_name', pa.string()),
+            ('date', pa.date32()),
+            ('volume_shares', pa.int64()),
+            ('turnover_amount', pa.int64()),
+            ('open_price', pa.decimal128(12, 2)),
+            ('high_price', pa.decimal128(12, 2)),
+            ('low_price', pa.decimal128(12, 2)),
+            ('close_price', pa.decimal128(12, 2)),
+            ('change', pa.decimal128(12, 2)),
+            ('ex_rights', pa.bool_()),
+            ('transactions', pa.int64()),
+        ])
+        os.makedirs(self.root_folder, exist_ok=True)
+        # 各分區的欄位緩衝：key=(market_tag, year_month)
+        self.buffers = {}
+        self.buffered = 0
+        # 各分區已寫入的 (stock_no, date)，第一次用到時從既有檔案載入
+        self.written = {}
+        self.part_seq = 0
+
+    def partition_folder(self, market_tag, year_month):
+        return os.path.join(self.root_folder, f"market={market_tag}", f"year_month={year_month}")
+
+    def written_keys(self, partition):
+        keys = self.written.get(partition)
+        if keys is None:
+            keys = self.written[partition] = set()
+            folder = self.partition_folder(*partition)
+            if os.path.isdir(folder):
+                for name in sorted(os.listdir(folder)):
+                    if not name.endswith('.parquet'):
+                        continue
+                    table = self.pq.read_table(os.path.join(folder, name), columns=['stock_no', 'date'])
+                    for stock_no, date in zip(table.column('stock_no').to_pylist(),
+                                              table.column('date').to_pylist()):
+                        keys.add((stock_no, date.year * 10000 + date.month * 100 + date.day))
+        return keys
+
+    def process_item(self, item, spider):
+        record = as_record(item)
+        partition = (record.market_tag, record.year_month)
+        keys = self.written_keys(partition)
+        key = (record.stock_no, record.date)
+        # 若該日期已寫入，跳過
+        if key in keys:
+            _count(self.stats, 'parquet', 'duplicate')
+            return item
+
+        columns = self.buffers.get(partition)
+        if columns is None:
+            columns = self.buffers[partition] = {name: [] for name in self.schema.names}
+        d = record.date
+        columns['stock_no'].append(record.stock_no)
+        columns['stock_name'].append(record.stock_name)
+        columns['date'].append(date_type(d // 10000, d // 100 % 100, d % 100))
+        columns['volume_shares'].append(record.volume_shares)
+        columns['turnover_amount'].append(record.turnover_amount)
+        columns['open_price'].append(_to_decimal(record.open_price))
+        columns['high_price'].append(_to_decimal(record.high_price))
+        columns['low_price'].append(_to_decimal(record.low_price))
+        columns['close_price'].append(_to_decimal(record.close_price))
+        columns['change'].append(_to_decimal(record.change))
+        columns['ex_rights'].append(record.ex_rights)
+        columns['transactions'].append(record.transactions)
+        keys.add(key)
+
+        self.buffered += 1
+        if self.buffered >= self.batch_size:
+            self.flush()
+        return item
+
+    def flush(self):
+        """每個分區寫出一個新的 part 檔（依股票代號、日期排序），並清空緩衝"""
+        for (market_tag, year_month), columns in self.buffers.items():
+            table = self.pa.Table.from_pydict(columns, schema=self.schema)
+            table = table.sort_by([('stock_no', 'ascending'), ('date', 'ascending')])
+            folder = self.partition_folder(market_tag, year_month)
+            os.makedirs(folder, exist_ok=True)
+            self.part_seq += 1
+            filename = f"part-{int(time.time() * 1000)}-{os.getpid()}-{self.part_seq:05d}.parquet"
+            tmp_path = os.path.join(folder, f".{filename}.tmp")
+            self.pq.write_table(table, tmp_path, compression='zstd')
+            os.replace(tmp_path, os.path.join(folder, filename))
+            _count(self.stats, 'parquet', 'written', table.num_rows)
+        self.buffers = {}
+        self.buffered = 0
+
+    def close_spider(self, spider):
+        self.flush()
+
+
+class DailySqlitePipeline:
+    """
+    將 DailyItem 寫入本機 SQLite（WAL 模式，寫入時仍可同時讀取）
+
+    以 (stock_no, date) 為主鍵，批次執行 INSERT ... ON CONFLICT DO UPDATE，
+    每累積 batch_size 筆，或最早一筆等待超過 flush_interval 秒（reactor 計時，不需等到下一筆 item）時提交一次交易；
+    去重由資料庫主鍵負責，不需在記憶體中記錄已寫入日期。
+    """
+
+    SCHEMA = [
+        """
+        CREATE TABLE IF NOT EXISTS daily (
+            stock_no        TEXT    NOT NULL,
+            date            TEXT    NOT NULL,   -- YYYYMMDD
+            stock_name      TEXT,
+            market_tag      TEXT    NOT NULL,
+            volume_shares   INTEGER,
+            turnover_amount INTEGER,
+            open_price      REAL,
+            high_price      REAL,
+            low_price       REAL,
+            close_price     REAL,
+            change          REAL,
+            ex_rights       INTEGER NOT NULL DEFAULT 0,
+            transactions    INTEGER,
+            PRIMARY KEY (stock_no, date)
+        ) WITHOUT ROWID
+        """,
+        # 「某日全部股票」查詢
+        "CREATE INDEX IF NOT EXISTS idx_daily_date ON daily (date)",
+        # 「某市場某段期間」查詢
+        "CREATE INDEX IF NOT EXISTS idx_daily_market_date ON daily (market_tag, date)",
+    ]
+
+    UPSERT = """
+        INSERT INTO daily (
+            stock_no, date, stock_name, market_tag, volume_shares, turnover_amount,
+            open_price, high_price, low_price, close_price, change, ex_rights, transactions
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (stock_no, date) DO UPDATE SET
+            stock_name      = excluded.stock_name,
+            market_tag      = excluded.market_tag,
+            volume_shares   = excluded.volume_shares,
+            turnover_amount = excluded.turnover_amount,
+            open_price      = excluded.open_price,
+            high_price      = excluded.high_price,
+            low_price       = excluded.low_price,
+            close_price     = excluded.close_price,
+            change          = excluded.change,
+            ex_rights       = excluded.ex_rights,
+            transactions    = excluded.transactions
+    """
+
+    def __init__(self, db_path, batch_size=1000, flush_interval=5.0, stats=None):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            db_path=crawler.settings.get('SQLITE_PATH', os.path.join(ROOT_FOLDER, 'twstock.sqlite3')),
+            batch_size=crawler.settings.getint('SQLITE_BATCH_SIZE', 1000),
+            flush_interval=crawler.settings.getfloat('SQLITE_FLUSH_INTERVAL', 5.0),
+            stats=crawler.stats,
+        )
+
+    def open_spider(self, spider):
+        from twisted.internet import reactor
+        self.reactor = reactor
+        self.timer = None
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            for statement in self.SCHEMA:
+                self.conn.execute(statement)
+        self.pending = []
+        checkpoint = getattr(spider, 'checkpoint', None)
+        if checkpoint is not None:
+            checkpoint.add_hook(self.flush)
+
+    def process_item(self, item, spider):
+        r = as_record(item)
+        self.pending.append((
+            r.stock_no, str(r.date), r.stock_name, r.market_tag,
+            r.volume_shares, r.turnover_amount,
+            _to_float(r.open_price), _to_float(r.high_price),
+            _to_float(r.low_price), _to_float(r.close_price),
+            _to_float(r.change), int(r.ex_rights), r.transactions,
+        ))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = self.reactor.callLater(self.flush_interval, self.flush)
+        return item
+
+    def flush(self):
+        """以單一交易批次寫入緩衝中的資料列"""
+        if self.timer is not None:
+            if self.timer.active():
+                self.timer.cancel()
+            self.timer = None
+        if self.pending:
+            with self.conn:
+                self.conn.executemany(self.UPSERT, self.pending)
+            _count(self.stats, 'sqlite', 'written', len(self.pending))
+            self.pending = []
+
+    def close_spider(self, spider):
+        self.flush()
+        self.conn.close()
+
+
+class IntradayPipeline:
+    """
+    IntradaySpider 的盤中快照：每批（TickBatch）的資料列一到就寫入 '<root>/intraday/YYYYMMDD.csv'
+    （TickWriter，緩衝區有上限，每批寫完即 flush），不經過月檔的去重與索引。
+
+    同一次輪詢的各批都處理完後，記錄該次輪詢的延遲（日誌、事件日誌的 poll 事件與 stats）：
+        e2e:    由排定的輪詢時間到最後一批寫入
+        fetch:  各批下載時間的最大值
+        write:  各批由收到回應到寫入完成的最大值
+        age:    寫入時與交易所時間戳的差距（資料本身的新鮮度）
+    """
+
+    def __init__(self, buffer_size=256 * 1024, fsync=False, stats=None):
+        self.buffer_size = buffer_size
+        self.fsync = fsync
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            buffer_size=crawler.settings.getint('INTRADAY_BUFFER_SIZE', 256 * 1024),
+            fsync=crawler.settings.getbool('INTRADAY_FSYNC', False),
+            stats=crawler.stats,
+        )
+
+    def open_spider(self, spider):
+        root = getattr(spider, 'output_root', ROOT_FOLDER)
+        self.writer = TickWriter(os.path.join(root, INTRADAY_FOLDER), self.buffer_size, self.fsync)
+        self.events = getattr(spider, 'events', None)
+        # 進行中的輪詢：poll -> 統計；已完成輪詢的端到端延遲（ms）
+        self.polls = {}
+        self.e2e = []
+
+    def process_item(self, item, spider):
+        if not isinstance(item, TickBatch):
+            return item
+        if item.rows:
+            self.writer.write(item.session_date, item.rows)
+            self.writer.flush()
+        written_at = time.time()
+        _count(self.stats, 'intraday', item.status)
+        _count(self.stats, 'intraday', 'rows', len(item.rows))
+
+        poll = self.polls.setdefault(item.poll, {
+            'scheduled': item.scheduled, 'batches': Counter(), 'rows': 0,
+            'fetch': 0.0, 'write': 0.0, 'exchange_time': 0,
+        })
+        poll['batches'][item.status] += 1
+        poll['rows'] += len(item.rows)
+        poll['fetch'] = max(poll['fetch'], item.download_latency)
+        poll['write'] = max(poll['write'], written_at - item.received_at)
+        poll['exchange_time'] = max(poll['exchange_time'], item.exchange_time)
+        if sum(poll['batches'].values()) >= item.requests:
+            self.report(spider, item.poll, self.polls.pop(item.poll), written_at)
         return item
 
+    def report(self, spider, number, poll, written_at):
+        batches = poll['batches']
+        e2e = (written_at - poll['scheduled']) * 1000
+        age = written_at * 1000 - poll['exchange_time'] if poll['exchange_time'] else None
+        self.e2e.append(e2e)
+        scheduled = datetime.fromtimestamp(poll['scheduled']).strftime('%H:%M:%S')
+        spider.logger.info(
+            f"⏱️ 第 {number} 次輪詢 {scheduled}：新資料 {poll['rows']} 列"
+            f"（變動 {batches['changed']}、未變動 {batches['unchanged']}、失敗 {batches['failed']} 批），"
+            f"端到端 {e2e:.0f} ms（下載最長 {poll['fetch'] * 1000:.0f} ms、寫入 {poll['write'] * 1000:.1f} ms）"
+            + (f"，資料延遲 {age / 1000:.1f} s" if age is not None else '')
+        )
+        if self.events is not None:
+            self.events.emit(
+                'poll', 'WARNING' if batches['failed'] else 'INFO',
+                poll=number, scheduled=poll['scheduled'], rows=poll['rows'],
+                changed=batches['changed'], unchanged=batches['unchanged'], failed=batches['failed'],
+                e2e_ms=round(e2e, 1), fetch_ms=round(poll['fetch'] * 1000, 1),
+                write_ms=round(poll['write'] * 1000, 2), age_ms=None if age is None else round(age),
+            )
+        if self.stats is not None:
+            self.stats.inc_value('intraday/polls')
+            self.stats.max_value('intraday/e2e_max_ms', round(e2e))
+
     def close_spider(self, spider):
-        # 爬蟲結束時關閉所有檔案
-        for f, _ in self.files.values():
-            f.close()
+        self.writer.close()
+        if not self.e2e:
+            return
+        ordered = sorted(self.e2e)
+        p50 = ordered[len(ordered) // 2]
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        spider.logger.info(
+            f"📡 盤中快照共寫入 {self.writer.rows_written} 列（{self.writer.bytes_written / 1e6:.2f} MB），"
+            f"{len(ordered)} 次輪詢端到端延遲 p50 {p50:.0f} ms、p95 {p95:.0f} ms、最長 {ordered[-1]:.0f} ms"
+        )
+        if self.stats is not None:
+            self.stats.set_value('intraday/e2e_p50_ms', round(p50))
+            self.stats.set_value('intraday/e2e_p95_ms', round(p95))
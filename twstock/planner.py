@@ -0,0 +1,184 @@
+# planner.py: 爬取前規劃，依磁碟狀態計算真正需要的 (股票, 月份) 請求
+import json
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+
+from twstock.archive import ArchiveManifest
+from twstock.storage import DateIndex, is_month_complete, month_csv_path, stock_folder
+
+
+class TradingCalendar:
+    """交易日曆：平日且不在休市日清單中的日期視為交易日"""
+
+    def __init__(self, holidays=()):
+        self.holidays = set(holidays)
+        # 休市日清單涵蓋的年度；每年至少有元旦等休市日，清單中沒有任何日期的年度視為未涵蓋
+        self.years = {d[:4] for d in self.holidays}
+
+    @classmethod
+    def from_file(cls, path):
+        """休市日清單為 JSON 陣列 ['YYYYMMDD', ...]；未設定路徑時只排除週末，設定了但檔案不存在時拋出 FileNotFoundError"""
+        if not path:
+            return cls()
+        with open(path, encoding='utf-8') as f:
+            return cls(str(d).replace('-', '').replace('/', '') for d in json.load(f))
+
+    def uncovered_years(self, year_months):
+        """休市日清單未涵蓋的年度（這些年度的國定假日會被當成交易日）"""
+        return sorted({ym[:4] for ym in year_months if ym[:4] not in self.years})
+
+    def is_trading_day(self, day):
+        return day.weekday() < 5 and day.strftime('%Y%m%d') not in self.holidays
+
+    def trading_days(self, year_month, until=None):
+        """某月份的交易日（YYYYMMDD），until 之後的日期不列入"""
+        day = datetime.strptime(f"{year_month}01", '%Y%m%d')
+        days = []
+        while day.strftime('%Y%m') == year_month:
+            date = day.strftime('%Y%m%d')
+            if until and date > until:
+                break
+            if self.is_trading_day(day):
+                days.append(date)
+            day += timedelta(days=1)
+        return days
+
+
+class NegativeCache:
+    """
+    無資料快取：記錄回傳「無資料」或 stat != OK 的 (市場, 代碼, 月份)，
+    在 ttl_days 天內不再請求。存於 '<root>/.negative_cache.json'。
+    """
+
+    def __init__(self, path, ttl_days=7):
+        self.path = path
+        self.ttl = timedelta(days=ttl_days)
+        self.entries = {}
+        self.dirty = False
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                self.entries = {}
+
+    @staticmethod
+    def key(market, code, year_month):
+        return f"{market}:{code}:{year_month}"
+
+    def is_negative(self, market, code, year_month, now=None):
+        entry = self.entries.get(self.key(market, code, year_month))
+        if not entry:
+            return False
+        cached_at = datetime.strptime(entry['time'], '%Y-%m-%d %H:%M:%S')
+        return (now or datetime.now()) - cached_at < self.ttl
+
+    def add(self, market, code, year_month, reason):
+        self.entries[self.key(market, code, year_month)] = {
+            'reason': reason, 'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        self.dirty = True
+
+    def discard(self, market, code, year_month):
+        if self.entries.pop(self.key(market, code, year_month), None) is not None:
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        now = datetime.now()
+        # 寫回時順便清除已過期的項目
+        entries = {
+            k: v for k, v in self.entries.items()
+            if now - datetime.strptime(v['time'], '%Y-%m-%d %H:%M:%S') < self.ttl
+        }
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False, indent=0, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+class CrawlPlanner:
+    """
+    決定每個 (股票, 月份) 是否需要請求，略過原因記錄於 skipped：
+    - complete:    已結束且該月結束後抓取的回應已提交（月檔索引或歸檔清單的完成標記）的月份
+    - up_to_date:  當月檔案已包含最近一個交易日
+    - no_trading:  月份內（截至今日）沒有任何交易日
+    - negative:    近期回傳無資料（NegativeCache）
+
+    complete / up_to_date 依序檢查 root 與 canonical_root（分片時的標準配置）。
+    """
+
+    def __init__(self, root, calendar, negative_cache, today=None, canonical_root=None):
+        self.root = root
+        # 分片時 root 為分片的根資料夾；已合併到標準配置（canonical_root 的月檔或歸檔）的月份也不再請求
+        self.roots = [root]
+        if canonical_root and os.path.abspath(canonical_root) != os.path.abspath(root):
+            self.roots.append(canonical_root)
+        self.archives = {r: ArchiveManifest.load(r) for r in self.roots}
+        self.calendar = calendar
+        self.negative_cache = negative_cache
+        self.today = today or datetime.now().strftime('%Y%m%d')
+        self.this_month = self.today[:6]
+        self.skipped = Counter()
+        self.planned = Counter()
+        self._last_trading_day = {}
+        # 各根資料夾最近一支股票資料夾的 DateIndex（規劃時同一支股票的月份連續檢查）
+        self._indexes = {}
+
+    def last_trading_day(self, year_month):
+        if year_month not in self._last_trading_day:
+            days = self.calendar.trading_days(year_month, until=self.today)
+            self._last_trading_day[year_month] = days[-1] if days else None
+        return self._last_trading_day[year_month]
+
+    def date_index(self, root, code, name, market):
+        folder = stock_folder(root, code, name, market)
+        index = self._indexes.get(root)
+        if index is None or index.folder != folder:
+            index = self._indexes[root] = DateIndex(folder)
+        return index
+
+    def written_reason(self, root, code, name, market, year_month, last_day):
+        """root 下的月份已完成（月檔或歸檔的完成標記）或當月已有 last_day 時回傳 complete / up_to_date，否則為 None"""
+        index = self.date_index(root, code, name, market)
+        if is_month_complete(root, code, name, market, year_month, self.this_month, index):
+            return 'complete'
+        if year_month < self.this_month and self.archives[root].complete(code, year_month):
+            return 'complete'
+        if year_month == self.this_month:
+            index.check_month(year_month, month_csv_path(root, code, name, market, year_month))
+            if index.contains(last_day):
+                return 'up_to_date'
+        return None
+
+    def skip_reason(self, stock, year_month):
+        code, name, market = stock['代碼'], stock['名稱'], stock['市場']
+        last_day = self.last_trading_day(year_month)
+        if last_day is None:
+            return 'no_trading'
+        for root in self.roots:
+            reason = self.written_reason(root, code, name, market, year_month, last_day)
+            if reason:
+                return reason
+        if self.negative_cache.is_negative(market, code, year_month):
+            return 'negative'
+        return None
+
+    def plan(self, stocks, months):
+        """依序產生需要請求的 (股票, 月份)；同一支股票的月份連續產生"""
+        for stock in stocks:
+            for year_month in months:
+                reason = self.skip_reason(stock, year_month)
+                if reason:
+                    self.skipped[reason] += 1
+                    continue
+                self.planned[stock['市場']] += 1
+                yield stock, year_month
+
+    def estimate_seconds(self, delay):
+        """兩個站點並行、各自依 DOWNLOAD_DELAY 間隔送出，估計時間取決於請求較多的站點"""
+        return max(self.planned.values(), default=0) * delay
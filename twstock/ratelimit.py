@@ -0,0 +1,143 @@
+# ratelimit.py: TWSE / TPEX 各自獨立的自適應限速與封鎖偵測（downloader middleware）
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+
+# TWSE 暫時封鎖時以重定向回應；429 為明確的請求過多
+BAN_STATUSES = {301, 302, 307, 429}
+
+
+class HostState:
+    """單一站點的限速狀態：delay 為兩次請求的間隔（秒），即每秒 1/delay 個 token"""
+
+    def __init__(self, delay, min_delay):
+        self.delay = delay
+        self.floor = min_delay          # 探測加速的下限；被封鎖後提高到封鎖當時的間隔之上
+        self.successes = 0              # 自上次調整後連續成功的回應數
+        self.bans = 0                   # 連續封鎖次數，決定暫停時間
+        self.paused_until = 0.0
+
+
+class HostRateController:
+    """
+    依站點（downloader slot）調整請求間隔：
+
+    - 連續 RATE_PROBE_WINDOW 個正常回應後，間隔乘以 RATE_PROBE_FACTOR，逐步逼近站點上限
+    - 收到重定向或 429 視為封鎖：該站點暫停 RATE_BAN_PAUSE × 2^(連續封鎖次數-1) 秒，
+      間隔加倍，並把請求重新排回佇列；另一個站點不受影響
+    - 暫停結束後的第一個回應即為探測，若仍被封鎖則暫停時間再加倍
+
+    暫停是把 slot.delay 暫時設為暫停秒數（與 AutoThrottle 相同的調整方式），
+    因此請開啟 DownloaderAwarePriorityQueue，讓排程優先發出未暫停站點的請求。
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('RATE_CONTROL_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.default_delay = settings.getfloat('DOWNLOAD_DELAY', 1.0)
+        self.host_delays = settings.getdict('RATE_HOST_DELAYS')
+        self.min_delay = settings.getfloat('RATE_MIN_DELAY', 0.5)
+        self.max_delay = settings.getfloat('RATE_MAX_DELAY', 10.0)
+        self.probe_window = settings.getint('RATE_PROBE_WINDOW', 20)
+        self.probe_factor = settings.getfloat('RATE_PROBE_FACTOR', 0.9)
+        self.ban_pause = settings.getfloat('RATE_BAN_PAUSE', 30.0)
+        self.ban_max_pause = settings.getfloat('RATE_BAN_MAX_PAUSE', 900.0)
+        self.ban_max_retries = settings.getint('RATE_BAN_MAX_RETRIES', 5)
+        self.hosts = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        mw = cls(crawler)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
+
+    @staticmethod
+    def slot_key(request):
+        return request.meta.get('download_slot') or urlparse_cached(request).hostname or ''
+
+    def host(self, key):
+        state = self.hosts.get(key)
+        if state is None:
+            delay = float(self.host_delays.get(key, self.default_delay))
+            state = self.hosts[key] = HostState(delay, self.min_delay)
+            self.stats_set(key, 'delay', delay)
+        return state
+
+    def slot(self, key):
+        return self.crawler.engine.downloader.slots.get(key)
+
+    def apply(self, key, state):
+        """把目前間隔（或暫停中的剩餘時間）寫入 downloader slot"""
+        slot = self.slot(key)
+        if slot is None:
+            return
+        remaining = state.paused_until - time.time()
+        slot.delay = max(state.delay, remaining) if remaining > 0 else state.delay
+
+    def process_request(self, request, spider):
+        key = self.slot_key(request)
+        self.apply(key, self.host(key))
+
+    def process_response(self, request, response, spider):
+        key = self.slot_key(request)
+        state = self.host(key)
+        if response.status in BAN_STATUSES:
+            return self.on_ban(key, state, request, response, spider)
+
+        if state.bans and time.time() >= state.paused_until:
+            spider.logger.info(f"✅ {key} 解除暫停，間隔 {state.delay:.2f}s")
+            state.bans = 0
+        state.successes += 1
+        if state.successes >= self.probe_window:
+            state.successes = 0
+            faster = max(state.floor, state.delay * self.probe_factor)
+            if faster < state.delay:
+                state.delay = faster
+                self.stats_set(key, 'delay', round(faster, 3))
+        self.apply(key, state)
+        return response
+
+    def on_ban(self, key, state, request, response, spider):
+        now = time.time()
+        # 暫停期間仍在途中的請求也會收到封鎖回應，只在暫停結束後的探測被封鎖時才加倍
+        if now >= state.paused_until:
+            state.bans += 1
+            state.floor = min(self.max_delay, max(state.floor, state.delay * 1.2))
+            state.delay = min(self.max_delay, max(state.floor, state.delay * 2))
+            pause = min(self.ban_max_pause, self.ban_pause * 2 ** (state.bans - 1))
+            state.paused_until = now + pause
+            state.successes = 0
+            spider.logger.warning(
+                f"🚫 {key} 回應 {response.status}，暫停 {pause:.0f}s，間隔調整為 {state.delay:.2f}s"
+            )
+            self.stats_inc(key, 'bans')
+            self.stats_set(key, 'delay', round(state.delay, 3))
+            self.stats_set(key, 'paused_until', state.paused_until)
+            events = getattr(spider, 'events', None)
+            if events is not None:
+                events.emit('ban', 'WARNING', host=key, status=response.status,
+                            pause=pause, delay=round(state.delay, 3))
+        self.apply(key, state)
+
+        retries = request.meta.get('ban_retries', 0)
+        if retries >= self.ban_max_retries:
+            # 超過重送次數：交給 spider 記錄失敗（-a retry_failed 可再重送）
+            return response
+        self.stats_inc(key, 'requeued')
+        retry = request.replace(dont_filter=True)
+        retry.meta['ban_retries'] = retries + 1
+        return retry
+
+    def stats_inc(self, key, name):
+        self.crawler.stats.inc_value(f'ratelimit/{key}/{name}')
+
+    def stats_set(self, key, name, value):
+        self.crawler.stats.set_value(f'ratelimit/{key}/{name}', value)
+
+    def spider_closed(self, spider):
+        for key, state in sorted(self.hosts.items()):
+            spider.logger.info(f"📈 {key} 最終間隔 {state.delay:.2f}s（下限 {state.floor:.2f}s）")
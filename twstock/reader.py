@@ -0,0 +1,274 @@
+# reader.py: 日成交資料的唯讀查詢介面，以 mmap 對應的固定寬度二進位檔提供零複製查詢
+#
+# 用法：
+#   from twstock.reader import build_store, DailyReader
+#   build_store()                                   # 由 個股日成交資訊/*.csv 增量建立 .store/
+#   reader = DailyReader()
+#   reader.get_series('2330', 20240101, 20240630)   # 單一股票（依日期排序）
+#   reader.get_cross_section(20240603)              # 單一交易日全市場（依代碼排序）
+#   to_float(rows['close'])                         # 定點數價格轉為 float（缺值 NaN）
+import csv
+import json
+import mmap
+import os
+import time
+from datetime import date as Date
+
+from twstock.archive import ArchiveManifest
+from twstock.checkpoint import fsync_dir
+from twstock.parsing import PRICE_SCALE, parse_csv_row
+from twstock.storage import ARCHIVE_FOLDER, ROOT_FOLDER, iter_month_files
+
+try:
+    import numpy as np
+except ImportError:  # numpy 為選用相依套件
+    np = None
+
+STORE_FOLDER = '.store'
+STORE_VERSION = 1
+
+# 市場代碼（market 欄位）
+MARKETS = {'上市': 1, '上櫃': 2}
+MARKET_NAMES = {v: k for k, v in MARKETS.items()}
+
+# 價格缺值（'--'）的定點數
+NO_PRICE = -2 ** 31
+
+# 每列 56 bytes；價格為 PRICE_SCALE 定點數，日期為 YYYYMMDD 整數
+FIELDS = [
+    ('code', 'S8'), ('date', '<i4'), ('market', 'u1'), ('ex_rights', 'u1'),
+    ('open', '<i4'), ('high', '<i4'), ('low', '<i4'), ('close', '<i4'), ('change', '<i4'),
+    ('transactions', '<i4'), ('volume', '<i8'), ('amount', '<i8'),
+]
+DTYPE = np.dtype(FIELDS, align=True) if np is not None else None
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError('twstock.reader 需要安裝 numpy')
+
+
+def date_key(value):
+    """20240603、'20240603'、'2024-06-03' 或 date 物件 -> 20240603"""
+    if isinstance(value, Date):
+        return value.year * 10000 + value.month * 100 + value.day
+    return int(str(value).replace('-', ''))
+
+
+def to_float(values):
+    """定點數價格欄位轉為 float64（複製），缺值為 NaN"""
+    out = values.astype(np.float64) / PRICE_SCALE
+    out[values == NO_PRICE] = np.nan
+    return out
+
+
+def parse_row(code_bytes, market, r):
+    """CSV 資料列 -> 符合 DTYPE 欄位順序的 tuple；不是資料列時回傳 None"""
+    parsed = parse_csv_row(r)
+    if parsed is None:
+        return None
+    date, *prices, ex_rights, volume, amount, transactions = parsed
+    return (
+        code_bytes, date, MARKETS.get(market, 0), ex_rights,
+        *(NO_PRICE if p is None else p for p in prices),
+        transactions or 0, volume or 0, amount or 0,
+    )
+
+
+def read_rows(code, market, path):
+    """讀取月檔，回傳符合 DTYPE 欄位順序的 tuple 列表"""
+    code_bytes = code.encode('ascii')
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        rows = (parse_row(code_bytes, market, r) for r in csv.reader(f))
+        return [row for row in rows if row is not None]
+
+
+def read_archive_rows(archive, code):
+    """讀取歸檔（twstock.archive），回傳符合 DTYPE 欄位順序的 tuple 列表"""
+    code_bytes = code.encode('ascii')
+    rows = (parse_row(code_bytes, market, r) for market, r in archive.iter_rows(code))
+    return [row for row in rows if row is not None]
+
+
+def _store_path(folder, name, generation):
+    return os.path.join(folder, f"{name}.{generation}.bin")
+
+
+def _load_meta(folder):
+    try:
+        with open(os.path.join(folder, 'index.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if meta.get('version') != STORE_VERSION or meta.get('itemsize') != DTYPE.itemsize:
+        return None
+    return meta
+
+
+def _write_array(path, arr):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        arr.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _map(path, rows):
+    """以唯讀 mmap 對應資料檔；回傳的陣列與其切片都直接指向頁面快取，不複製"""
+    if not rows:
+        return np.zeros(0, dtype=DTYPE)
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return np.frombuffer(buffer, dtype=DTYPE, count=rows)
+
+
+def build_store(root=ROOT_FOLDER, full=False):
+    """
+    由月檔建立 / 增量更新 '<root>/.store/'：
+
+    - by_code.<代>.bin: 依 (代碼, 日期) 排序的固定寬度資料列
+    - by_date.<代>.bin: 同樣的資料列，依 (日期, 代碼) 排序
+    - index.json:       代碼 -> [起始列, 列數, 最新名稱, 最新市場]、日期 -> [起始列, 列數]、
+                        已讀取的月檔大小與歸檔 sha256
+
+    同一代碼的資料不論資料夾名稱（改名前後）或是否已歸檔（scrapy compact）都合併為一個序列。
+    只重讀大小改變的月檔與內容改變的歸檔，新資料覆蓋同 (代碼, 日期) 的舊資料；每次更新寫入新的一代檔案，
+    最後才替換 index.json，已開啟的讀取端仍對應舊檔案，不會讀到寫到一半的資料。
+    回傳統計：files、rows、codes、dates、seconds
+    """
+    require_numpy()
+    started = time.perf_counter()
+    folder = os.path.join(root, STORE_FOLDER)
+    meta = None if full else _load_meta(folder)
+    manifest = meta['files'] if meta else {}
+
+    # 歸檔以 sha256 判斷是否變動，月檔以大小判斷
+    archive = ArchiveManifest.load(root)
+    sizes, changed, latest = {}, [], {}
+    for code, entry in archive.stocks.items():
+        rel = f"{ARCHIVE_FOLDER}/{code}.csv.gz"
+        sizes[rel] = entry['sha256']
+        latest[code] = (entry['last'][:6], entry['name'], entry['market'])
+        if manifest.get(rel) != entry['sha256']:
+            changed.append((code, None, None))
+    for rel, size, code, market, name, path in iter_month_files(root):
+        sizes[rel] = size
+        month = rel[-10:-4]
+        if latest.get(code, ('',))[0] < month:
+            latest[code] = (month, name, market)
+        if manifest.get(rel) != size:
+            changed.append((code, market, path))
+
+    # 歸檔在前、月檔在後，同 (代碼, 日期) 以月檔為準
+    records = [
+        row for code, market, path in changed
+        for row in (read_rows(code, market, path) if path else read_archive_rows(archive, code))
+    ]
+    rewrite = meta is None or bool(records)
+    data = np.array(records, dtype=DTYPE)
+    if meta is not None:
+        existing = np.fromfile(_store_path(folder, 'by_code', meta['generation']), dtype=DTYPE)
+        data = np.concatenate([existing, data]) if rewrite else existing
+    if rewrite:
+        # 依 (代碼, 日期, 讀入順序) 排序，同 (代碼, 日期) 只保留最後讀入的一筆
+        data = data[np.lexsort((np.arange(len(data)), data['date'], data['code']))]
+        if len(data):
+            keep = np.ones(len(data), dtype=bool)
+            keep[:-1] = (data['code'][1:] != data['code'][:-1]) | (data['date'][1:] != data['date'][:-1])
+            data = data[keep]
+    by_date = data[np.lexsort((data['code'], data['date']))]
+
+    codes, code_starts, code_counts = np.unique(data['code'], return_index=True, return_counts=True)
+    dates, date_starts, date_counts = np.unique(by_date['date'], return_index=True, return_counts=True)
+    code_index = {}
+    for code, start, count in zip(codes, code_starts, code_counts):
+        code = code.decode('ascii')
+        _, name, market = latest.get(code, ('', '', ''))
+        code_index[code] = [int(start), int(count), name, market]
+
+    # 沒有新資料列時沿用目前這一代的資料檔，只更新 index.json（名稱、月檔清單）
+    generation = meta['generation'] + rewrite if meta else 1
+    os.makedirs(folder, exist_ok=True)
+    if rewrite:
+        _write_array(_store_path(folder, 'by_code', generation), data)
+        _write_array(_store_path(folder, 'by_date', generation), by_date)
+    tmp_path = os.path.join(folder, 'index.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'version': STORE_VERSION, 'itemsize': DTYPE.itemsize, 'generation': generation,
+            'rows': len(data), 'codes': code_index,
+            'dates': [[int(d), int(s), int(n)] for d, s, n in zip(dates, date_starts, date_counts)],
+            # 已被移走（例如歸檔）的月檔不影響既有資料列
+            'files': sizes,
+        }, f, ensure_ascii=False, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(folder, 'index.json'))
+    fsync_dir(folder)
+
+    # 移除舊世代的檔案（已 mmap 的讀取端仍可讀取，直到關閉為止）
+    for entry in os.scandir(folder):
+        if entry.name.endswith('.bin') and not entry.name.endswith(f".{generation}.bin"):
+            os.remove(entry.path)
+
+    return {
+        'files': len(changed),
+        'rows': len(data),
+        'codes': len(code_index),
+        'dates': len(dates),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+class DailyReader:
+    """
+    '<root>/.store/' 的唯讀查詢；get_series / get_cross_section 回傳 mmap 上的結構化陣列切片（零複製、唯讀）。
+    欄位見 FIELDS：價格為 PRICE_SCALE 定點數（缺值 NO_PRICE，可用 to_float 轉換），market 見 MARKETS。
+    build_store() 更新後呼叫 reload() 讀取新的一代。
+    """
+
+    def __init__(self, root=ROOT_FOLDER):
+        require_numpy()
+        self.folder = os.path.join(root, STORE_FOLDER)
+        self.reload()
+
+    def reload(self):
+        meta = _load_meta(self.folder)
+        if meta is None:
+            raise FileNotFoundError(f"尚未建立資料庫，請先執行 build_store(): {self.folder}")
+        self.generation = meta['generation']
+        self.by_code = _map(_store_path(self.folder, 'by_code', self.generation), meta['rows'])
+        self.by_date = _map(_store_path(self.folder, 'by_date', self.generation), meta['rows'])
+        self.code_index = meta['codes']
+        dates = meta['dates']
+        self.dates = np.array([d for d, _, _ in dates], dtype=np.int64)
+        self.date_spans = np.array([(s, n) for _, s, n in dates], dtype=np.int64).reshape(-1, 2)
+
+    def codes(self):
+        return sorted(self.code_index)
+
+    def info(self, code):
+        """(最新名稱, 最新市場, 列數)"""
+        start, count, name, market = self.code_index[code]
+        return name, market, count
+
+    def get_series(self, code, start=None, end=None):
+        """單一股票 start～end（含）的資料列，依日期排序；代碼不存在時 KeyError"""
+        first, count, _, _ = self.code_index[code]
+        rows = self.by_code[first:first + count]
+        if start is None and end is None:
+            return rows
+        dates = rows['date']
+        lo = 0 if start is None else int(np.searchsorted(dates, date_key(start), 'left'))
+        hi = count if end is None else int(np.searchsorted(dates, date_key(end), 'right'))
+        return rows[lo:hi]
+
+    def get_cross_section(self, date):
+        """單一交易日全部股票的資料列，依代碼排序；非交易日回傳空陣列"""
+        key = date_key(date)
+        idx = int(np.searchsorted(self.dates, key))
+        if idx == len(self.dates) or self.dates[idx] != key:
+            return self.by_date[:0]
+        first, count = self.date_spans[idx]
+        return self.by_date[first:first + count]
@@ -1,11 +1,15 @@
 # Scrapy settings for twstock project
 # settings.py: Scrapy
+import os
 
 BOT_NAME = 'twstock'
 
 SPIDER_MODULES = ['twstock.spiders']
 NEWSPIDER_MODULE = 'twstock.spiders'
 
+# 自訂指令（scrapy merge_shards 等）
+COMMANDS_MODULE = 'twstock.commands'
+
 # 基本下載限制
 # DOWNLOAD_DELAY: 每次請求後的等待時間（秒），避免請求過快導致被封 IP
 DOWNLOAD_DELAY = 1.5        # 基準延遲時間
@@ -15,12 +19,26 @@ RANDOMIZE_DOWNLOAD_DELAY = True   # 隨機化因子
 # 控制與單一網站的同時連線數，減少對伺服器的壓力
 CONCURRENT_REQUESTS_PER_DOMAIN = 2  # 同站點最多2個併發請求
 
-# AutoThrottle 自動限速設置
-# 根據伺服器回應時間動態調整請求速率，讓爬蟲更智能地控制流量
-AUTOTHROTTLE_ENABLED = True                   # 開啟自動限速功能
-AUTOTHROTTLE_START_DELAY = 0.5               # 初始限速延遲為0.5秒
-AUTOTHROTTLE_MAX_DELAY = 5.0                 # 當伺服器回應慢時，最大延遲不超過5秒
-AUTOTHROTTLE_TARGET_CONCURRENCY = 1.0        # 目標並發數量，每秒向相同站點發送1次請求
+# 依站點自適應限速（twstock.ratelimit.HostRateController，取代 Scrapy 的 AutoThrottle）
+# 兩者都會調整 slot.delay，同時開啟會互相覆寫；請勿再開啟 AUTOTHROTTLE_ENABLED（Scrapy 預設為關閉）
+# 連續 RATE_PROBE_WINDOW 個正常回應後縮短間隔；收到重定向或 429 時暫停該站點、間隔加倍並重新排入請求
+RATE_CONTROL_ENABLED = True
+RATE_HOST_DELAYS = {              # 各站點的初始間隔（秒），未列出的站點使用 DOWNLOAD_DELAY
+    'www.twse.com.tw': 1.5,
+    'www.tpex.org.tw': 1.5,
+}
+RATE_MIN_DELAY = 0.5              # 間隔下限
+RATE_MAX_DELAY = 10.0             # 間隔上限
+RATE_PROBE_WINDOW = 20            # 連續幾個正常回應後嘗試加速
+RATE_PROBE_FACTOR = 0.9           # 每次加速的間隔倍數
+RATE_BAN_PAUSE = 30               # 第一次被封鎖的暫停秒數，連續封鎖時加倍
+RATE_BAN_MAX_PAUSE = 900          # 暫停秒數上限
+RATE_BAN_MAX_RETRIES = 5          # 同一請求因封鎖重新排入的次數上限，超過後記為失敗
+
+# 排程優先發出目前在途請求較少的站點，一個站點暫停時另一個站點不會被塞住
+SCHEDULER_PRIORITY_QUEUE = 'scrapy.pqueues.DownloaderAwarePriorityQueue'
+# 站點暫停期間其請求會在 downloader 中等待，總併發需高於兩站點併發的總和
+CONCURRENT_REQUESTS = 32
 
 # Retry 重試配置
 # 遇到暫時性錯誤（如5xx）或連線中斷，允許自動重試
@@ -31,7 +49,73 @@ RETRY_HTTP_CODES = [500, 502, 503, 504, 522, 524, 408, 429]  # 可重試的 HTTP
 # Pipeline: 處理解析後的 Item 並輸出 CSV
 # 數字越小，優先級越高，300為中等優先
 ITEM_PIPELINES = {
+    'twstock.pipelines.DailyValidationPipeline': 200,  # 寫入前的資料品質檢查（需安裝 numpy，否則略過）
     'twstock.pipelines.DailyCsvPipeline': 300,
+    # 'twstock.pipelines.DailyParquetPipeline': 310,   # 欄式 Parquet 輸出（需安裝 pyarrow）
+    # 'twstock.pipelines.DailySqlitePipeline': 320,    # SQLite 資料庫輸出
+}
+
+# 資料品質檢查（DailyValidationPipeline），原因代碼見 twstock/validation.py
+VALIDATION_ENABLED = True
+VALIDATION_BATCH_SIZE = 500          # 每批檢查的列數
+VALIDATION_MAX_DELAY = 0.5           # 批次未滿時最久等待秒數
+VALIDATION_AMOUNT_TOLERANCE = 0.01   # 成交均價超出 [最低, 最高] 的容許比例
+VALIDATION_UNIT_RATIO = 300          # 成交均價與收盤價相差超過此倍數視為單位錯誤（仟股 / 仟元換算錯誤約為 1000 倍）
+VALIDATION_HISTORY = True            # 以磁碟上的歷史資料做跨日檢查
+# VALIDATION_REJECT = ['missing_price', 'high_lt_low', ...]   # 會被剔除的原因，預設見 REJECT_REASONS
+
+# 爬取規劃
+# 休市日清單（JSON 陣列 ['YYYYMMDD', ...]），以 `scrapy holidays` 產生；路徑相對於套件資料夾，不受執行目錄影響
+# 檔案不存在時 daily 爬蟲拒絕規劃；設為空字串則明確改為只排除週末（國定假日會被當成交易日）
+HOLIDAYS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '休市日期.json')
+# 回傳無資料的 (股票, 月份) 在幾天內不再請求
+NEGATIVE_CACHE_DAYS = 7
+
+# 共用工作佇列（-a frontier=1）
+FRONTIER_PATH = '個股日成交資訊/frontier.sqlite3'   # 多個 worker 共用的 SQLite 佇列檔
+FRONTIER_LEASE_SIZE = 50                 # 每次租用的工作數
+FRONTIER_VISIBILITY_TIMEOUT = 600        # 租約秒數，逾時未確認的工作交給其他 worker
+FRONTIER_MAX_ATTEMPTS = 5                # 失敗超過此次數不再發出（state=dead）
+
+# CSV 月檔寫入設定
+# 同時開啟的月檔上限，超過時關閉最久未使用的檔案（LRU），避免回補時超過 ulimit -n
+CSV_MAX_OPEN_FILES = 256
+CSV_BUFFER_SIZE = 64 * 1024   # 每個月檔的寫入緩衝區大小（bytes）
+CSV_COMMIT_ROWS = 5000        # 累積幾列就 flush + fsync 並更新日期索引
+CSV_COMMIT_INTERVAL = 5.0     # 或距上次提交超過幾秒
+# 新資料列 feed（個股日成交資訊/.feed/feed.jsonl），每次提交後追加，見 twstock/feed.py
+FEED_ENABLED = False
+FEED_SOCKET = False           # 另開 Unix socket（.feed/feed.sock）即時推送給訂閱者
+
+# 檢查點（個股日成交資訊/.checkpoint/），中斷後以 -a resume=1 接續
+CHECKPOINT_INTERVAL = 5.0     # 已完成請求至少每幾秒提交一次
+
+# Parquet 輸出設定（DailyParquetPipeline）
+PARQUET_ROOT = '個股日成交資訊/parquet'   # 依 market=/year_month= 分區
+PARQUET_BATCH_SIZE = 50000                # 緩衝列數達到此值時寫出一批 part 檔
+
+# SQLite 輸出設定（DailySqlitePipeline）
+SQLITE_PATH = '個股日成交資訊/twstock.sqlite3'
+SQLITE_BATCH_SIZE = 1000       # 每累積 N 筆提交一次交易
+SQLITE_FLUSH_INTERVAL = 5.0    # 或最早一筆未提交的資料列等待超過 T 秒（以計時器觸發，爬取停頓時也會提交）
+
+# HTTP 回應快取（預設關閉，以 -s HTTPCACHE_ENABLED=1 開啟）
+# 依 (端點, 股票代號, 月份) 儲存 gzip 壓縮的原始 JSON；
+# 月份結束後才抓取的回應永久有效，當月資料每次重新下載
+HTTPCACHE_ENABLED = False
+HTTPCACHE_DIR = 'httpcache'   # 位於專案 .scrapy/ 目錄下
+HTTPCACHE_POLICY = 'twstock.httpcache.ClosedPeriodPolicy'
+HTTPCACHE_STORAGE = 'twstock.httpcache.PeriodCacheStorage'
+# 重播模式：整個爬取只讀快取、不連網（快取中沒有的請求直接略過）
+HTTPCACHE_REPLAY = False
+
+DOWNLOADER_MIDDLEWARES = {
+    'scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware': None,
+    'twstock.httpcache.TwstockHttpCacheMiddleware': 900,
+    # 在 Redirect（600）與 Retry（550）之前處理重定向 / 429
+    'twstock.ratelimit.HostRateController': 650,
+    # 量測下載延遲、排程等待與回應大小（最靠近下載器，快取命中的回應也會經過），回報給 RequestMetrics
+    'twstock.middlewares.TwstockMiddleware': 950,
 }
 
 # 更換 User-Agent，模擬不同的瀏覽器
@@ -55,7 +139,55 @@ DEFAULT_REQUEST_HEADERS = {
 # Logging 日誌設定
 LOG_LEVEL = 'INFO'    # 可設為 'DEBUG' 查看更詳細的執行資訊
 
+# 結構化事件日誌（個股日成交資訊/logs/YYYY-MM-DD.events.jsonl）
+# 事件類型：response（狀態碼、延遲、位元組數）、items、no_data、failure
+EVENT_LOG_DEFAULT_LEVEL = 'INFO'
+EVENT_LOG_LEVELS = {
+    # 'response': 'WARNING',   # 例：不記錄每個回應
+}
+
 SPIDER_MIDDLEWARES = {
-    'twstock.middlewares.TwstockMiddleware': 543,
+    # 最靠近 spider，量測 parse callback 本身的 CPU 時間，回報給 RequestMetrics
+    'twstock.middlewares.TwstockMiddleware': 950,
+}
+
+# 即時狀態端點（twstock.extensions.StatusServer），Prometheus 可直接抓取 http://127.0.0.1:9410/metrics
+EXTENSIONS = {
+    'twstock.extensions.StatusServer': 500,
+    # 各端點量測與 profiling 的彙整（TwstockMiddleware 回報）；移除時 TwstockMiddleware 只記錄日誌
+    'twstock.extensions.RequestMetrics': 505,
+    'twstock.extensions.IndicatorUpdater': 510,
 }
+STATUS_ENABLED = False            # 預設關閉，可用 -s STATUS_ENABLED=1 開啟
+STATUS_BIND = '127.0.0.1'         # 只在本機監聽
+STATUS_PORT = 9410
+STATUS_REFRESH = 5                # 快照更新間隔（秒）
+STATUS_RATE_WINDOW = 60           # 各站點回應速率的計算視窗（秒）
+STATUS_ETA_WINDOW = 300           # ETA 以最近幾秒的完成速率推估
+
+# 股票清單（twstock.universe），由 TWSE / TPEX OpenAPI 更新 twstock/全部股票清單.json
+UNIVERSE_REFRESH_ON_START = False     # 每次開始爬取前更新（亦可用 -a refresh_universe=1）
+UNIVERSE_MAX_AGE = 12                 # 清單在幾小時內更新過就不重新下載
+
+# 盤中快照（scrapy crawl intraday），寫入 個股日成交資訊/intraday/YYYYMMDD.csv
+INTRADAY_URL = 'https://mis.twse.com.tw/stock/api/getStockInfo.jsp'
+INTRADAY_INTERVAL = 60            # 輪詢間隔（秒），對齊開盤時間
+INTRADAY_SESSION_START = '09:00'  # 交易時段（台北時間），含收盤後公布收盤價的時間
+INTRADAY_SESSION_END = '13:35'
+INTRADAY_BATCH_SIZE = 100         # 每個請求查詢的股票數
+# 盤中快照不經過 HostRateController：同一次輪詢的各批以 INTRADAY_CONCURRENCY 個併發請求同時抓取，
+# 目前清單約 1,450 支股票（15 批）每次輪詢約 4 輪請求，端到端延遲約為 4 × 單次回應時間（通常 1~3 秒）
+INTRADAY_CONCURRENCY = 4
+INTRADAY_DOWNLOAD_DELAY = 0.0     # 同站點兩個請求的最小間隔（秒）；大於 0 時 Scrapy 每個間隔只送出一個請求
+INTRADAY_BUFFER_SIZE = 256 * 1024 # 寫入緩衝區上限（bytes），每批寫完也會立即寫出
+INTRADAY_FSYNC = False            # 每次寫出後 fsync（延遲較高）
+
+# 衍生指標（twstock.indicators，需要 numpy），存於 個股日成交資訊/.indicators/
+INDICATORS_WINDOWS = [5, 20, 60]      # 移動平均的天數
+INDICATORS_UPDATE_ON_CLOSE = False    # 爬蟲正常結束後自動增量更新
+
+# 量測與 profiling（twstock.extensions.RequestMetrics）
+# 結束時摘要輸出到日誌與 個股日成交資訊/logs/YYYY-MM-DD.metrics.json
+METRICS_PROFILE_INTERVAL = 0      # 取樣 profiler 間隔（秒），0 為關閉；例如 0.005
+METRICS_PROFILE_TOP = 20          # 日誌中列出的最常出現函式數
 
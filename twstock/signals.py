@@ -0,0 +1,8 @@
+# signals.py: 專案自訂的 scrapy signals
+
+# 請求最終失敗（已無重試）時由 DailySpider 送出：request, error（錯誤類型）, message
+request_failed = object()
+
+# 已結束月份的逐檔回應產生資料列後由 DailySpider 送出：stock（股票清單項目）, year_month；
+# DailyCsvPipeline 於下次提交時記錄完成標記，規劃時該月份不再請求
+month_fetched = object()
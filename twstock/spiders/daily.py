@@ -1,10 +1,57 @@
 # spiders/daily.py: 日成交資料爬取邏輯
 import json
 import os
+import re
 import scrapy
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest
+from collections import Counter
 from datetime import datetime
-from twstock.items import DailyItem
-from twstock.logger import init_log_file, append_log
+from functools import wraps
+from urllib.parse import urlparse
+from twstock.checkpoint import Checkpoint, task_key
+from twstock.frontier import Frontier
+from twstock.items import DailyRecord
+from twstock.logger import (
+    init_log_file, append_log, read_logged_errors, parse_logged_stock,
+    init_failure_journal, append_failure, read_failures, clear_failures, failure_key,
+    EventLog, flush_logs,
+)
+from twstock.parsing import loads, parse_change, parse_int, parse_price, roc_to_western
+from twstock.planner import CrawlPlanner, NegativeCache, TradingCalendar
+from twstock.signals import month_fetched, request_failed
+from twstock.storage import ROOT_FOLDER, current_month, iter_months, parse_shard, shard_of, shard_root
+from twstock.universe import UNIVERSE_PATH, UniverseBuilder, format_diff
+
+
+def checkpointed(callback):
+    """
+    callback 產生的資料全部交給 pipeline 後才將請求標記為完成；記錄過失敗的請求不標記。
+    佇列模式的工作同樣在此時排入待確認，於檢查點提交（資料已落地）後才 ack
+    """
+    @wraps(callback)
+    def wrapper(self, response):
+        yield from callback(self, response)
+        if response.meta.get('twstock_failed'):
+            return
+        if self.frontier is not None and 'frontier_task' in response.meta:
+            self.pending_acks.append(response.meta['frontier_task'])
+        key = response.meta.get('checkpoint_key')
+        if key:
+            self.checkpoint.mark(key)
+    return wrapper
+
+
+def interleave(*iterables):
+    """輪流從各個 iterable 取出元素，直到全部耗盡"""
+    iterators = [iter(it) for it in iterables]
+    while iterators:
+        for it in list(iterators):
+            try:
+                yield next(it)
+            except StopIteration:
+                iterators.remove(it)
+
 
 class DailySpider(scrapy.Spider):
     name = 'daily'
@@ -13,79 +60,708 @@ class DailySpider(scrapy.Spider):
     # 處理重定向狀態碼
     handle_httpstatus_list = [307, 302, 301]
 
-    def __init__(self):
-        # 初始化 log 檔案
-        self.log_path = init_log_file('個股日成交資訊/logs')
+    # 全市場每日收盤行情（bulk 模式）：每個市場每個交易日只需一個請求
+    TWSE_BULK_URL = 'https://www.twse.com.tw/rwd/zh/afterTrading/MI_INDEX'
+    TPEX_BULK_URL = 'https://www.tpex.org.tw/www/zh-tw/afterTrading/otc'
+
+    def __init__(self, mode='stock', date=None, start=None, end=None, retry_failed=None,
+                 plan_only=False, shard=None, frontier=None, resume=False, refresh_universe=False,
+                 *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # shard: 'i/n'，只處理股票代號雜湊後屬於第 i 片的股票，並輸出到該分片自己的根資料夾
+        self.shard = parse_shard(shard) if shard else None
+        self.output_root = shard_root(*self.shard) if self.shard else ROOT_FOLDER
+        self.logs_folder = os.path.join(self.output_root, 'logs')
+        # 初始化 log 檔案與失敗紀錄
+        self.log_path = init_log_file(self.logs_folder)
+        self.journal_path = init_failure_journal(self.logs_folder)
+        # 結構化事件日誌；經由 from_crawler 建立時會改用設定中的事件等級
+        self.events = EventLog(self.logs_folder)
+        # retry_failed: 只重送指定日期（YYYY-MM-DD）失敗紀錄中的請求
+        self.retry_failed = retry_failed
+        self.retry_journal_path = None
+        if retry_failed:
+            if not re.fullmatch(r'\d{4}-\d{2}-\d{2}', retry_failed):
+                raise ValueError(f"retry_failed 格式須為 YYYY-MM-DD: {retry_failed}")
+            self.retry_journal_path = init_failure_journal(self.logs_folder, retry_failed)
+        self.succeeded = set()
+        # 佇列模式：callback 已處理完、等待檢查點提交後才 ack 的工作
+        self.pending_acks = []
+        # 進度：各市場預計發出的請求數，逐檔模式另記錄各股票的月份數（狀態端點使用）
+        self.planned_requests = {}
+        self.plan_counts = Counter()
+        # plan_only: 只印出規劃結果與預估時間，不發出任何請求
+        self.plan_only = str(plan_only).lower() in ('1', 'true', 'yes')
+        self.calendar = TradingCalendar()
+        # 檢查點：記錄規劃與已完成的請求；resume=1 時依上次的規劃接續
+        self.resume = str(resume).lower() in ('1', 'true', 'yes')
+        self.checkpoint = Checkpoint(self.output_root)
+        self.negative_cache = NegativeCache(os.path.join(self.output_root, '.negative_cache.json'))
+        # refresh_universe: 開始前由 OpenAPI 更新股票清單（清單在 UNIVERSE_MAX_AGE 小時內更新過則略過）
+        self.refresh_universe = str(refresh_universe).lower() in ('1', 'true', 'yes')
+        # mode: 'stock'（逐檔抓取，預設）或 'bulk'（全市場行情表）
+        if mode not in ('stock', 'bulk'):
+            raise ValueError(f"不支援的 mode: {mode}（可用 stock / bulk）")
+        self.mode = mode
+        # frontier: 共用工作佇列模式；'1' 使用 FRONTIER_PATH，其他值視為佇列檔路徑
+        self.frontier_arg = frontier
+        self.frontier = None
+        if frontier and mode != 'stock':
+            raise ValueError("frontier 模式只支援 mode=stock")
+        # date: 查詢日期 YYYYMMDD，預設為今日
+        self.query_date = date or datetime.now().strftime('%Y%m%d')
+        # start / end: 歷史回補的年月區間 YYYYMM（含），只給其一時視為單月
+        self.backfill = bool(start or end)
+        self.start_month = start or end or self.query_date[:6]
+        self.end_month = end or start or self.query_date[:6]
+        for value in (self.start_month, self.end_month):
+            if not re.fullmatch(r'\d{6}', value):
+                raise ValueError(f"start / end 格式須為 YYYYMM: {value}")
+        if self.start_month > self.end_month:
+            raise ValueError(f"start ({self.start_month}) 不可晚於 end ({self.end_month})")
         # self.logger.info("🚀 DailySpider 初始化完成")
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        # 結構化事件日誌（各事件類型的等級由 EVENT_LOG_LEVELS 設定）
+        spider.events = EventLog.from_settings(spider.logs_folder, crawler.settings)
+        crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        spider.checkpoint.interval = crawler.settings.getfloat('CHECKPOINT_INTERVAL', 5.0)
+        return spider
+
     def convert_roc_to_western_date(self, date_str):
         """將民國年日期轉換為西元年 YYYYMMDD 格式"""
-        parts = date_str.split('/')
-        if len(parts)==3:
-            try:
-                roc_year = int(parts[0])
-                western_year = roc_year + 1911
-                month = f"{int(parts[1]):02d}"
-                day = f"{int(parts[2]):02d}"
-                return f"{western_year}{month}{day}"
-            except ValueError:
-                append_log(self.log_path, '日期轉換', date_str, '日期格式錯誤')
-                return None
+        date = roc_to_western(date_str)
+        if date is not None:
+            return str(date)
+        if len(date_str.split('/')) == 3:
+            append_log(self.log_path, '日期轉換', date_str, '日期格式錯誤')
+            return None
         # fallback：移除斜線並補零，或直接回傳原字串
         return date_str.replace('/', '')
 
+    def row_date(self, date_str):
+        """資料列日期 -> 整數 YYYYMMDD（民國日期轉換有快取），失敗回傳 None"""
+        date = roc_to_western(date_str)
+        if date is None:
+            converted = self.convert_roc_to_western_date(date_str)
+            if converted and len(converted) == 8 and converted.isdigit():
+                date = int(converted)
+        return date
+
+    def build_record(self, s, market, date, volume, amount, open_, high, low, close, change,
+                     transactions, volume_unit=1, amount_unit=1):
+        """
+        上市 / 上櫃、逐檔 / 全市場共用的資料列轉換；*_unit 為股數與金額的單位（仟股、仟元為 1000）。
+        成交股數或金額無法解析時視為格式錯誤，回傳 None。
+        """
+        volume, amount = parse_int(volume), parse_int(amount)
+        if volume is None or amount is None:
+            return None
+        change, ex_rights = parse_change(change)
+        return DailyRecord(
+            s['代碼'], s['名稱'], market, date,
+            volume * volume_unit, amount * amount_unit,
+            parse_price(open_), parse_price(high), parse_price(low), parse_price(close),
+            change, ex_rights, parse_int(transactions),
+        )
+
+    def load_stocks(self):
+        """讀取股票清單，依 (代碼, 市場) 去除重複（同一檔股票可能出現在多個類別）；有指定 shard 時只保留該分片"""
+        with open(UNIVERSE_PATH, encoding='utf-8') as f:
+            stocks = json.load(f)
+        unique = {}
+        for s in stocks:
+            if self.shard and shard_of(s.get('代碼', ''), self.shard[1]) != self.shard[0]:
+                continue
+            unique.setdefault((s.get('代碼'), s.get('市場')), s)
+        return list(unique.values())
+
+    def update_universe(self):
+        """由 OpenAPI 更新股票清單並記錄差異；失敗時沿用現有清單"""
+        max_age = self.settings.getfloat('UNIVERSE_MAX_AGE', 12) * 3600
+        try:
+            result = UniverseBuilder(logger=self.logger).refresh(max_age=max_age)
+        except Exception as e:
+            self.logger.warning(f"⚠️ 股票清單更新失敗，沿用現有清單: {e}")
+            return
+        if result['skipped']:
+            self.logger.info("📋 股票清單仍在有效期限內，不需更新")
+            return
+        counts = '、'.join(f"{market} {n} 筆" for market, n in result['counts'].items())
+        self.logger.info(f"🔄 股票清單已更新：{counts}，耗時 {result['seconds']}s")
+        for line in format_diff(result['diff']):
+            self.logger.info(line)
+        self.events.emit(
+            'universe', 'WARNING' if result['errors'] else 'INFO',
+            counts=result['counts'], errors=result['errors'],
+            **{kind: [s['代碼'] for s in items] for kind, items in result['diff'].items()},
+        )
+
     def start_requests(self):
+        # 檢查點提交時一併清除已成功請求的失敗紀錄並確認佇列工作；於 pipeline 開啟後註冊，排在各 pipeline 寫入資料之後
+        self.checkpoint.add_hook(self.clear_succeeded)
+        self.checkpoint.add_hook(self.ack_committed)
+        # 交易日曆與無資料快取（依設定檔建立）
+        # 找不到休市日清單時不規劃：國定假日會被當成交易日，月底遇到休市日的月份也無法判斷是否完整
+        holidays_file = self.settings.get('HOLIDAYS_FILE')
+        try:
+            self.calendar = TradingCalendar.from_file(holidays_file)
+        except FileNotFoundError:
+            self.logger.error(
+                f"❌ 找不到休市日清單 {holidays_file}，不發出任何請求"
+                f"（執行 scrapy holidays 產生，或將 HOLIDAYS_FILE 設為空字串改為只排除週末）"
+            )
+            append_log(self.log_path, 'SYSTEM', '系統', f'找不到休市日清單: {holidays_file}')
+            return
+        if not holidays_file:
+            self.logger.warning("⚠️ 未設定 HOLIDAYS_FILE，交易日曆只排除週末，國定假日會被當成交易日")
+        else:
+            years = self.calendar.uncovered_years(iter_months(self.start_month, self.end_month))
+            if years:
+                self.logger.warning(
+                    f"⚠️ 休市日清單未涵蓋 {'、'.join(years)} 年，這些年度只排除週末"
+                    f"（執行 scrapy holidays --years {' '.join(years)} 更新）"
+                )
+        self.negative_cache = NegativeCache(
+            os.path.join(self.output_root, '.negative_cache.json'),
+            ttl_days=self.settings.getfloat('NEGATIVE_CACHE_DAYS', 7),
+        )
+        if self.refresh_universe or self.settings.getbool('UNIVERSE_REFRESH_ON_START'):
+            self.update_universe()
         self.logger.info("📋 開始讀取股票清單...")
         # 1) 讀 JSON 清單
-        project_root = os.path.dirname(os.path.dirname(__file__))
-        json_path = os.path.join(project_root, '全部股票清單.json')
         try:
-            with open(json_path, encoding='utf-8') as f:
-                stocks = json.load(f)
+            stocks = self.load_stocks()
             self.logger.info(f"✅ 成功讀取 {len(stocks)} 支股票")
         except Exception as e:
             self.logger.error(f"❌ 無法讀取股票清單: {e}")
             append_log(self.log_path, 'SYSTEM', '系統', f'讀取股票清單失敗: {e}')
             return
 
-        # 2) 今日參數
-        today = datetime.now().strftime('%Y%m%d')
-        date_str = f"{today[:4]}/{today[4:6]}/{today[6:]}"
+        if self.retry_failed:
+            requests = list(self.retry_requests(stocks))
+            self.planned_requests = dict(Counter(r.meta['stock']['市場'] for r in requests))
+            yield from requests
+            return
 
-        # 3) 篩選
+        if self.resume and not self.frontier_arg:
+            requests = self.resume_requests(stocks)
+            if requests is not None:
+                yield from requests
+                return
+
+        # 2) 篩選
         listed_stocks = [s for s in stocks if s.get('市場') == '上市']
         otc_stocks    = [s for s in stocks if s.get('市場') == '上櫃']
-        self.logger.info(f"📊 將處理 {len(listed_stocks)} 支上市，{len(otc_stocks)} 支上櫃")
-
-        # 4) 同一迴圈交錯發出上市與上櫃請求
-        max_len = max(len(listed_stocks), len(otc_stocks))
-        for i in range(max_len):
-            # 上市請求
-            if i < len(listed_stocks):
-                s = listed_stocks[i]
-                code, name = s['代碼'], s['名稱']
-                url = (
-                    'https://www.twse.com.tw/rwd/zh/afterTrading/STOCK_DAY'
-                    f'?date={today}&stockNo={code}&response=json'
-                )
-                yield scrapy.Request(
-                    url,
-                    callback=self.parse_listed,
-                    meta={'stock': s},
-                    errback=self.handle_error
-                )
 
-            # 上櫃請求
-            if i < len(otc_stocks):
-                s = otc_stocks[i]
-                code, name = s['代碼'], s['名稱']
-                yield scrapy.FormRequest(
-                    url='https://www.tpex.org.tw/www/zh-tw/afterTrading/tradingStock',
-                    formdata={'date': date_str, 'code': code, 'response': 'json'},
-                    callback=self.parse_otc,
-                    meta={'stock': s},
-                    errback=self.handle_error
+        if self.mode == 'bulk':
+            dates = self.bulk_dates()
+            self.planned_requests = {'上市': len(dates), '上櫃': len(dates)}
+            if self.plan_only:
+                self.logger.info(f"📝 規劃：bulk 模式 {len(dates)} 個交易日，共 {len(dates) * 2} 個請求")
+                return
+            self.checkpoint.start(self.checkpoint_params(), [
+                [market, 'BULK', '', date] for date in dates for market in ('上市', '上櫃')
+            ])
+            for date in dates:
+                yield from self.bulk_requests(date, listed_stocks, otc_stocks)
+            return
+
+        if self.frontier_arg and not self.plan_only:
+            yield from self.frontier_requests(listed_stocks, otc_stocks)
+            return
+
+        months = list(iter_months(self.start_month, self.end_month))
+        self.logger.info(
+            f"📊 將處理 {len(listed_stocks)} 支上市，{len(otc_stocks)} 支上櫃，"
+            f"{months[0]} ~ {months[-1]} 共 {len(months)} 個月"
+        )
+
+        # 3) 規劃：依磁碟狀態、無資料快取與交易日曆決定真正需要的請求
+        # 規劃結果先全部算出，開始前即可得知總請求數與預估時間
+        self.planner = CrawlPlanner(
+            self.output_root, self.calendar, self.negative_cache, canonical_root=ROOT_FOLDER,
+        )
+        listed_plan = list(self.planner.plan(listed_stocks, months))
+        otc_plan = list(self.planner.plan(otc_stocks, months))
+        self.planned_requests = dict(self.planner.planned)
+        self.plan_counts = Counter((s['市場'], s['代碼']) for s, _ in listed_plan + otc_plan)
+        self.log_plan()
+
+        if self.plan_only:
+            for stock, year_month in interleave(listed_plan, otc_plan):
+                self.logger.debug(f"📝 {stock['市場']} {stock['代碼']} {stock['名稱']} {year_month}")
+            return
+        self.checkpoint.start(self.checkpoint_params(), [
+            [s['市場'], s['代碼'], s['名稱'], ym] for s, ym in interleave(listed_plan, otc_plan)
+        ])
+
+        # 4) 交錯發出上市與上櫃請求，讓兩個站點同時保持忙碌
+        yield from interleave(
+            self.month_requests(listed_plan, self.listed_request),
+            self.month_requests(otc_plan, self.otc_request),
+        )
+
+    def checkpoint_params(self):
+        """resume 時需要還原的執行參數"""
+        return {
+            'mode': self.mode, 'query_date': self.query_date, 'backfill': self.backfill,
+            'start_month': self.start_month, 'end_month': self.end_month,
+        }
+
+    def resume_requests(self, stocks):
+        """依上次的規劃產生尚未完成的請求；沒有檢查點時回傳 None（改為一般執行）"""
+        loaded = self.checkpoint.load()
+        if loaded is None:
+            self.logger.warning(f"⚠️ 找不到檢查點 {self.checkpoint.plan_path}，改為一般執行")
+            return None
+        params, tasks, done = loaded
+        self.mode = params['mode']
+        self.query_date = params['query_date']
+        self.backfill = params['backfill']
+        self.start_month, self.end_month = params['start_month'], params['end_month']
+        remaining = [t for t in tasks if task_key(t[0], t[1], t[3]) not in done]
+        self.logger.info(
+            f"♻️ 從檢查點接續（mode={self.mode}，{self.start_month} ~ {self.end_month}）："
+            f"共 {len(tasks)} 個請求，已完成 {len(tasks) - len(remaining)}，剩餘 {len(remaining)}"
+        )
+        self.planned_requests = dict(Counter(t[0] for t in remaining))
+        self.plan_counts = Counter((t[0], t[1]) for t in remaining if t[1] != 'BULK')
+
+        by_key = {(s['代碼'], s['市場']): s for s in stocks}
+        maps = {
+            market: {s['代碼']: s for s in stocks if s['市場'] == market}
+            for market in ('上市', '上櫃')
+        }
+        requests = []
+        for market, code, name, period in remaining:
+            if code == 'BULK':
+                make_bulk = self.listed_bulk_request if market == '上市' else self.otc_bulk_request
+                requests.append(make_bulk(period, maps[market]))
+                continue
+            s = by_key.get((code, market)) or {'代碼': code, '名稱': name, '市場': market}
+            make_request = self.listed_request if market == '上市' else self.otc_request
+            requests.extend(self.month_requests([(s, period)], make_request))
+        return requests
+
+    def frontier_requests(self, listed_stocks, otc_stocks):
+        """
+        共用工作佇列模式：把規劃結果寫入佇列（多個 worker 重複寫入不會產生重複工作），
+        再租用一批工作發出請求；其餘工作於 spider_idle 時陸續租用。
+        """
+        settings = self.settings
+        path = self.frontier_arg
+        if str(path).lower() in ('1', 'true', 'yes'):
+            path = settings.get('FRONTIER_PATH', os.path.join(ROOT_FOLDER, 'frontier.sqlite3'))
+        self.frontier = Frontier(
+            path,
+            visibility_timeout=settings.getfloat('FRONTIER_VISIBILITY_TIMEOUT', 600),
+            max_attempts=settings.getint('FRONTIER_MAX_ATTEMPTS', 5),
+        )
+        self.lease_size = settings.getint('FRONTIER_LEASE_SIZE', 50)
+        self.stocks_by_key = {(s['代碼'], s['市場']): s for s in listed_stocks + otc_stocks}
+
+        months = list(iter_months(self.start_month, self.end_month))
+        self.planner = CrawlPlanner(
+            self.output_root, self.calendar, self.negative_cache, canonical_root=ROOT_FOLDER,
+        )
+        plan = interleave(self.planner.plan(listed_stocks, months), self.planner.plan(otc_stocks, months))
+        added = self.frontier.add(
+            ((s['市場'], s['代碼'], s['名稱'], ym) for s, ym in plan),
+            seeded_on=self.query_date,
+        )
+        self.logger.info(f"📥 工作佇列 {path}：新排入 {added} 個工作，worker {self.frontier.worker}")
+        yield from self.lease_requests()
+
+    def lease_requests(self):
+        """向佇列租用一批工作並轉為請求；請求 meta 帶有 frontier_task 供 ack / nack"""
+        for task in self.frontier.lease(self.lease_size):
+            s = self.stocks_by_key.get((task['code'], task['market'])) or {
+                '代碼': task['code'], '名稱': task['name'], '市場': task['market'],
+            }
+            ym = task['year_month']
+            date = self.query_date if ym == self.query_date[:6] else f"{ym}01"
+            make_request = self.listed_request if task['market'] == '上市' else self.otc_request
+            request = make_request(s, date)
+            request.meta['frontier_task'] = task['task_id']
+            # 佇列模式不寫入檢查點檔案，完成標記只用來依 CHECKPOINT_INTERVAL 定期提交（ack）
+            request.meta['checkpoint_key'] = task_key(task['market'], task['code'], ym)
+            yield request
+
+    def spider_idle(self, spider):
+        """佇列模式下閒置時續租工作；其他 worker 仍持有未逾時的租約時繼續等待，以便接手逾時工作"""
+        if self.frontier is None:
+            return
+        # 閒置時已處理完的工作先提交並 ack，否則自己仍持有的租約會讓爬蟲一直等待
+        self.checkpoint.commit()
+        requests = list(self.lease_requests())
+        for request in requests:
+            self.crawler.engine.crawl(request)
+        counts = self.frontier.counts()
+        if requests or counts.get('leased', 0):
+            if requests:
+                self.logger.info(
+                    f"📥 租用 {len(requests)} 個工作（待處理 {counts.get('pending', 0)}、"
+                    f"處理中 {counts.get('leased', 0)}、完成 {counts.get('done', 0)}）"
                 )
+            raise DontCloseSpider
+
+    def log_plan(self):
+        planner = self.planner
+        delay = self.settings.getfloat('DOWNLOAD_DELAY', 0)
+        minutes = planner.estimate_seconds(delay) / 60
+        skipped = '、'.join(f"{reason} {count}" for reason, count in sorted(planner.skipped.items()))
+        self.logger.info(
+            f"📝 規劃：上市 {planner.planned['上市']} 個、上櫃 {planner.planned['上櫃']} 個請求，"
+            f"略過 {sum(planner.skipped.values())} 個（{skipped or '無'}），"
+            f"預估約 {minutes:.1f} 分鐘（DOWNLOAD_DELAY={delay}）"
+        )
+
+    def month_requests(self, plan, make_request):
+        """由規劃結果產生請求"""
+        for s, year_month in plan:
+            # 當月沿用查詢日期；歷史月份以 1 號查詢（API 回傳整個月份）
+            if year_month == self.query_date[:6]:
+                date = self.query_date
+            else:
+                date = f"{year_month}01"
+            request = make_request(s, date)
+            request.meta['checkpoint_key'] = task_key(s['市場'], s['代碼'], year_month)
+            yield request
+
+    def listed_request(self, s, date):
+        """上市個股日成交（STOCK_DAY），date 格式 YYYYMMDD"""
+        url = (
+            'https://www.twse.com.tw/rwd/zh/afterTrading/STOCK_DAY'
+            f'?date={date}&stockNo={s["代碼"]}&response=json'
+        )
+        return scrapy.Request(
+            url,
+            callback=self.parse_listed,
+            meta={'stock': s, 'year_month': date[:6], 'date': date},
+            errback=self.handle_error
+        )
+
+    def otc_request(self, s, date):
+        """上櫃個股日成交（tradingStock），date 格式 YYYYMMDD"""
+        return scrapy.FormRequest(
+            url='https://www.tpex.org.tw/www/zh-tw/afterTrading/tradingStock',
+            formdata={'date': f"{date[:4]}/{date[4:6]}/{date[6:]}", 'code': s['代碼'], 'response': 'json'},
+            callback=self.parse_otc,
+            meta={'stock': s, 'year_month': date[:6], 'date': date},
+            errback=self.handle_error
+        )
+
+    def bulk_dates(self):
+        """bulk 模式的查詢日期：有指定 start/end 時為區間內的所有交易日（不超過今日）；非交易日不發請求"""
+        if not self.backfill:
+            day = datetime.strptime(self.query_date, '%Y%m%d')
+            if not self.calendar.is_trading_day(day):
+                self.logger.info(f"📅 {self.query_date} 非交易日，不發出請求")
+                return []
+            return [self.query_date]
+        today = datetime.now().strftime('%Y%m%d')
+        dates = []
+        for year_month in iter_months(self.start_month, self.end_month):
+            dates.extend(self.calendar.trading_days(year_month, until=today))
+        return dates
+
+    def bulk_requests(self, date, listed_stocks, otc_stocks):
+        """bulk 模式：每個市場只發一個全市場行情請求，回應再依股票清單展開"""
+        self.logger.info(f"📊 bulk 模式：{date} 上市 {len(listed_stocks)} 支、上櫃 {len(otc_stocks)} 支")
+        yield self.listed_bulk_request(date, {s['代碼']: s for s in listed_stocks})
+        yield self.otc_bulk_request(date, {s['代碼']: s for s in otc_stocks})
+
+    def listed_bulk_request(self, date, stocks):
+        """上市全市場行情（MI_INDEX），stocks 為 {代碼: 股票} 供展開使用"""
+        return scrapy.Request(
+            f'{self.TWSE_BULK_URL}?date={date}&type=ALLBUT0999&response=json',
+            callback=self.parse_listed_bulk,
+            meta={'stock': {'代碼': 'BULK', '名稱': date, '市場': '上市'}, 'stocks': stocks, 'date': date,
+                  'checkpoint_key': task_key('上市', 'BULK', date)},
+            errback=self.handle_error,
+            dont_filter=True,
+        )
+
+    def otc_bulk_request(self, date, stocks):
+        """上櫃全市場行情（afterTrading/otc），stocks 為 {代碼: 股票} 供展開使用"""
+        return scrapy.FormRequest(
+            url=self.TPEX_BULK_URL,
+            formdata={'date': f"{date[:4]}/{date[4:6]}/{date[6:]}", 'type': 'EW', 'response': 'json'},
+            callback=self.parse_otc_bulk,
+            meta={'stock': {'代碼': 'BULK', '名稱': date, '市場': '上櫃'}, 'stocks': stocks, 'date': date,
+                  'checkpoint_key': task_key('上櫃', 'BULK', date)},
+            errback=self.handle_error,
+            dont_filter=True,
+        )
+
+    def retry_requests(self, stocks):
+        """只重送 retry_failed 當日失敗紀錄中的請求；沒有失敗紀錄時退回解析文字日誌"""
+        by_key = {(s['代碼'], s['市場']): s for s in stocks}
+        maps = {
+            market: {s['代碼']: s for s in stocks if s['市場'] == market}
+            for market in ('上市', '上櫃')
+        }
+        records = read_failures(self.retry_journal_path)
+        if not records:
+            records = self.records_from_text_log(stocks)
+        self.logger.info(f"🔁 重送 {self.retry_failed} 的 {len(records)} 筆失敗請求")
+
+        for r in records:
+            market, code, date = r.get('market'), r.get('code'), r.get('date')
+            if market not in maps or not date:
+                continue
+            if r.get('kind') == 'bulk':
+                make_bulk = self.listed_bulk_request if market == '上市' else self.otc_bulk_request
+                yield make_bulk(date, maps[market])
+                continue
+            s = by_key.get((code, market)) or {'代碼': code, '名稱': r.get('name', ''), '市場': market}
+            make_request = self.listed_request if market == '上市' else self.otc_request
+            yield make_request(s, date)
+
+    def records_from_text_log(self, stocks):
+        """由舊格式文字日誌（read_logged_errors）取出失敗股票，重送該日所在月份"""
+        log_path = os.path.join(os.path.dirname(self.log_path), f"{self.retry_failed}.txt")
+        date = self.retry_failed.replace('-', '')
+        codes = {}
+        for line in read_logged_errors(log_path):
+            parsed = parse_logged_stock(line)
+            if parsed:
+                codes.setdefault(parsed[0], parsed[1])
+        return [
+            {'kind': 'stock', 'market': s['市場'], 'code': s['代碼'], 'name': s['名稱'], 'date': date}
+            for s in stocks if s['代碼'] in codes
+        ]
+
+    def failure_key_of(self, request):
+        """請求對應的失敗紀錄鍵（與 logger.failure_key 相同欄位）"""
+        meta = request.meta
+        stock = meta.get('stock', {})
+        return failure_key({
+            'kind': 'bulk' if 'stocks' in meta else 'stock',
+            'market': stock.get('市場'),
+            'code': stock.get('代碼'),
+            'date': meta.get('date'),
+        })
+
+    def record_failure(self, request, error, message):
+        """寫入機器可讀的失敗紀錄，供 -a retry_failed=<日期> 重送"""
+        stock = request.meta.get('stock', {})
+        request.meta['twstock_failed'] = True
+        kind, market, code, date = self.failure_key_of(request)
+        append_failure(self.journal_path, {
+            'kind': kind, 'market': market, 'code': code, 'name': stock.get('名稱'),
+            'date': date, 'url': request.url, 'method': request.method,
+            'error': error, 'message': message,
+        })
+        self.events.emit('failure', 'ERROR', **self.event_fields(request), error=error, message=message)
+        crawler = getattr(self, 'crawler', None)
+        if crawler is not None:
+            crawler.signals.send_catch_log(request_failed, request=request, error=error, message=message)
+        if self.frontier is not None and 'frontier_task' in request.meta:
+            self.frontier.nack(request.meta['frontier_task'], f"{error}: {message}")
+
+    def record_success(self, response):
+        """請求成功取得 JSON 後，從失敗紀錄中清除（隨檢查點提交批次改寫，爬蟲結束時再清除剩餘的）"""
+        self.succeeded.add(self.failure_key_of(response.request))
+
+    def record_closed_month(self, response):
+        """已結束月份的回應產生資料列後通知 pipeline 記錄完成標記（停牌、下市的股票也不會再重抓）"""
+        year_month = response.meta['year_month']
+        crawler = getattr(self, 'crawler', None)
+        if crawler is not None and year_month < current_month():
+            crawler.signals.send_catch_log(month_fetched, stock=response.meta['stock'], year_month=year_month)
+
+    def clear_succeeded(self):
+        """從失敗紀錄移除上次清除後成功的請求"""
+        if not self.succeeded:
+            return
+        clear_failures(self.journal_path, self.succeeded)
+        if self.retry_journal_path and self.retry_journal_path != self.journal_path:
+            clear_failures(self.retry_journal_path, self.succeeded)
+        self.succeeded = set()
+
+    def ack_committed(self):
+        """確認資料已隨檢查點提交的佇列工作；提交前中斷的工作在租約逾時後由其他 worker 重做"""
+        for task in self.pending_acks:
+            self.frontier.ack(task)
+        self.pending_acks = []
+
+    def event_fields(self, request):
+        """結構化事件的共同欄位"""
+        stock = request.meta.get('stock', {})
+        return {
+            'code': stock.get('代碼'),
+            'market': stock.get('市場'),
+            'endpoint': urlparse(request.url).path.rstrip('/').rsplit('/', 1)[-1],
+            'date': request.meta.get('date'),
+        }
+
+    def log_response(self, response):
+        self.events.emit(
+            'response', **self.event_fields(response.request),
+            status=response.status,
+            latency=round(response.meta.get('download_latency', 0.0), 4),
+            bytes=len(response.body),
+        )
+
+    def log_items(self, response, rows, items):
+        self.events.emit('items', **self.event_fields(response.request), rows=rows, items=items)
+
+    def closed(self, reason):
+        self.checkpoint.close(finished=reason == 'finished')
+        self.negative_cache.save()
+        self.clear_succeeded()
+        if self.frontier is not None:
+            # pipeline 皆已關閉並寫入資料，剩餘的工作可以確認
+            self.ack_committed()
+            counts = self.frontier.counts()
+            self.logger.info(f"📥 工作佇列狀態: {counts}")
+            self.frontier.close()
+        flush_logs()
+
+    @staticmethod
+    def find_column(fields, *names):
+        """依欄位名稱（忽略空白）找出欄位索引，找不到回傳 None"""
+        cleaned = [re.sub(r'\s+', '', f) for f in fields]
+        for name in names:
+            for idx, field in enumerate(cleaned):
+                if field.startswith(name):
+                    return idx
+        return None
+
+    def find_quote_table(self, data, code_field):
+        """從全市場回應中找出個股行情表，回傳 (fields, rows)"""
+        tables = list(data.get('tables') or [])
+        # 舊版 MI_INDEX 以 fieldsN / dataN 分開存放
+        for key, fields in data.items():
+            if key.startswith('fields') and isinstance(fields, list):
+                tables.append({'fields': fields, 'data': data.get('data' + key[len('fields'):], [])})
+        for table in tables:
+            fields = table.get('fields') or []
+            if self.find_column(fields, code_field) == 0:
+                return fields, table.get('data') or []
+        return None, []
+
+    @checkpointed
+    def parse_listed_bulk(self, response):
+        # 處理上市全市場行情（MI_INDEX）
+        date = response.meta['date']
+        stocks = response.meta['stocks']
+        self.log_response(response)
+        try:
+            data = loads(response.body)
+        except ValueError as e:
+            self.logger.error(f"❌ 上市全市場 {date} JSON 解析失敗: {e}")
+            append_log(self.log_path, 'BULK', '上市', f'JSON 解析失敗: {e}')
+            self.record_failure(response.request, type(e).__name__, f'JSON 解析失敗: {e}')
+            return
+        self.record_success(response)
+
+        if data.get('stat') != 'OK':
+            status = data.get('stat', 'Unknown')
+            self.logger.warning(f"⚠️ 上市全市場 {date} API 狀態異常: {status}")
+            append_log(self.log_path, 'BULK', '上市', f'API 狀態異常: {status}')
+            return
+
+        fields, rows = self.find_quote_table(data, '證券代號')
+        if fields is None:
+            self.logger.warning(f"⚠️ 上市全市場 {date} 找不到個股行情表")
+            append_log(self.log_path, 'BULK', '上市', '找不到個股行情表')
+            return
+
+        col = lambda *names: self.find_column(fields, *names)
+        idx = {
+            'volume': col('成交股數'), 'transactions': col('成交筆數'), 'amount': col('成交金額'),
+            'open': col('開盤價'), 'high': col('最高價'), 'low': col('最低價'),
+            'close': col('收盤價'), 'sign': col('漲跌(+/-)'), 'change': col('漲跌價差'),
+        }
+        if None in idx.values():
+            self.logger.warning(f"⚠️ 上市全市場 {date} 欄位不完整: {fields}")
+            append_log(self.log_path, 'BULK', '上市', f'欄位不完整: {fields}')
+            return
+
+        items_count = 0
+        record_date = int(date)
+        for row in rows:
+            s = stocks.get(row[0].strip())
+            if s is None:
+                continue
+            # 漲跌符號欄位為 HTML，例如 <p style= color:red>+</p>
+            sign = re.sub(r'<[^>]+>', '', row[idx['sign']]).strip()
+            record = self.build_record(
+                s, '上市', record_date,
+                row[idx['volume']], row[idx['amount']],
+                row[idx['open']], row[idx['high']], row[idx['low']], row[idx['close']],
+                f"{sign}{row[idx['change']]}", row[idx['transactions']],
+            )
+            if record is None:
+                self.logger.warning(f"⚠️ {s['代碼']} {s['名稱']} 數據轉換失敗: {row}")
+                continue
+            yield record
+            items_count += 1
+
+        self.logger.info(f"✅ 上市全市場 {date} 共 {len(rows)} 筆，產生 {items_count} 筆 DailyRecord")
+        self.log_items(response, len(rows), items_count)
+
+    @checkpointed
+    def parse_otc_bulk(self, response):
+        # 處理上櫃全市場行情（afterTrading/otc）
+        date = response.meta['date']
+        stocks = response.meta['stocks']
+        self.log_response(response)
+        try:
+            data = loads(response.body)
+        except ValueError as e:
+            self.logger.error(f"❌ 上櫃全市場 {date} JSON 解析失敗: {e}")
+            append_log(self.log_path, 'BULK', '上櫃', f'JSON 解析失敗: {e}')
+            self.record_failure(response.request, type(e).__name__, f'JSON 解析失敗: {e}')
+            return
+        self.record_success(response)
+
+        fields, rows = self.find_quote_table(data, '代號')
+        if fields is None:
+            self.logger.warning(f"⚠️ 上櫃全市場 {date} 無行情資料")
+            append_log(self.log_path, 'BULK', '上櫃', '無上櫃全市場行情資料')
+            return
+
+        col = lambda *names: self.find_column(fields, *names)
+        idx = {
+            'close': col('收盤'), 'change': col('漲跌'), 'open': col('開盤'),
+            'high': col('最高'), 'low': col('最低'), 'volume': col('成交股數'),
+            'amount': col('成交金額'), 'transactions': col('成交筆數'),
+        }
+        if None in idx.values():
+            self.logger.warning(f"⚠️ 上櫃全市場 {date} 欄位不完整: {fields}")
+            append_log(self.log_path, 'BULK', '上櫃', f'欄位不完整: {fields}')
+            return
+        # 全市場表以股、元為單位；若欄位標示為仟股/仟元則換算
+        vol_scale = 1000 if '仟' in fields[idx['volume']] else 1
+        amt_scale = 1000 if '仟' in fields[idx['amount']] else 1
+
+        items_count = 0
+        record_date = int(date)
+        for row in rows:
+            s = stocks.get(row[0].strip())
+            if s is None:
+                continue
+            record = self.build_record(
+                s, '上櫃', record_date,
+                row[idx['volume']], row[idx['amount']],
+                row[idx['open']], row[idx['high']], row[idx['low']], row[idx['close']],
+                row[idx['change']], row[idx['transactions']],
+                volume_unit=vol_scale, amount_unit=amt_scale,
+            )
+            if record is None:
+                self.logger.warning(f"⚠️ {s['代碼']} {s['名稱']} 數據轉換失敗: {row}")
+                continue
+            yield record
+            items_count += 1
+
+        self.logger.info(f"✅ 上櫃全市場 {date} 共 {len(rows)} 筆，產生 {items_count} 筆 DailyRecord")
+        self.log_items(response, len(rows), items_count)
 
     def handle_error(self, failure):
         """統一錯誤處理"""
@@ -93,129 +769,139 @@ class DailySpider(scrapy.Spider):
         stock = request.meta.get('stock', {})
         code = stock.get('代碼', 'Unknown')
         name = stock.get('名稱', 'Unknown')
+        # 重播模式下快取沒有的請求不是失敗，不寫入失敗紀錄（否則之後的 retry_failed 會把它們當成失敗重送）；
+        # 數量見 httpcache/ignore 統計
+        if failure.check(IgnoreRequest) and self.settings.getbool('HTTPCACHE_REPLAY'):
+            self.logger.debug(f"⏭️ {code} {name} 不在快取中，重播時略過: {request.url}")
+            return
         
         self.logger.error(f"❌ 請求失敗 {code} {name}: {failure.value}")
         append_log(self.log_path, code, name, f'請求失敗: {failure.value}')
+        self.record_failure(request, failure.type.__name__, str(failure.value))
 
+    @checkpointed
     def parse_listed(self, response):
         # 處理上市日成交 API 回傳
         s = response.meta['stock']
         code = s['代碼']
         name = s['名稱']
         
-        self.logger.info(f"📥 收到上市回應: {code} {name} (狀態碼: {response.status})")
+        self.logger.debug(f"📥 收到上市回應: {code} {name} (狀態碼: {response.status})")
+        self.log_response(response)
         
         # 處理重定向
         if response.status in [301, 302, 307]:
             self.logger.warning(f"🔄 {code} {name} 收到重定向 {response.status}")
             append_log(self.log_path, code, name, f'收到重定向狀態碼 {response.status}')
+            self.record_failure(response.request, f'HTTP{response.status}', f'收到重定向狀態碼 {response.status}')
             return
             
         try:
-            text = getattr(response, 'text', response.body.decode('utf-8'))
-            data = json.loads(text)
+            data = loads(response.body)
             self.logger.debug(f"✅ {code} {name} JSON 解析成功")
-        except Exception as e:
+        except ValueError as e:
             self.logger.error(f"❌ {code} {name} JSON 解析失敗: {e}")
             append_log(self.log_path, code, name, f'JSON 解析失敗: {e}')
+            self.record_failure(response.request, type(e).__name__, f'JSON 解析失敗: {e}')
             return
+        self.record_success(response)
             
         if data.get('stat') != 'OK':
             status = data.get('stat', 'Unknown')
             self.logger.warning(f"⚠️ {code} {name} API 狀態異常: {status}")
             append_log(self.log_path, code, name, f'API 狀態異常: {status}')
+            self.events.emit('no_data', 'WARNING', **self.event_fields(response.request), stat=status)
+            self.negative_cache.add('上市', code, response.meta['year_month'], status)
             return
             
         data_rows = data.get('data', [])
-        self.logger.info(f"📊 {code} {name} 取得 {len(data_rows)} 筆交易資料")
+        self.logger.debug(f"📊 {code} {name} 取得 {len(data_rows)} 筆交易資料")
         
         items_count = 0
         for row in data_rows:
             if len(row) < 9: 
                 continue
             
-            # 使用函式轉換日期
-            date = self.convert_roc_to_western_date(row[0])
-            
-            if date:  # 確保日期轉換成功
-                yield DailyItem(
-                    stock_no        = code,
-                    stock_name      = name,
-                    market_tag      = '上市',
-                    date            = date,
-                    volume_shares   = row[1].replace(',', ''),
-                    turnover_amount = row[2].replace(',', ''),
-                    open_price      = row[3],
-                    high_price      = row[4],
-                    low_price       = row[5],
-                    close_price     = row[6],
-                    change          = row[7],
-                    transactions    = row[8],
-                )
-                items_count += 1
+            # 轉換日期（民國日期轉換有快取）
+            date = self.row_date(row[0])
+            if not date:
+                continue
+            record = self.build_record(s, '上市', date, *row[1:9])
+            if record is None:
+                self.logger.warning(f"⚠️ {code} {name} 數據轉換失敗: {row}")
+                continue
+            yield record
+            items_count += 1
         
-        self.logger.info(f"✅ {code} {name} 成功產生 {items_count} 筆 DailyItem")
+        self.logger.debug(f"✅ {code} {name} 成功產生 {items_count} 筆 DailyRecord")
+        self.log_items(response, len(data_rows), items_count)
+        if items_count:
+            self.negative_cache.discard(s['市場'], code, response.meta['year_month'])
+            self.record_closed_month(response)
+        else:
+            # stat 為 OK 但沒有任何資料列（尚未上市的月份等）同樣視為無資料
+            self.negative_cache.add(s['市場'], code, response.meta['year_month'], '無交易資料')
 
+    @checkpointed
     def parse_otc(self, response):
         # 處理上櫃日成交 API 回傳
         s = response.meta['stock']
         code = s['代碼']
         name = s['名稱']
         
-        self.logger.info(f"📥 收到上櫃回應: {code} {name} (狀態碼: {response.status})")
+        self.logger.debug(f"📥 收到上櫃回應: {code} {name} (狀態碼: {response.status})")
+        self.log_response(response)
         
         # 處理重定向
         if response.status in [301, 302, 307]:
             self.logger.warning(f"🔄 {code} {name} 收到重定向 {response.status}")
             append_log(self.log_path, code, name, f'收到重定向狀態碼 {response.status}')
+            self.record_failure(response.request, f'HTTP{response.status}', f'收到重定向狀態碼 {response.status}')
             return
             
         try:
-            data = json.loads(response.text)
+            data = loads(response.body)
             self.logger.debug(f"✅ {code} {name} JSON 解析成功")
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             self.logger.error(f"❌ {code} {name} JSON 解析失敗: {e}")
             append_log(self.log_path, code, name, f'JSON 解析失敗: {e}')
+            self.record_failure(response.request, type(e).__name__, f'JSON 解析失敗: {e}')
             return
+        self.record_success(response)
             
         tables = data.get('tables') or []
         if not tables:
             self.logger.warning(f"⚠️ {code} {name} 無上櫃交易資料")
             append_log(self.log_path, code, name, '無上櫃日成交資料')
+            self.events.emit('no_data', 'WARNING', **self.event_fields(response.request))
+            self.negative_cache.add('上櫃', code, response.meta['year_month'], '無上櫃日成交資料')
             return
             
         data_rows = tables[0].get('data', [])
-        self.logger.info(f"📊 {code} {name} 取得 {len(data_rows)} 筆交易資料")
+        self.logger.debug(f"📊 {code} {name} 取得 {len(data_rows)} 筆交易資料")
         
         items_count = 0
         for row in data_rows:
             if len(row) < 9: 
                 continue
-            try:
-                vol = str(int(row[1].replace(',', '')) * 1000)
-                amt = str(int(row[2].replace(',', '')) * 1000)
-            except ValueError as e:
-                self.logger.warning(f"⚠️ {code} {name} 數據轉換失敗: {e}")
-                continue
-            
-            # 使用函式轉換日期
-            date = self.convert_roc_to_western_date(row[0])
             
-            if date:  # 確保日期轉換成功
-                yield DailyItem(
-                    stock_no        = code,
-                    stock_name      = name,
-                    market_tag      = '上櫃',
-                    date            = date,
-                    volume_shares   = vol,
-                    turnover_amount = amt,
-                    open_price      = row[3],
-                    high_price      = row[4],
-                    low_price       = row[5],
-                    close_price     = row[6],
-                    change          = row[7],
-                    transactions    = row[8],
-                )
-                items_count += 1
+            # 轉換日期（民國日期轉換有快取）
+            date = self.row_date(row[0])
+            if not date:
+                continue
+            # 上櫃個股日成交以仟股、仟元為單位
+            record = self.build_record(s, '上櫃', date, *row[1:9], volume_unit=1000, amount_unit=1000)
+            if record is None:
+                self.logger.warning(f"⚠️ {code} {name} 數據轉換失敗: {row}")
+                continue
+            yield record
+            items_count += 1
         
-        self.logger.info(f"✅ {code} {name} 成功產生 {items_count} 筆 DailyItem")
+        self.logger.debug(f"✅ {code} {name} 成功產生 {items_count} 筆 DailyRecord")
+        self.log_items(response, len(data_rows), items_count)
+        if items_count:
+            self.negative_cache.discard(s['市場'], code, response.meta['year_month'])
+            self.record_closed_month(response)
+        else:
+            # stat 為 OK 但沒有任何資料列（尚未上市的月份等）同樣視為無資料
+            self.negative_cache.add(s['市場'], code, response.meta['year_month'], '無交易資料')
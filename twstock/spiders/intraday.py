@@ -0,0 +1,266 @@
+# spiders/intraday.py: 盤中全市場快照（TWSE 基本市況報導 getStockInfo），依交易時段定時輪詢
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from urllib.parse import quote, urlparse
+
+import scrapy
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+
+from twstock.items import TickBatch
+from twstock.logger import EventLog, flush_logs
+from twstock.parsing import format_price, loads, parse_int, parse_price
+from twstock.planner import TradingCalendar
+from twstock.storage import ROOT_FOLDER
+from twstock.ticks import TAIPEI, SessionClock
+from twstock.universe import UNIVERSE_PATH
+
+# 市場 -> getStockInfo 的 ex_ch 前綴
+EXCHANGES = {'上市': 'tse', '上櫃': 'otc'}
+MARKETS = {prefix: market for market, prefix in EXCHANGES.items()}
+
+
+def first_quote(value):
+    """最佳五檔 '1050.0000_1055.0000_..._' -> 第一檔價格"""
+    return (value or '').split('_', 1)[0]
+
+
+class IntradaySpider(scrapy.Spider):
+    """
+    交易時段內每 INTRADAY_INTERVAL 秒（對齊開盤時間）輪詢一次，每次把股票清單分成
+    INTRADAY_BATCH_SIZE 支一批同時查詢。每批回應以內容雜湊比對上一次，未變動就不解析；
+    有變動時只輸出各股票內容有變動的資料列，由 IntradayPipeline 直接追加寫入並統計每次輪詢的延遲。
+
+    參數：
+        codes:          只輪詢指定代碼（逗號分隔）
+        polls:          輪詢幾次後結束（預設到當日時段結束）
+        ignore_session: 1 時不看交易時段，立即開始並持續輪詢（搭配 benchmarks 的模擬伺服器測試）
+    """
+    name = 'intraday'
+
+    custom_settings = {
+        # 不經過月檔 CSV pipeline，快照直接追加寫入
+        'ITEM_PIPELINES': {'twstock.pipelines.IntradayPipeline': 300},
+        # 快照過時後重試沒有意義，下一次輪詢會取得較新的資料
+        'RETRY_TIMES': 1,
+        'INDICATORS_UPDATE_ON_CLOSE': False,
+        # 日成交端點的逐站點限速會讓每批間隔 RATE_HOST_DELAYS 秒送出，改以 INTRADAY_CONCURRENCY 個併發請求同時抓取
+        'RATE_CONTROL_ENABLED': False,
+        'RANDOMIZE_DOWNLOAD_DELAY': False,
+    }
+
+    @classmethod
+    def update_settings(cls, settings):
+        super().update_settings(settings)
+        # 同一次輪詢的各批同時送出；命令列 -s 的設定優先
+        settings.set('CONCURRENT_REQUESTS_PER_DOMAIN', settings.getint('INTRADAY_CONCURRENCY', 4), priority='spider')
+        settings.set('DOWNLOAD_DELAY', settings.getfloat('INTRADAY_DOWNLOAD_DELAY', 0.0), priority='spider')
+
+    def __init__(self, codes=None, polls=None, ignore_session=False, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.output_root = ROOT_FOLDER
+        self.logs_folder = os.path.join(self.output_root, 'logs')
+        self.events = EventLog(self.logs_folder)
+        self.codes = {c.strip() for c in codes.split(',') if c.strip()} if codes else None
+        self.max_polls = int(polls) if polls else None
+        self.ignore_session = str(ignore_session).lower() in ('1', 'true', 'yes')
+        self.poll_count = 0
+        self.overruns = 0
+        # 在途的請求數（上一次輪詢未完成時跳過這次，避免請求堆積）
+        self.outstanding = 0
+        self.session_end = None
+        self.finished = False
+        self.timer = None
+        # 各批上次回應的內容雜湊、各股票上次輸出的內容
+        self.digests = {}
+        self.last_quotes = {}
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        settings = crawler.settings
+        spider.events = EventLog.from_settings(spider.logs_folder, settings)
+        spider.url = settings.get('INTRADAY_URL', 'https://mis.twse.com.tw/stock/api/getStockInfo.jsp')
+        spider.allowed_domains = [urlparse(spider.url).hostname]
+        spider.batch_size = settings.getint('INTRADAY_BATCH_SIZE', 100)
+        spider.clock = SessionClock(
+            start=settings.get('INTRADAY_SESSION_START', '09:00'),
+            end=settings.get('INTRADAY_SESSION_END', '13:35'),
+            interval=settings.getfloat('INTRADAY_INTERVAL', 60.0),
+            calendar=spider.load_calendar(settings.get('HOLIDAYS_FILE')),
+        )
+        crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        return spider
+
+    def load_calendar(self, path):
+        """盤中只需判斷今天是否交易；找不到休市日清單時仍以週末判斷繼續，但國定假日會照常輪詢"""
+        try:
+            calendar = TradingCalendar.from_file(path)
+        except FileNotFoundError:
+            self.logger.error(f"❌ 找不到休市日清單 {path}，交易日曆只排除週末，國定假日會照常輪詢（執行 scrapy holidays 產生）")
+            return TradingCalendar()
+        if path and calendar.uncovered_years([datetime.now(TAIPEI).strftime('%Y%m')]):
+            self.logger.warning("⚠️ 休市日清單未涵蓋今年，國定假日會照常輪詢（執行 scrapy holidays 更新）")
+        return calendar
+
+    def load_stocks(self):
+        with open(UNIVERSE_PATH, encoding='utf-8') as f:
+            stocks = json.load(f)
+        unique = {}
+        for s in stocks:
+            if s.get('市場') not in EXCHANGES or (self.codes and s.get('代碼') not in self.codes):
+                continue
+            unique.setdefault(s['代碼'], s)
+        return list(unique.values())
+
+    def start_requests(self):
+        stocks = self.load_stocks()
+        channels = [f"{EXCHANGES[s['市場']]}_{s['代碼']}.tw" for s in stocks]
+        self.batches = [channels[i:i + self.batch_size] for i in range(0, len(channels), self.batch_size)]
+        self.logger.info(
+            f"📡 盤中快照：{len(stocks)} 支股票分 {len(self.batches)} 批，每 {self.clock.interval:g} 秒輪詢一次"
+        )
+        if not self.batches:
+            self.finished = True
+            return []
+        self.schedule()
+        return []
+
+    async def start(self):
+        # Scrapy 2.13 以後改呼叫 start()，較舊的版本呼叫 start_requests()
+        for request in self.start_requests():
+            yield request
+
+    # ---- 排程 ----
+
+    def next_tick(self, now):
+        if self.ignore_session:
+            # 對齊 interval 的整數倍（epoch），例如每分鐘的第 0 秒
+            interval = self.clock.interval
+            return datetime.fromtimestamp(-(-now.timestamp() // interval) * interval, TAIPEI)
+        tick = self.clock.next_tick(now)
+        if tick is not None and self.session_end is None:
+            # 只輪詢第一個遇到的時段，結束後停止
+            self.session_end = self.clock.session(tick)[1]
+        if tick is None or tick > self.session_end:
+            return None
+        return tick
+
+    def schedule(self):
+        """排定下一次輪詢；已達次數上限或時段結束時標記完成，等在途請求處理完後關閉"""
+        if self.max_polls is not None and self.poll_count >= self.max_polls:
+            self.finished = True
+            return
+        now = datetime.now(TAIPEI)
+        tick = self.next_tick(now + timedelta(milliseconds=1))
+        if tick is None:
+            self.finished = True
+            self.logger.info("🏁 交易時段已結束，停止輪詢")
+            return
+        delay = (tick - now).total_seconds()
+        if delay > 60:
+            self.logger.info(f"⏳ 下一次輪詢 {tick:%Y-%m-%d %H:%M:%S}（{delay / 60:.0f} 分鐘後）")
+        # 於執行時才取得 reactor：模組層級匯入會在 spider loader 載入時安裝預設 reactor，
+        # 與設定的 TWISTED_REACTOR 不符
+        from twisted.internet import reactor
+        self.timer = reactor.callLater(max(delay, 0), self.poll, tick)
+
+    def poll(self, tick):
+        self.timer = None
+        if self.outstanding:
+            # 上一次輪詢尚未完成（回應過慢），跳過這次
+            self.overruns += 1
+            self.crawler.stats.inc_value('intraday/overruns')
+            self.logger.warning(f"⚠️ {tick:%H:%M:%S} 上一次輪詢仍有 {self.outstanding} 個請求未完成，略過這次")
+        else:
+            self.poll_count += 1
+            self.outstanding = len(self.batches)
+            for i, batch in enumerate(self.batches):
+                self.crawler.engine.crawl(self.quote_request(i, batch, tick))
+        self.schedule()
+
+    def quote_request(self, index, channels, tick):
+        scheduled = tick.timestamp()
+        url = (f"{self.url}?ex_ch={quote('|'.join(channels), safe='_.|')}"
+               f"&json=1&delay=0&_={int(scheduled * 1000)}")
+        return scrapy.Request(
+            url, callback=self.parse_quotes, errback=self.handle_error, dont_filter=True,
+            meta={'poll': self.poll_count, 'batch': index, 'scheduled': scheduled,
+                  'session_date': tick.strftime('%Y%m%d')},
+        )
+
+    def spider_idle(self, spider):
+        if not self.finished or self.outstanding:
+            raise DontCloseSpider
+
+    # ---- 解析 ----
+
+    def tick_row(self, m):
+        """getStockInfo 的一筆資料 -> TICK_FIELDS 順序的字串欄位（價格統一為兩位小數，無成交為 --）"""
+        def price(value):
+            return format_price(parse_price(value))
+
+        def count(value):
+            n = parse_int(value)
+            return '' if n is None else str(n)
+
+        return [
+            m.get('t', ''), m.get('c', ''), m.get('n', '').replace(',', ' '), MARKETS.get(m.get('ex'), ''),
+            price(m.get('z')), count(m.get('tv')), count(m.get('v')),
+            price(m.get('o')), price(m.get('h')), price(m.get('l')), price(m.get('y')),
+            price(first_quote(m.get('b'))), price(first_quote(m.get('a'))), m.get('tlong', ''),
+        ]
+
+    def batch_item(self, response_or_request, status, rows=(), exchange_time=0):
+        meta = response_or_request.meta
+        return TickBatch(
+            poll=meta['poll'], requests=len(self.batches), scheduled=meta['scheduled'],
+            session_date=meta['session_date'], batch=meta['batch'], status=status, rows=list(rows),
+            download_latency=meta.get('download_latency', 0.0), received_at=time.time(),
+            exchange_time=exchange_time,
+        )
+
+    def parse_quotes(self, response):
+        self.outstanding -= 1
+        try:
+            data = loads(response.body)
+        except ValueError:
+            self.logger.error(f"❌ 第 {response.meta['batch']} 批回應不是 JSON: {response.body[:100]!r}")
+            yield self.batch_item(response, 'failed')
+            return
+        if data.get('rtcode') not in (None, '0000'):
+            self.logger.error(f"❌ 第 {response.meta['batch']} 批回應錯誤: {data.get('rtmessage')}")
+            yield self.batch_item(response, 'failed')
+            return
+        messages = data.get('msgArray') or []
+        # 只取寫入的欄位計算雜湊（queryTime 等欄位每次都不同）
+        quotes = [(m.get('c'), m.get('t'), m.get('z'), m.get('tv'), m.get('v'), m.get('a'), m.get('b'))
+                  for m in messages]
+        digest = hashlib.blake2b(repr(quotes).encode('utf-8'), digest_size=16).digest()
+        batch = response.meta['batch']
+        if self.digests.get(batch) == digest:
+            yield self.batch_item(response, 'unchanged')
+            return
+        self.digests[batch] = digest
+        rows, exchange_time = [], 0
+        for m, q in zip(messages, quotes):
+            if self.last_quotes.get(q[0]) == q:
+                continue
+            self.last_quotes[q[0]] = q
+            rows.append(self.tick_row(m))
+            exchange_time = max(exchange_time, parse_int(m.get('tlong')) or 0)
+        yield self.batch_item(response, 'changed', rows, exchange_time)
+
+    def handle_error(self, failure):
+        self.outstanding -= 1
+        self.logger.error(f"❌ 第 {failure.request.meta['batch']} 批請求失敗: {failure.value}")
+        yield self.batch_item(failure.request, 'failed')
+
+    def closed(self, reason):
+        if self.timer is not None and self.timer.active():
+            self.timer.cancel()
+        self.logger.info(f"📡 共輪詢 {self.poll_count} 次，略過 {self.overruns} 次")
+        flush_logs()
@@ -0,0 +1,250 @@
+# storage.py: 個股日成交資訊的磁碟配置（資料夾、月檔路徑、月份完整性）
+import csv
+import json
+import os
+import zlib
+from datetime import datetime
+
+# 輸出根資料夾
+ROOT_FOLDER = '個股日成交資訊'
+# 分片（-a shard=i/n）各自的輸出根資料夾：個股日成交資訊_shards/<i>-of-<n>
+SHARDS_FOLDER = '個股日成交資訊_shards'
+# 已結束月份的壓縮歸檔（twstock.archive）：<根資料夾>/archive/<代碼>.csv.gz
+ARCHIVE_FOLDER = 'archive'
+
+# CSV 欄位順序
+CSV_FIELDS = [
+    '股票代號', '股票名稱', '日期', '成交股數', '成交金額',
+    '開盤價', '最高價', '最低價', '收盤價', '漲跌價差', '成交筆數'
+]
+
+
+def stock_folder(root, stock_no, stock_name, market_tag):
+    """每支股票一個子資料夾，例如 '個股日成交資訊/2330_台積電_上市'"""
+    return os.path.join(root, f"{stock_no}_{stock_name}_{market_tag}")
+
+
+def month_csv_path(root, stock_no, stock_name, market_tag, year_month):
+    """以年月作為檔名，例如 '.../2330_台積電_上市/202506.csv'"""
+    return os.path.join(stock_folder(root, stock_no, stock_name, market_tag), f"{year_month}.csv")
+
+
+def shard_of(stock_no, shard_count):
+    """以 CRC32 對股票代號做穩定雜湊，決定所屬分片（跨程序、跨機器結果一致）"""
+    return zlib.crc32(stock_no.encode('utf-8')) % shard_count
+
+
+def shard_root(shard_index, shard_count):
+    return os.path.join(SHARDS_FOLDER, f"{shard_index}-of-{shard_count}")
+
+
+def parse_shard(value):
+    """'i/n' -> (i, n)，格式錯誤時拋出 ValueError"""
+    try:
+        index, count = (int(v) for v in value.split('/'))
+    except (ValueError, AttributeError):
+        raise ValueError(f"shard 格式須為 i/n: {value}")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"shard 須滿足 0 <= i < n: {value}")
+    return index, count
+
+
+def current_month():
+    return datetime.now().strftime('%Y%m')
+
+
+def iter_months(start, end):
+    """依序產生 start ~ end（含）之間的年月字串 YYYYMM"""
+    year, month = int(start[:4]), int(start[4:6])
+    end_year, end_month = int(end[:4]), int(end[4:6])
+    while (year, month) <= (end_year, end_month):
+        yield f"{year}{month:02d}"
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+
+
+def is_month_complete(root, stock_no, stock_name, market_tag, year_month, this_month=None, index=None):
+    """
+    已結束的月份，且該月結束後抓取的回應已提交（DateIndex 的完成標記）才視為完整。
+    不以是否有最後一個交易日判斷：停牌、下市或月中上市的股票本來就沒有，否則每次都會重新請求。
+    只寫到月中（例如之後的每日執行中斷）的月份沒有標記，仍需請求，由 pipeline 去重補上缺少的日期。
+    當月資料仍會增加，永遠不算完整。index 為該股票資料夾的 DateIndex（可重複使用，省去重新載入）
+    """
+    if year_month >= (this_month or current_month()):
+        return False
+    path = month_csv_path(root, stock_no, stock_name, market_tag, year_month)
+    if not os.path.exists(path):
+        return False
+    if index is None:
+        index = DateIndex(os.path.dirname(path))
+    index.check_month(year_month, path)
+    return index.is_closed(year_month)
+
+
+def iter_month_files(root):
+    """
+    列出根資料夾下所有月檔，產生 (相對路徑, 檔案大小, 代碼, 市場, 名稱, 路徑)；
+    略過 logs、archive 與以 '.' 開頭的資料夾（索引、檢查點等）
+    """
+    for entry in os.scandir(root):
+        name = entry.name
+        if name.startswith('.') or name in ('logs', ARCHIVE_FOLDER) or name.count('_') < 2 or not entry.is_dir():
+            continue
+        code, rest = name.split('_', 1)
+        stock_name, market = rest.rsplit('_', 1)
+        for f in os.scandir(entry.path):
+            if f.name.endswith('.csv') and f.name[:-4].isdigit():
+                yield f"{name}/{f.name}", f.stat().st_size, code, market, stock_name, f.path
+
+
+def repair_torn_tail(path):
+    """
+    截掉檔案結尾不完整的資料列（上次寫到一半當機），回傳截掉的 bytes 數。
+    完整的資料列一定以換行結尾，只需讀取檔案最後一小段。
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return 0
+    if size == 0:
+        return 0
+    with open(path, 'r+b') as f:
+        pos = size
+        while pos > 0:
+            start = max(0, pos - 4096)
+            f.seek(start)
+            chunk = f.read(pos - start)
+            idx = chunk.rfind(b'\n')
+            if idx != -1:
+                end = start + idx + 1
+                break
+            pos = start
+        else:
+            end = 0
+        if end != size:
+            f.truncate(end)
+    return size - end
+
+
+def read_csv_dates(path):
+    """讀取月檔中已存在的日期欄位"""
+    dates = set()
+    try:
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            reader = csv.reader(f)
+            headers = next(reader, [])
+            if '日期' in headers:
+                idx = headers.index('日期')
+                for r in reader:
+                    if len(r) > idx:
+                        dates.add(r[idx])
+    except FileNotFoundError:
+        pass
+    return dates
+
+
+class DateIndex:
+    """
+    單一股票資料夾的已寫入日期索引（存於 '<股票資料夾>/.dates.json'）
+
+    每個月份記錄 [日期 bitmap, 月檔大小, 完成標記]：bitmap 第 (日-1) 位元代表該日已寫入。
+    載入月份時比對月檔大小，不一致（例如上次中途當掉）或索引損毀時才從 CSV 重建，
+    因此去重檢查與磁碟上的歷史資料量無關。
+    完成標記為 1 表示該月結束後抓取的回應已提交（見 DailyCsvPipeline），規劃時視為完整；
+    舊版只有兩個元素的索引載入後標記為 0，這些月份會再請求一次以補上標記。
+    archived 為該股票已歸檔月份的 {year_month: bitmap}（見 twstock.archive），歸檔中的日期也視為已寫入。
+    """
+
+    FILENAME = '.dates.json'
+
+    def __init__(self, folder, archived=None):
+        self.folder = folder
+        self.path = os.path.join(folder, self.FILENAME)
+        self.months = None      # {year_month: [bitmap, csv_size, closed]}，延遲載入
+        self.archived = archived or {}
+        self.checked = set()    # 本次執行已驗證過的月份
+        self.dirty = False
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                months = json.load(f)
+            if not isinstance(months, dict):
+                raise ValueError('索引格式錯誤')
+            self.months = {
+                ym: [int(v[0]), int(v[1]), int(v[2]) if len(v) > 2 else 0] for ym, v in months.items()
+            }
+        except FileNotFoundError:
+            self.months = {}
+        except (ValueError, TypeError, IndexError):
+            # 索引損毀：捨棄後由各月份 CSV 重建
+            self.months = {}
+            self.dirty = True
+
+    def check_month(self, year_month, csv_path):
+        """確認月份索引與月檔一致，必要時從 CSV 重建"""
+        if self.months is None:
+            self.load()
+        if year_month in self.checked:
+            return
+        try:
+            size = os.path.getsize(csv_path)
+        except OSError:
+            size = 0
+        entry = self.months.get(year_month)
+        if entry is None or entry[1] != size:
+            bitmap = 0
+            if size:
+                for date in read_csv_dates(csv_path):
+                    bitmap |= self.bit(date)
+            # 完成標記在提交（fsync）後才設定，月檔仍在時保留；月檔已被刪除則一併清除
+            closed = entry[2] if entry and size else 0
+            self.months[year_month] = [bitmap, size, closed]
+            self.dirty = True
+        self.checked.add(year_month)
+
+    @staticmethod
+    def bit(date):
+        try:
+            return 1 << (int(date[6:8]) - 1)
+        except ValueError:
+            return 0
+
+    def contains(self, date):
+        entry = self.months.get(date[:6])
+        if entry and entry[0] & self.bit(date):
+            return True
+        return bool(self.archived.get(date[:6], 0) & self.bit(date))
+
+    def add(self, date):
+        entry = self.months.setdefault(date[:6], [0, 0, 0])
+        entry[0] |= self.bit(date)
+        self.dirty = True
+
+    def set_size(self, year_month, size):
+        entry = self.months.setdefault(year_month, [0, 0, 0])
+        if entry[1] != size:
+            entry[1] = size
+            self.dirty = True
+
+    def mark_closed(self, year_month):
+        """記錄該月結束後抓取的回應已提交"""
+        entry = self.months.setdefault(year_month, [0, 0, 0])
+        if not entry[2]:
+            entry[2] = 1
+            self.dirty = True
+
+    def is_closed(self, year_month):
+        entry = self.months.get(year_month)
+        return bool(entry and entry[2])
+
+    def save(self):
+        """以暫存檔 + os.replace 原子性寫入索引"""
+        if not self.dirty or self.months is None:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.months, f, separators=(',', ':'), sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
@@ -0,0 +1,131 @@
+# ticks.py: 盤中快照的交易時段排程與追加寫入（IntradaySpider / IntradayPipeline 使用）
+import os
+from datetime import datetime, timedelta, timezone
+
+from twstock.storage import repair_torn_tail
+
+# 台灣沒有日光節約時間，固定 UTC+8，不受執行主機時區影響
+TAIPEI = timezone(timedelta(hours=8))
+
+INTRADAY_FOLDER = 'intraday'
+
+TICK_FIELDS = [
+    '時間', '股票代號', '股票名稱', '市場', '成交價', '當盤成交量', '累積成交量',
+    '開盤價', '最高價', '最低價', '昨收價', '最佳買價', '最佳賣價', '交易所時間戳',
+]
+
+
+class SessionClock:
+    """
+    盤中輪詢的排程：交易日的 [start, end] 之間，每 interval 秒一次，
+    時間點對齊開盤時間（09:00:00、09:01:00 ...），不因每次輪詢的耗時而漂移。
+    """
+
+    def __init__(self, start='09:00', end='13:35', interval=60.0, calendar=None):
+        self.start = self.parse_time(start)
+        self.end = self.parse_time(end)
+        self.interval = float(interval)
+        self.calendar = calendar
+
+    @staticmethod
+    def parse_time(value):
+        hour, minute = (int(v) for v in value.split(':'))
+        return timedelta(hours=hour, minutes=minute)
+
+    def is_trading_day(self, day):
+        if self.calendar is not None:
+            return self.calendar.is_trading_day(day)
+        return day.weekday() < 5
+
+    def session(self, day):
+        """某日的 (開始, 結束) datetime"""
+        midnight = datetime(day.year, day.month, day.day, tzinfo=TAIPEI)
+        return midnight + self.start, midnight + self.end
+
+    def in_session(self, now=None):
+        now = now or datetime.now(TAIPEI)
+        start, end = self.session(now)
+        return self.is_trading_day(now) and start <= now <= end
+
+    def next_tick(self, now=None):
+        """now 之後（含）最近一個對齊的輪詢時間；今天的時段已結束時找下一個交易日的開盤"""
+        now = now or datetime.now(TAIPEI)
+        day = now
+        for _ in range(30):
+            start, end = self.session(day)
+            if self.is_trading_day(day) and now <= end:
+                if now <= start:
+                    return start
+                steps = -(-(now - start).total_seconds() // self.interval)
+                tick = start + timedelta(seconds=steps * self.interval)
+                if tick <= end:
+                    return tick
+            day = (day + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+            now = max(now, day)
+        return None
+
+
+class TickWriter:
+    """
+    '<folder>/YYYYMMDD.csv'：每個交易日一個檔案，所有股票的快照依到達順序追加。
+
+    以 O_APPEND 的檔案描述子直接 os.write，不經過 csv 模組與 Python 檔案緩衝；
+    write() 把資料列編碼後放入緩衝區，超過 buffer_size bytes 立即寫出，flush() 寫出剩餘部分，
+    記憶體用量因此有上限。fsync=True 時每次 flush 後 fsync（斷電也不遺失，但延遲較高）。
+    """
+
+    def __init__(self, folder, buffer_size=256 * 1024, fsync=False):
+        self.folder = folder
+        self.buffer_size = buffer_size
+        self.fsync = fsync
+        self.buffer = bytearray()
+        self.fd = None
+        self.date = None
+        self.bytes_written = 0
+        self.rows_written = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, date):
+        return os.path.join(self.folder, f"{date}.csv")
+
+    def open(self, date):
+        """切換到 date 的檔案；上次當機寫到一半的行先截掉，新檔案寫入標頭"""
+        self.flush()
+        if self.fd is not None:
+            os.close(self.fd)
+        path = self.path(date)
+        repair_torn_tail(path)
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.date = date
+        if os.fstat(self.fd).st_size == 0:
+            self.buffer += ('﻿' + ','.join(TICK_FIELDS) + '\r\n').encode('utf-8')
+
+    def write(self, date, rows):
+        """rows 為字串欄位的 list（TICK_FIELDS 順序，欄位內不含逗號與換行）"""
+        if date != self.date:
+            self.open(date)
+        buffer = self.buffer
+        for row in rows:
+            buffer += (','.join(row) + '\r\n').encode('utf-8')
+            if len(buffer) >= self.buffer_size:
+                self.flush()
+                buffer = self.buffer
+        self.rows_written += len(rows)
+
+    def flush(self):
+        if not self.buffer or self.fd is None:
+            return
+        view = memoryview(self.buffer)
+        while view:
+            written = os.write(self.fd, view)
+            view = view[written:]
+        self.bytes_written += len(self.buffer)
+        self.buffer = bytearray()
+        if self.fsync:
+            os.fsync(self.fd)
+
+    def close(self):
+        self.flush()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
@@ -0,0 +1,278 @@
+# universe.py: 由 TWSE / TPEX OpenAPI 建立股票清單（全部股票清單.json），並比對與上一版的差異
+#
+# 用法：
+#   from twstock.universe import UniverseBuilder
+#   result = UniverseBuilder().refresh()        # 兩個市場同時抓取，寫入新清單
+#   result['diff']['renamed']                   # [{'代碼', '市場', '舊名稱', '名稱'}]
+#
+#   python 全部股票清單.py [--dry-run]          # 命令列更新
+import json
+import logging
+import os
+import re
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+PACKAGE_FOLDER = os.path.dirname(os.path.abspath(__file__))
+UNIVERSE_PATH = os.path.join(PACKAGE_FOLDER, '全部股票清單.json')
+
+# 上市 / 上櫃公司基本資料（JSON 陣列，每家公司一筆）：(網址, 代碼欄位, 名稱欄位, 產業別欄位)
+SOURCES = {
+    '上市': ('https://openapi.twse.com.tw/v1/opendata/t187ap03_L',
+             '公司代號', '公司簡稱', '產業別'),
+    '上櫃': ('https://www.tpex.org.tw/openapi/v1/mopsfin_t187ap03_O',
+             'SecuritiesCompanyCode', 'CompanyAbbreviation', 'SecuritiesIndustryCode'),
+}
+
+# 產業別代碼 -> 類別名稱（與舊版清單的類別名稱一致）；未列出的代碼直接以代碼作為類別
+INDUSTRIES = {
+    '01': '水泥工業', '02': '食品工業', '03': '塑膠工業', '04': '紡織纖維', '05': '電機機械',
+    '06': '電器電纜', '08': '玻璃陶瓷', '09': '造紙工業', '10': '鋼鐵工業', '11': '橡膠工業',
+    '12': '汽車工業', '14': '建材營造', '15': '航運業', '16': '觀光餐旅', '17': '金融保險',
+    '18': '貿易百貨', '19': '綜合', '20': '其他', '21': '化學工業', '22': '生技醫療業',
+    '23': '油電燃氣業', '24': '半導體業', '25': '電腦及週邊設備業', '26': '光電業',
+    '27': '通信網路業', '28': '電子零組件業', '29': '電子通路業', '30': '資訊服務業',
+    '31': '其他電子業', '32': '文化創意業', '33': '農業科技', '34': '電子商務',
+    '35': '綠能環保', '36': '數位雲端', '37': '運動休閒', '38': '居家生活',
+    '80': '管理股票', '91': '存託憑證',
+}
+
+# 公司基本資料只列出公司本身（4 位數代碼）；特別股（1101B、2881A、2887Z1 等）不在來源中
+COMPANY_CODE_RE = re.compile(r'^\d{4}$')
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) twstock-universe'
+
+
+def load_snapshot(path):
+    """讀取清單，回傳 {代碼: 項目}；舊版清單同一檔股票可能出現在多個類別，只保留第一筆"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            stocks = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    snapshot = {}
+    for s in stocks:
+        if s.get('代碼'):
+            snapshot.setdefault(s['代碼'], s)
+    return snapshot
+
+
+def diff_snapshots(old, new):
+    """
+    比較兩份 {代碼: 項目}：
+    added（新上市櫃）、delisted（下市櫃）、renamed（名稱變更）、transferred（上櫃轉上市等市場變更）
+    """
+    result = {'added': [], 'delisted': [], 'renamed': [], 'transferred': []}
+    for code in sorted(set(old) | set(new)):
+        before, after = old.get(code), new.get(code)
+        if before is None:
+            result['added'].append(after)
+        elif after is None:
+            result['delisted'].append(before)
+        else:
+            if before.get('名稱') != after.get('名稱'):
+                result['renamed'].append({'代碼': code, '市場': after['市場'],
+                                          '舊名稱': before.get('名稱'), '名稱': after['名稱']})
+            if before.get('市場') != after.get('市場'):
+                result['transferred'].append({'代碼': code, '名稱': after['名稱'],
+                                              '舊市場': before.get('市場'), '市場': after['市場']})
+    return result
+
+
+def _write_json(path, data, **kwargs):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, **kwargs)
+    os.replace(tmp_path, path)
+
+
+class UniverseBuilder:
+    """
+    以兩個執行緒同時下載上市、上櫃公司基本資料（OpenAPI 的結構化 JSON，不需瀏覽器），
+    轉為清單格式 [{代碼, 名稱, 類別, 市場}]，與目前的清單比對後寫入：
+
+    - path:                      新清單（原子替換）
+    - .universe_cache.json:      各來源的 ETag / Last-Modified 與原始資料，來源未變動（304）時直接沿用
+    - .universe_changes.jsonl:   每次有差異時追加一行差異紀錄
+
+    某個市場下載失敗，或筆數少於上一版的 min_ratio 倍（來源異常）時，該市場沿用上一版的資料，
+    不會把整個市場誤判為下市。
+    來源只有公司，上一版中的特別股等非公司代碼在其公司（代碼前 4 碼）仍在來源中時沿用，
+    不會被當成下市而從清單移除。
+    """
+
+    def __init__(self, path=UNIVERSE_PATH, timeout=15.0, retries=3, min_ratio=0.5, logger=None):
+        self.path = path
+        folder = os.path.dirname(os.path.abspath(path))
+        self.cache_path = os.path.join(folder, '.universe_cache.json')
+        self.changes_path = os.path.join(folder, '.universe_changes.jsonl')
+        self.timeout = timeout
+        self.retries = retries
+        self.min_ratio = min_ratio
+        self.logger = logger or logging.getLogger(__name__)
+
+    # ---- 下載 ----
+
+    def fetch(self, url, cached):
+        """下載 JSON；帶上次的 ETag / Last-Modified，回應 304 時回傳快取的資料"""
+        headers = {'User-Agent': USER_AGENT, 'Accept': 'application/json'}
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+        error = None
+        for attempt in range(self.retries):
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, headers=headers),
+                                            timeout=self.timeout) as response:
+                    records = json.loads(response.read().decode('utf-8-sig'))
+                    return {'etag': response.headers.get('ETag'),
+                            'last_modified': response.headers.get('Last-Modified'),
+                            'records': records}
+            except urllib.error.HTTPError as e:
+                if e.code == 304 and 'records' in cached:
+                    return cached
+                error = e
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                error = e
+            if attempt + 1 < self.retries:
+                time.sleep(2 ** attempt)
+        raise error
+
+    def fetch_all(self, cache):
+        """同時下載各市場，回傳 ({市場: 下載結果}, {市場: 錯誤})"""
+        results, errors = {}, {}
+        with ThreadPoolExecutor(max_workers=len(SOURCES)) as pool:
+            futures = {
+                market: pool.submit(self.fetch, url, cache.get(market, {}))
+                for market, (url, *_) in SOURCES.items()
+            }
+            for market, future in futures.items():
+                try:
+                    results[market] = future.result()
+                except Exception as e:
+                    errors[market] = f"{type(e).__name__}: {e}"
+        return results, errors
+
+    @staticmethod
+    def parse(market, records):
+        """OpenAPI 資料列 -> [{代碼, 名稱, 類別, 市場}]"""
+        _, code_field, name_field, industry_field = SOURCES[market]
+        stocks = []
+        for r in records:
+            code = str(r.get(code_field, '')).strip()
+            name = str(r.get(name_field, '')).strip()
+            if not code or not name:
+                continue
+            industry = str(r.get(industry_field, '')).strip()
+            stocks.append({'代碼': code, '名稱': name,
+                           '類別': INDUSTRIES.get(industry.zfill(2), industry or '其他'), '市場': market})
+        return stocks
+
+    @staticmethod
+    def carry_over(previous, parsed):
+        """上一版中不在來源內的非公司代碼（特別股等），其公司仍在來源中時沿用"""
+        codes = {s['代碼'] for s in parsed}
+        return [s for s in previous
+                if not COMPANY_CODE_RE.match(s['代碼']) and s['代碼'] not in codes and s['代碼'][:4] in codes]
+
+    # ---- 更新 ----
+
+    def age(self):
+        """目前清單距上次更新的秒數；不存在時為 None"""
+        try:
+            return time.time() - os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def refresh(self, max_age=0, dry_run=False):
+        """
+        更新清單並回傳結果：
+        skipped（清單在 max_age 秒內更新過而略過）、counts（各市場筆數）、errors（沿用舊資料的市場與原因）、
+        diff（見 diff_snapshots）、seconds
+        """
+        started = time.perf_counter()
+        age = self.age()
+        if max_age and age is not None and age < max_age:
+            return {'skipped': True, 'counts': {}, 'errors': {}, 'diff': diff_snapshots({}, {}),
+                    'seconds': 0.0}
+
+        old = load_snapshot(self.path)
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                cache = json.load(f)
+        except (FileNotFoundError, ValueError):
+            cache = {}
+        results, errors = self.fetch_all(cache)
+
+        stocks, counts = [], {}
+        for market in SOURCES:
+            previous = [s for s in old.values() if s.get('市場') == market]
+            parsed = self.parse(market, results[market]['records']) if market in results else []
+            if market in results and len(parsed) < len(previous) * self.min_ratio:
+                errors[market] = f"只取得 {len(parsed)} 筆（上一版 {len(previous)} 筆）"
+            if market in errors:
+                self.logger.warning(f"⚠️ {market} 清單更新失敗，沿用上一版：{errors[market]}")
+                parsed = previous
+            else:
+                cache[market] = results[market]
+                parsed += self.carry_over(previous, parsed)
+            stocks.extend(parsed)
+            counts[market] = len(parsed)
+
+        # 同一代碼同時出現在兩個市場（上櫃轉上市的過渡期）時以上市為準
+        new = {}
+        for s in stocks:
+            if s['代碼'] not in new or s['市場'] == '上市':
+                new[s['代碼']] = s
+        diff = diff_snapshots(old, new)
+        if not dry_run:
+            ordered = sorted(new.values(), key=lambda s: (s['市場'] != '上市', s['代碼']))
+            _write_json(self.path, ordered, indent=2)
+            _write_json(self.cache_path, cache, separators=(',', ':'))
+            if any(diff.values()):
+                with open(self.changes_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), **diff},
+                                       ensure_ascii=False) + '\n')
+        return {'skipped': False, 'counts': counts, 'errors': errors, 'diff': diff,
+                'seconds': round(time.perf_counter() - started, 3)}
+
+
+def format_diff(diff):
+    """差異摘要的文字行"""
+    lines = [
+        f"新增 {len(diff['added'])}、下市櫃 {len(diff['delisted'])}、"
+        f"更名 {len(diff['renamed'])}、轉市場 {len(diff['transferred'])}"
+    ]
+    for s in diff['added']:
+        lines.append(f"  ＋ {s['市場']} {s['代碼']} {s['名稱']}（{s['類別']}）")
+    for s in diff['delisted']:
+        lines.append(f"  － {s['市場']} {s['代碼']} {s['名稱']}")
+    for s in diff['renamed']:
+        lines.append(f"  ✎ {s['市場']} {s['代碼']} {s['舊名稱']} → {s['名稱']}")
+    for s in diff['transferred']:
+        lines.append(f"  ⇄ {s['代碼']} {s['名稱']} {s['舊市場']} → {s['市場']}")
+    return lines
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='由 TWSE / TPEX OpenAPI 更新 全部股票清單.json')
+    parser.add_argument('--output', default=UNIVERSE_PATH, help='清單檔路徑')
+    parser.add_argument('--dry-run', action='store_true', help='只顯示差異，不寫入')
+    parser.add_argument('--max-age', type=float, default=0, help='清單在幾小時內更新過就略過')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    result = UniverseBuilder(args.output).refresh(max_age=args.max_age * 3600, dry_run=args.dry_run)
+    if result['skipped']:
+        print(f"⏭️ 清單在 {args.max_age:g} 小時內已更新，略過")
+        return 0
+    counts = '、'.join(f"{market} {n} 筆" for market, n in result['counts'].items())
+    print(f"📦 {counts}，耗時 {result['seconds']}s" + ('（dry run，未寫入）' if args.dry_run else ''))
+    for line in format_diff(result['diff']):
+        print(line)
+    return 1 if result['errors'] else 0
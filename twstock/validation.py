@@ -0,0 +1,163 @@
+# validation.py: 日成交資料列的批次品質檢查（向量化，需要 numpy），供 DailyValidationPipeline 使用
+import csv
+import os
+
+from twstock.archive import ArchiveManifest
+from twstock.parsing import PRICE_SCALE, parse_csv_row
+from twstock.storage import month_csv_path
+
+try:
+    import numpy as np
+except ImportError:  # numpy 為選用相依套件
+    np = None
+
+# 缺值（None）在陣列中的表示
+NA = -2 ** 62
+
+# 原因代碼與說明；預設只有 REJECT_REASONS 會被剔除，其餘只記錄到隔離檔
+REASONS = {
+    'missing_price':          '有成交量但價格為 --，或只有部分價格',
+    'non_positive_price':     '價格小於等於 0',
+    'high_lt_low':            '最高價低於最低價',
+    'open_out_of_range':      '開盤價不在 [最低, 最高] 之間',
+    'close_out_of_range':     '收盤價不在 [最低, 最高] 之間',
+    'negative_count':         '成交股數、金額或筆數為負數',
+    'unit_scale':             '成交均價（金額 / 股數）與收盤價相差超過 UNIT_RATIO 倍，股數或金額單位錯誤',
+    'amount_mismatch':        '成交均價不在 [最低, 最高] 之間，或無成交量卻有成交金額',
+    'transactions_gt_volume': '成交筆數大於成交股數',
+    'change_mismatch':        '收盤價 - 漲跌價差 不等於前一交易日收盤價（除權息日除外）',
+    'volume_jump':            '成交股數與前一交易日相差 500 倍以上，可能為單位錯誤',
+}
+REJECT_REASONS = (
+    'missing_price', 'non_positive_price', 'high_lt_low', 'open_out_of_range',
+    'close_out_of_range', 'negative_count', 'unit_scale',
+)
+
+# 均價 / 收盤價超過此倍數（或低於其倒數）視為單位錯誤（VALIDATION_UNIT_RATIO）。
+# 仟股 / 仟元換算錯誤會差 1000 倍，正常資料的均價不會偏離收盤價數倍以上，取 300 留下兩邊的餘裕
+UNIT_RATIO = 300
+JUMP_RATIO = 500
+
+
+def _column(records, name):
+    return np.array([NA if v is None else v for v in (getattr(r, name) for r in records)], dtype=np.int64)
+
+
+def check_rows(records, tolerance=0.01, unit_ratio=UNIT_RATIO):
+    """
+    單日（不需歷史資料）的檢查，回傳 {原因代碼: bool 陣列}；records 為 DailyRecord 列表。
+    價格為 PRICE_SCALE 定點整數，全部以 int64 陣列比較。
+    """
+    o, h, l, c = (_column(records, n) for n in ('open_price', 'high_price', 'low_price', 'close_price'))
+    volume, amount, transactions = (_column(records, n) for n in ('volume_shares', 'turnover_amount', 'transactions'))
+    present = np.stack([o != NA, h != NA, l != NA, c != NA])
+    priced = present.all(axis=0)
+    traded = volume > 0
+    ordered = priced & (h >= l)
+    result = {
+        'missing_price': ~priced & (traded | present.any(axis=0)),
+        'non_positive_price': priced & ((o <= 0) | (h <= 0) | (l <= 0) | (c <= 0)),
+        'high_lt_low': priced & (h < l),
+        'open_out_of_range': ordered & ((o < l) | (o > h)),
+        'close_out_of_range': ordered & ((c < l) | (c > h)),
+        'negative_count': ((volume < 0) & (volume != NA)) | ((amount < 0) & (amount != NA))
+                          | ((transactions < 0) & (transactions != NA)),
+        'transactions_gt_volume': traded & (transactions != NA) & (transactions > volume),
+    }
+    # 成交均價（與價格同為定點數）
+    usable = priced & traded & (amount > 0) & (c > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vwap = np.where(usable, amount * float(PRICE_SCALE) / np.maximum(volume, 1), 0.0)
+        ratio = np.where(usable, vwap / np.maximum(c, 1), 1.0)
+    unit = usable & ((ratio > unit_ratio) | (ratio < 1 / unit_ratio))
+    result['unit_scale'] = unit
+    result['amount_mismatch'] = (
+        (usable & ~unit & ((vwap < l * (1 - tolerance)) | (vwap > h * (1 + tolerance))))
+        | ((volume == 0) & (amount > 0))
+    )
+    return result
+
+
+class History:
+    """
+    各股票最近的 {日期: (收盤價, 成交股數)}，供跨日檢查使用。
+    第一次遇到某股票時讀取磁碟上該月與前一個月的資料（月檔或歸檔），之後加入通過檢查的資料列。
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.archive = ArchiveManifest.load(root)
+        self.stocks = {}
+        self.loaded = set()     # 已讀取的 (代碼, 年月)
+
+    @staticmethod
+    def previous_month(year_month):
+        year, month = int(year_month[:4]), int(year_month[4:6])
+        return f"{year - 1}12" if month == 1 else f"{year}{month - 1:02d}"
+
+    def load(self, record):
+        code = record.stock_no
+        days = self.stocks.setdefault(code, {})
+        for year_month in (self.previous_month(record.year_month), record.year_month):
+            if (code, year_month) in self.loaded:
+                continue
+            self.loaded.add((code, year_month))
+            path = month_csv_path(self.root, code, record.stock_name, record.market_tag, year_month)
+            if os.path.exists(path):
+                with open(path, encoding='utf-8-sig', newline='') as f:
+                    rows = list(csv.reader(f))[1:]
+            elif self.archive.covers(code, year_month):
+                rows = self.archive.month_rows(code, year_month)
+            else:
+                continue
+            for r in rows:
+                parsed = parse_csv_row(r)
+                if parsed is not None:
+                    # (收盤價, 成交股數)
+                    days.setdefault(parsed[0], (parsed[4], parsed[7]))
+        return days
+
+    def add(self, record):
+        self.stocks.setdefault(record.stock_no, {})[record.date] = (record.close_price, record.volume_shares)
+
+    def check(self, records):
+        """
+        跨日檢查，回傳 {原因代碼: bool 陣列}。前一筆資料取自歷史與本批次中日期較早的資料列，
+        且必須在同月或前一個月（中間缺少資料時不比較）；除權息（X）日與前一日無成交時不比較漲跌。
+        """
+        n = len(records)
+        prev_close = np.full(n, NA, dtype=np.int64)
+        prev_volume = np.full(n, NA, dtype=np.int64)
+        by_code = {}
+        for i, r in enumerate(records):
+            by_code.setdefault(r.stock_no, []).append(i)
+        for code, idx in by_code.items():
+            days = dict(self.load(records[idx[0]]))
+            for i in idx:
+                r = records[i]
+                days.setdefault(r.date, (r.close_price, r.volume_shares))
+            dates = np.array(sorted(days), dtype=np.int64)
+            closes = np.array([NA if days[d][0] is None else days[d][0] for d in dates], dtype=np.int64)
+            volumes = np.array([NA if days[d][1] is None else days[d][1] for d in dates], dtype=np.int64)
+            rows = np.array(idx)
+            row_dates = np.array([records[i].date for i in idx], dtype=np.int64)
+            pos = np.searchsorted(dates, row_dates) - 1
+            has_prev = pos >= 0
+            pos = np.maximum(pos, 0)
+            prev_month = np.array([int(self.previous_month(str(d // 100))) for d in row_dates])
+            near = has_prev & (dates[pos] // 100 >= prev_month)
+            prev_close[rows[near]] = closes[pos[near]]
+            prev_volume[rows[near]] = volumes[pos[near]]
+
+        close = _column(records, 'close_price')
+        change = _column(records, 'change')
+        volume = _column(records, 'volume_shares')
+        ex_rights = np.array([r.ex_rights for r in records], dtype=bool)
+        comparable = (prev_close != NA) & (close != NA) & (change != NA) & ~ex_rights
+        both = (prev_volume > 0) & (volume > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            jump = np.where(both, volume / np.maximum(prev_volume, 1), 1.0)
+        return {
+            'change_mismatch': comparable & (close - change != prev_close),
+            'volume_jump': both & ((jump >= JUMP_RATIO) | (jump <= 1 / JUMP_RATIO)),
+        }